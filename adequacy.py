@@ -0,0 +1,332 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from instrumentation import timed
+
+# Bundled Census population tables (see README): 2010 Census population per ZIP (ZCTA) and
+# 2019 Census Bureau estimates per state. ZIP populations are scaled to the state estimates.
+ZIP_POPULATION_PATH = os.path.join(os.getcwd(), "zip_population.csv")
+STATE_POPULATION_PATH = os.path.join(os.getcwd(), "state_population.csv")
+ZIP_CENTROIDS_PATH = os.path.join(os.getcwd(), "zip_centroids.csv")
+
+# Distances (miles) for which the share of population near a provider of each specialty is precomputed
+ADEQUACY_DISTANCES_MILES = (10, 30, 60)
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+# -------------------- Population --------------------
+
+def load_population_table(conn):
+    """
+    (Re)create population_zip: one row per ZIP (zip5, st, county, lat, lon, population), with the 2010 ZIP
+    populations scaled so that every state adds up to its 2019 estimate. ZIPs without residents have population 0.
+    """
+    zips = pd.read_csv(ZIP_CENTROIDS_PATH, dtype={"zip": str})
+    zip_pop = pd.read_csv(ZIP_POPULATION_PATH, dtype={"zip": str})
+    state_pop = pd.read_csv(STATE_POPULATION_PATH).set_index("state")["population"]
+    df = zips.merge(zip_pop, on="zip", how="left")
+    df["population"] = df["population"].fillna(0)
+    scale = state_pop / df.groupby("state")["population"].sum()
+    df["population"] = df["population"] * df["state"].map(scale).fillna(1.0)
+    df = df.rename(columns={"zip": "zip5", "state": "st"})[["zip5", "st", "county", "lat", "lon", "population"]]
+    conn.execute("DROP TABLE IF EXISTS population_zip")
+    conn.execute("CREATE TABLE population_zip (zip5 TEXT PRIMARY KEY, st TEXT, county TEXT, lat REAL, lon REAL, population REAL)")
+    conn.executemany("INSERT INTO population_zip VALUES (?, ?, ?, ?, ?, ?)",
+                     df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+# -------------------- Distance --------------------
+
+def _haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def nearest_distance_miles(lat, lon, target_lat, target_lon, max_miles, chunk_size=4096):
+    """
+    Distance from each point to its nearest target, for targets within max_miles (np.inf beyond that).
+    Targets are bucketed into a grid of max_miles-sized cells, so each point is only compared with the
+    targets in its neighbouring cells (more cells east/west at high latitudes, where degrees of longitude shrink).
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    best = np.full(len(lat), np.inf)
+    if len(target_lat) == 0 or len(lat) == 0:
+        return best
+    cell = max_miles / MILES_PER_DEGREE_LAT
+    width = 1_000_000  # key stride between grid rows
+    target_lat, target_lon = np.asarray(target_lat, dtype=float), np.asarray(target_lon, dtype=float)
+    target_keys = (target_lat + 90) // cell * width + (target_lon + 180) // cell
+    order = np.argsort(target_keys, kind="stable")
+    target_keys, target_lat, target_lon = target_keys[order], target_lat[order], target_lon[order]
+
+    gy, gx = (lat + 90) // cell, (lon + 180) // cell
+    spans = np.ceil(1 / np.maximum(np.cos(np.radians(np.minimum(np.abs(lat) + cell, 89))), 1e-6)).astype(int)
+    for span in np.unique(spans):
+        for start in range(0, len(lat), chunk_size):
+            idx = np.arange(start, min(start + chunk_size, len(lat)))
+            idx = idx[spans[idx] == span]
+            if len(idx) == 0:
+                continue
+            for dy in (-1, 0, 1):
+                for dx in range(-span, span + 1):
+                    keys = (gy[idx] + dy) * width + gx[idx] + dx
+                    lo = np.searchsorted(target_keys, keys, side="left")
+                    counts = np.searchsorted(target_keys, keys, side="right") - lo
+                    if not counts.any():
+                        continue
+                    # Expand (point, target) candidate pairs for all non-empty cells at once
+                    point = np.repeat(idx, counts)
+                    target = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+                    d = _haversine(lat[point], lon[point], target_lat[target], target_lon[target])
+                    np.minimum.at(best, point, d)
+    best[best > max_miles] = np.inf
+    return best
+
+# -------------------- Rollups --------------------
+
+def _npi_column(conn):
+    columns = {row[1].lower(): row[1] for row in conn.execute("PRAGMA table_info(providers)")}
+    return columns.get("npi")
+
+# Rollup tables: name -> (column definitions, index columns)
+ROLLUP_TABLES = {
+    "adequacy_zip": ("zip5 TEXT, pri_spec TEXT, providers INTEGER", None),
+    "adequacy_county": ("st TEXT, county TEXT, pri_spec TEXT, providers INTEGER", "st, pri_spec"),
+    "adequacy_state": ("st TEXT, pri_spec TEXT, providers INTEGER", "pri_spec, st"),
+    "adequacy_population": ("st TEXT PRIMARY KEY, population REAL", None),
+    "adequacy_overlap": ("set_id INTEGER, st TEXT, pri_spec TEXT, providers INTEGER", "pri_spec, st"),
+    "adequacy_distance": ("pri_spec TEXT, st TEXT, miles REAL, covered_population REAL", "pri_spec, st"),
+    "adequacy_targets": ("pri_spec TEXT PRIMARY KEY, fingerprint TEXT", None),
+}
+
+def _targets_fingerprint(group, distances):
+    """Digest of a specialty's practice locations and the distances its coverage was computed for."""
+    points = group.sort_values(["lat", "lon"])[["lat", "lon"]].to_numpy(dtype=float)
+    return hashlib.sha256(points.tobytes() + repr(list(distances)).encode()).hexdigest()
+
+def _overlap_rollup(conn, npi):
+    """
+    adequacy_overlap rows: the providers practicing under several (state, specialty) pairs of the populated states,
+    counted per distinct set of pairs. Clinicians licensed in neighbouring states share a few sets, so the table
+    stays small however many providers there are.
+    """
+    columns = ["set_id", "st", "pri_spec", "providers"]
+    if not npi:
+        return pd.DataFrame(columns=columns)
+    pairs = pd.read_sql(f"""
+        SELECT DISTINCT providers."{npi}" AS npi, providers.st AS st, providers.pri_spec AS pri_spec
+        FROM providers WHERE providers.pri_spec IS NOT NULL
+          AND providers.st IN (SELECT st FROM population_zip GROUP BY st HAVING SUM(population) > 0)
+    """, conn)
+    pairs = pairs[pairs["npi"].duplicated(keep=False)].sort_values(["npi", "st", "pri_spec"])
+    sets = (pairs["st"] + "\x1f" + pairs["pri_spec"]).groupby(pairs["npi"]).agg("\x1e".join).value_counts()
+    rows = [(set_id, *pair.split("\x1f"), int(count))
+            for set_id, (key, count) in enumerate(sets.items()) for pair in key.split("\x1e")]
+    return pd.DataFrame(rows, columns=columns)
+
+def compute_adequacy_rollups(conn, distances=ADEQUACY_DISTANCES_MILES, reuse=False):
+    """
+    Compute the network-adequacy rollups from providers, locations and population_zip, with reads only:
+    {table: DataFrame} for write_adequacy_rollups.
+      adequacy_state     (st, pri_spec, providers)
+      adequacy_population (st, population): population of the states with population data
+      adequacy_county    (st, county, pri_spec, providers)
+      adequacy_zip       (zip5, pri_spec, providers)
+      adequacy_distance  (pri_spec, st, miles, covered_population): population within `miles` of a provider
+      adequacy_overlap   (set_id, st, pri_spec, providers): providers listed under more than one (state, specialty)
+                         of adequacy_state, grouped by that set of pairs (one row per pair; see total_providers)
+      adequacy_targets   (pri_spec, fingerprint): digest of the practice locations adequacy_distance was computed from
+    Providers are distinct NPIs (rows are clinician x enrollment x address). With reuse, specialties whose practice
+    locations are unchanged since the stored rollups keep their adequacy_distance rows instead of being recomputed.
+    """
+    npi = _npi_column(conn)
+    provider_count = f'COUNT(DISTINCT providers."{npi}")' if npi else "COUNT(*)"
+    rollups = {
+        "adequacy_zip": pd.read_sql(f"""
+            SELECT SUBSTR(providers.zip, 1, 5) AS zip5, providers.pri_spec AS pri_spec, {provider_count} AS providers
+            FROM providers WHERE providers.pri_spec IS NOT NULL
+            GROUP BY zip5, providers.pri_spec
+        """, conn),
+        "adequacy_county": pd.read_sql(f"""
+            SELECT population_zip.st AS st, population_zip.county AS county, providers.pri_spec AS pri_spec,
+                   {provider_count} AS providers
+            FROM providers JOIN population_zip ON population_zip.zip5 = SUBSTR(providers.zip, 1, 5)
+            WHERE providers.pri_spec IS NOT NULL AND population_zip.county IS NOT NULL
+            GROUP BY population_zip.st, population_zip.county, providers.pri_spec
+        """, conn),
+        "adequacy_state": pd.read_sql(f"""
+            SELECT providers.st AS st, providers.pri_spec AS pri_spec, {provider_count} AS providers
+            FROM providers WHERE providers.pri_spec IS NOT NULL
+            GROUP BY providers.st, providers.pri_spec
+        """, conn),
+        "adequacy_population": pd.read_sql("""
+            SELECT st, SUM(population) AS population FROM population_zip
+            WHERE st IS NOT NULL GROUP BY st HAVING SUM(population) > 0
+        """, conn),
+    }
+    rollups["adequacy_overlap"] = _overlap_rollup(conn, npi)
+
+    # Distance-based adequacy: for each specialty, the distance from every populated ZIP to the nearest
+    # practice location with a provider of that specialty, summed into covered population per state
+    population = pd.read_sql("SELECT st, lat, lon, population FROM population_zip "
+                             "WHERE population > 0 AND lat IS NOT NULL", conn)
+    targets = pd.read_sql("""
+        SELECT DISTINCT providers.pri_spec AS pri_spec, locations.lat AS lat, locations.lon AS lon
+        FROM providers JOIN locations ON locations.adrs_id = providers.adrs_id
+        WHERE providers.pri_spec IS NOT NULL AND locations.lat IS NOT NULL
+    """, conn)
+    previous, previous_rows = {}, {}
+    if reuse and _has_table(conn, "adequacy_targets") and _has_table(conn, "adequacy_distance"):
+        previous = dict(conn.execute("SELECT pri_spec, fingerprint FROM adequacy_targets"))
+        previous_rows = dict(list(pd.read_sql("SELECT * FROM adequacy_distance", conn).groupby("pri_spec")))
+    frames, fingerprints = [], []
+    for spec, group in targets.groupby("pri_spec"):
+        fingerprint = _targets_fingerprint(group, distances)
+        fingerprints.append((spec, fingerprint))
+        if previous.get(spec) == fingerprint:
+            frames.append(previous_rows.get(spec))
+            continue
+        nearest = nearest_distance_miles(population["lat"], population["lon"], group["lat"], group["lon"], max(distances))
+        rows = []
+        for miles in distances:
+            covered = population["population"].where(nearest <= miles, 0).groupby(population["st"]).sum()
+            rows += [(spec, st, miles, float(value)) for st, value in covered.items() if value > 0]
+        frames.append(pd.DataFrame(rows, columns=["pri_spec", "st", "miles", "covered_population"]))
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    rollups["adequacy_distance"] = (pd.concat(frames, ignore_index=True) if frames else
+                                    pd.DataFrame(columns=["pri_spec", "st", "miles", "covered_population"]))
+    rollups["adequacy_targets"] = pd.DataFrame(fingerprints, columns=["pri_spec", "fingerprint"])
+    return rollups
+
+def write_adequacy_rollups(conn, rollups):
+    """Replace the rollup tables with computed ones (runs inside the caller's transaction)."""
+    for table, (columns, index) in ROLLUP_TABLES.items():
+        frame = rollups[table]
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"CREATE TABLE {table} ({columns})")
+        conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * frame.shape[1])})",
+                         frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+        if index:
+            conn.execute(f"CREATE INDEX idx_{table} ON {table}({index})")
+
+def create_adequacy_rollups(conn, distances=ADEQUACY_DISTANCES_MILES):
+    """(Re)build population_zip and every adequacy rollup from scratch, inside the caller's transaction."""
+    load_population_table(conn)
+    write_adequacy_rollups(conn, compute_adequacy_rollups(conn, distances))
+
+def refresh_adequacy_rollups(conn, distances=ADEQUACY_DISTANCES_MILES, finish=None):
+    """
+    Bring the rollups up to date after a committed refresh. They are computed from the committed tables with
+    reads only (recomputing distance coverage just for specialties whose practice locations changed), and the
+    write transaction only swaps the finished tables in, so the write lock is held for the inserts alone.
+    Readers see the previous rollups until then. finish(conn) runs in the same transaction, just before commit.
+    """
+    if not _has_table(conn, "population_zip"):
+        load_population_table(conn)
+        conn.commit()
+    rollups = compute_adequacy_rollups(conn, distances, reuse=True)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        write_adequacy_rollups(conn, rollups)
+        if finish is not None:
+            finish(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# -------------------- Queries --------------------
+
+def has_rollups(conn):
+    row = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('adequacy_state', "
+                       "'adequacy_population', 'adequacy_county', 'adequacy_distance', 'adequacy_overlap', "
+                       "'population_zip')").fetchone()
+    return row[0] == 6
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [name]).fetchone() is not None
+
+def _in_clause(column, values):
+    if not values:
+        return "", []
+    return f" AND {column} IN ({', '.join('?' * len(values))})", list(values)
+
+@timed("state_adequacy", rows=len)
+def state_adequacy(conn, specialties=None, states=None):
+    """
+    Providers, population and providers per 100k for each selected state (all states if none),
+    counting providers of the selected specialties (all if none). Reads only the rollup tables.
+    """
+    spec_sql, spec_params = _in_clause("pri_spec", specialties)
+    state_sql, state_params = _in_clause("adequacy_population.st", states)
+    sql = f"""
+        SELECT adequacy_population.st AS state, COALESCE(p.providers, 0) AS providers, adequacy_population.population AS population
+        FROM adequacy_population
+        LEFT JOIN (SELECT st, SUM(providers) AS providers FROM adequacy_state WHERE 1 = 1{spec_sql} GROUP BY st) AS p
+            ON p.st = adequacy_population.st
+        WHERE 1 = 1{state_sql}
+        ORDER BY adequacy_population.st
+    """
+    df = pd.read_sql(sql, conn, params=spec_params + state_params)
+    df["per_100k"] = df["providers"] / df["population"] * 100_000
+    return df
+
+@timed("total_providers")
+def total_providers(conn, specialties=None, states=None):
+    """
+    Distinct providers (NPIs) of the selected specialties in the selected states (all states with population
+    data if none), the total for state_adequacy's rows. Reads only the rollup tables: the adequacy_state counts of
+    the selected pairs, less the providers adequacy_overlap lists under more than one of them (a clinician
+    practicing in several states would otherwise be counted once for each).
+    """
+    spec_sql, spec_params = _in_clause("pri_spec", specialties)
+    state_sql, state_params = _in_clause("st", states)
+    scope = f"st IN (SELECT st FROM adequacy_population){spec_sql}{state_sql}"
+    params = spec_params + state_params
+    listed = conn.execute(f"SELECT IFNULL(SUM(providers), 0) FROM adequacy_state WHERE {scope}", params).fetchone()[0]
+    repeated = conn.execute(f"""
+        SELECT IFNULL(SUM(providers * (pairs - 1)), 0)
+        FROM (SELECT MAX(providers) AS providers, COUNT(*) AS pairs FROM adequacy_overlap WHERE {scope} GROUP BY set_id)
+    """, params).fetchone()[0]
+    return listed - repeated
+
+@timed("county_adequacy", rows=len)
+def county_adequacy(conn, specialties=None, states=None):
+    """Providers, population and providers per 100k per county of the selected states, lowest ratio first."""
+    spec_sql, spec_params = _in_clause("pri_spec", specialties)
+    state_sql, state_params = _in_clause("population_zip.st", states)
+    sql = f"""
+        SELECT population_zip.st AS state, population_zip.county AS county,
+               COALESCE(p.providers, 0) AS providers, SUM(population_zip.population) AS population
+        FROM population_zip
+        LEFT JOIN (SELECT st, county, SUM(providers) AS providers FROM adequacy_county WHERE 1 = 1{spec_sql}
+                   GROUP BY st, county) AS p
+            ON p.st = population_zip.st AND p.county = population_zip.county
+        WHERE population_zip.county IS NOT NULL{state_sql}
+        GROUP BY population_zip.st, population_zip.county
+        HAVING SUM(population_zip.population) > 0
+    """
+    df = pd.read_sql(sql, conn, params=spec_params + state_params)
+    df["per_100k"] = df["providers"] / df["population"] * 100_000
+    return df.sort_values(["per_100k", "population"], ascending=[True, False]).reset_index(drop=True)
+
+@timed("distance_adequacy", rows=len)
+def distance_adequacy(conn, specialties, states=None):
+    """
+    Share of the population of the selected states (all if none) living within each precomputed distance of at
+    least one provider, per selected specialty. Returns one row per specialty and one column per distance.
+    """
+    state_sql, state_params = _in_clause("st", states)
+    population = conn.execute(f"SELECT SUM(population) FROM population_zip WHERE 1 = 1{state_sql}",
+                              state_params).fetchone()[0] or 0
+    spec_sql, spec_params = _in_clause("pri_spec", specialties)
+    covered = pd.read_sql(
+        f"SELECT pri_spec, miles, SUM(covered_population) AS covered FROM adequacy_distance "
+        f"WHERE 1 = 1{spec_sql}{state_sql} GROUP BY pri_spec, miles", conn, params=spec_params + state_params)
+    table = covered.pivot(index="pri_spec", columns="miles", values="covered").reindex(list(specialties))
+    table = table.reindex(columns=sorted(set(covered["miles"]) | set(ADEQUACY_DISTANCES_MILES))).fillna(0)
+    if population:
+        table = table / population
+    table.columns = [f"Within {miles:g} mi" for miles in table.columns]
+    return table
@@ -0,0 +1,387 @@
+import os
+import re
+import json
+import queue
+import base64
+import sqlite3
+import argparse
+import functools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import provider_query as pq
+import pagination
+import adequacy
+import instrumentation
+import networks
+from geocoding import geocode_address
+
+# Connections per worker process; requests beyond this wait up to POOL_TIMEOUT seconds for one to free up
+POOL_SIZE = 8
+POOL_TIMEOUT = 10.0
+
+# Prepared statements kept per connection (the query layer builds a handful of SQL shapes per filter combination)
+STATEMENT_CACHE_SIZE = 512
+
+# Per-connection page cache (KiB, as a negative cache_size) and the memory-mapped window shared through the OS
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+MAX_PAGE_SIZE = 200
+
+# Rows per keyset page while streaming a full result as NDJSON
+EXPORT_PAGE_SIZE = 1000
+
+# Bookkeeping columns written by db_setup.py that are not part of a provider record
+HIDDEN_COLUMNS = ["row_key", "row_hash", "row_seq"]
+
+# The zip filter: a ZIP prefix of 1-5 digits, or a full ZIP+4 (the +4 is ignored)
+ZIP_PATTERN = re.compile(r"\d{1,5}|\d{5}-?\d{4}")
+
+# -------------------- Connection Pool --------------------
+
+class PoolTimeout(Exception):
+    pass
+
+def open_connection(db_path, cached_statements=STATEMENT_CACHE_SIZE):
+    """Read-only connection (provider_query.connect) tuned for serving: query_only, larger page cache, mmap reads."""
+    conn = pq.connect(db_path, cached_statements=cached_statements)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return conn
+
+class ConnectionPool:
+    """
+    Fixed set of read-only connections handed out to one thread at a time. db_setup.py leaves the database in
+    WAL mode, so pooled readers never block on (or block) a refresh and each query sees the last committed load.
+    Idle connections are reused most recent first, which keeps their page caches and prepared statements warm.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._closed = threading.Event()
+        for _ in range(size):
+            self._idle.put(open_connection(db_path))
+        conn = self._idle.get()
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self._idle.put(conn)
+        if mode.lower() != "wal":
+            print(f"Warning: {db_path} is in {mode} journal mode; readers will block while it is being written. "
+                  "Rebuild it with db_setup.py to switch to WAL.")
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty as exc:
+            raise PoolTimeout(f"No database connection free after {self.timeout:g}s") from exc
+        try:
+            yield conn
+        finally:
+            if self._closed.is_set():
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn(conn, *args, **kwargs) on a pooled connection (blocking; run it off the event loop)."""
+        with self.connection() as conn:
+            return fn(conn, *args, **kwargs)
+
+    def idle(self):
+        return self._idle.qsize()
+
+    def close(self):
+        self._closed.set()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+async def run_query(request, fn, *args, **kwargs):
+    """Run a query-layer function on a pooled connection in the thread pool, keeping the event loop free."""
+    try:
+        return await run_in_threadpool(request.app.state.pool.run, fn, *args, **kwargs)
+    except PoolTimeout as exc:
+        raise HTTPException(503, str(exc)) from exc
+
+# -------------------- Request Parsing --------------------
+
+def _float_param(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise HTTPException(400, f"'{name}' must be a number") from exc
+
+def parse_filters(params, require_center=False):
+    """
+    Query-string parameters -> provider_query.build_query filters: q, specialty, secondary_specialty, grouping,
+    state, credential, telehealth, assignment, network (ids from /networks; all repeatable), zip and phone
+    (prefixes), and radius (miles) around lat/lon or a geocoded location ("10001", "Boston, MA").
+    """
+    network_ids = params.getlist("network")
+    if not all(network.isdigit() for network in network_ids):
+        raise HTTPException(400, "'network' must be a network id (see /networks)")
+    if params.get("zip") and not ZIP_PATTERN.fullmatch(params["zip"].strip()):
+        raise HTTPException(400, "'zip' must be a ZIP code or its first digits (e.g. 02118, 021, 02118-1234)")
+    if params.get("phone") and not re.search(r"\d", params["phone"]):
+        raise HTTPException(400, "'phone' must contain digits")
+    filters = {
+        "search_query": params.get("q"),
+        "specialties": params.getlist("specialty"),
+        "groupings": params.getlist("grouping"),
+        "states": [state.upper() for state in params.getlist("state")],
+        "secondary_specialties": params.getlist("secondary_specialty"),
+        "credentials": params.getlist("credential"),
+        "telehealth": params.getlist("telehealth"),
+        "assignment": params.getlist("assignment"),
+        "zip_code": params.get("zip"),
+        "phone": params.get("phone"),
+        "networks": [int(network) for network in network_ids],
+    }
+    radius = _float_param(params, "radius")
+    lat, lon = _float_param(params, "lat"), _float_param(params, "lon")
+    if lat is None and lon is None and params.get("location"):
+        lat, lon = geocode_address(params["location"])
+        if lat is None:
+            raise HTTPException(400, f"Could not geocode location '{params['location']}'")
+    if (lat is None) != (lon is None):
+        raise HTTPException(400, "'lat' and 'lon' must be given together")
+    if require_center and (lat is None or not radius or radius <= 0):
+        raise HTTPException(400, "A radius search needs 'radius' > 0 and either 'lat'/'lon' or 'location'")
+    if lat is not None and radius and radius > 0:
+        filters["center"] = (lat, lon)
+        filters["radius"] = radius
+    filters = {name: value for name, value in filters.items() if value}
+    instrumentation.label(filter_type=instrumentation.filter_type(filters))
+    return filters
+
+def parse_page_size(params, default=pagination.PAGE_SIZE):
+    try:
+        size = int(params.get("limit", default))
+    except ValueError as exc:
+        raise HTTPException(400, "'limit' must be an integer") from exc
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+def encode_cursor(mode, key):
+    payload = json.dumps([mode, list(key)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Opaque cursor from a previous page -> pagination cursor tuple ("after"/"before", sort key)."""
+    try:
+        mode, key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if mode not in ("after", "before") or not isinstance(key, list) or not key:
+            raise ValueError
+        return mode, tuple(key)
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(400, "Invalid cursor") from exc
+
+def frame_records(df):
+    """DataFrame rows as JSON-ready dicts (NaN -> null) without the loader's bookkeeping columns."""
+    df = df.drop(columns=[col for col in HIDDEN_COLUMNS if col in df.columns])
+    return json.loads(df.to_json(orient="records"))
+
+def public_records(records):
+    """Drop the loader's bookkeeping columns from pagination.fetch_keyset_records rows (in place)."""
+    for record in records:
+        for col in HIDDEN_COLUMNS:
+            record.pop(col, None)
+    return records
+
+# -------------------- Provider Endpoints --------------------
+
+def check_networks(conn, filters):
+    """400 for network ids that /networks doesn't list (e.g. any id before Plan-Net memberships are loaded)."""
+    unknown = networks.unknown_networks(conn, filters.get("networks", []))
+    if unknown:
+        raise HTTPException(400, f"Unknown network id {unknown[0]} (see /networks)")
+
+def _search_page(conn, cursor, page_size, filters):
+    check_networks(conn, filters)
+    count = pagination.approximate_count(conn, **filters) if cursor == pagination.FIRST else None
+    try:
+        page = pagination.fetch_keyset_records(conn, cursor, page_size, **filters)
+    except (ValueError, sqlite3.ProgrammingError) as exc:
+        # A cursor carries one sort-key value per sort column, so one from a differently filtered search doesn't fit
+        raise HTTPException(400, "Cursor does not match these filters") from exc
+    return count, page
+
+async def _page_response(request, filters):
+    params = request.query_params
+    cursor = decode_cursor(params["cursor"]) if params.get("cursor") else pagination.FIRST
+    count, page = await run_query(request, _search_page, cursor, parse_page_size(params), filters)
+    body = {
+        "next_cursor": encode_cursor("after", page.last_key) if page.has_next else None,
+        "prev_cursor": encode_cursor("before", page.first_key) if page.has_prev else None,
+        "providers": public_records(page.rows),
+    }
+    if count is not None:
+        # Counting stops past pagination.COUNT_LIMIT, like the app's "10,000+"
+        body = {"count": min(count, pagination.COUNT_LIMIT), "count_exact": count <= pagination.COUNT_LIMIT, **body}
+    return JSONResponse(body)
+
+async def search_providers(request):
+    """GET /providers: one page of matching providers in sort-key order, with cursors for the next/previous page."""
+    return await _page_response(request, parse_filters(request.query_params))
+
+async def providers_near(request):
+    """GET /providers/near: like /providers, but a center and radius are required and rows are ordered by distance."""
+    return await _page_response(request, parse_filters(request.query_params, require_center=True))
+
+async def export_providers(request):
+    """
+    GET /providers/export: every matching provider as NDJSON, one record per line. The result is read as a
+    series of keyset pages, each on whatever pooled connection is free, so a long export never pins a connection.
+    """
+    filters = parse_filters(request.query_params)
+    # The request's trace ends when the response starts, so it only covers this setup; the rows are read while
+    # the body streams, under their own "api:export_providers:stream" trace
+    instrumentation.label(phase="setup")
+    kind = instrumentation.filter_type(filters)
+    await run_query(request, check_networks, filters)
+
+    async def lines():
+        with instrumentation.trace("api:export_providers:stream", filter_type=kind, phase="stream"):
+            cursor = pagination.FIRST
+            while True:
+                page = await run_query(request, pagination.fetch_keyset_records, cursor, EXPORT_PAGE_SIZE, **filters)
+                if page.rows:
+                    yield "".join(json.dumps(record) + "\n" for record in public_records(page.rows))
+                if not page.has_next:
+                    return
+                cursor = ("after", page.last_key)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def provider_by_npi(request):
+    """GET /providers/{npi}: every row (practice location) recorded for an NPI."""
+    npi = request.path_params["npi"]
+    if not npi.isdigit() or len(npi) != 10:
+        raise HTTPException(400, "An NPI is 10 digits")
+    rows = await run_query(request, pq.fetch_providers_by_npi, npi)
+    if rows.empty:
+        raise HTTPException(404, f"No provider with NPI {npi}")
+    return JSONResponse({"npi": npi, "providers": frame_records(rows)})
+
+async def list_networks(request):
+    """GET /networks: the Plan-Net networks providers can be filtered by, as {id, name} pairs."""
+    options = await run_query(request, networks.network_options)
+    return JSONResponse({"networks": [{"id": network_id, "name": label} for network_id, label in options]})
+
+# -------------------- Adequacy Endpoints --------------------
+
+def _adequacy(conn, level, specialties, states):
+    if not adequacy.has_rollups(conn):
+        raise HTTPException(503, "Network-adequacy rollups have not been built (run db_setup.py)")
+    if level == "state":
+        return adequacy.state_adequacy(conn, specialties, states), adequacy.total_providers(conn, specialties, states)
+    if level == "county":
+        return adequacy.county_adequacy(conn, specialties, states), None
+    table = adequacy.distance_adequacy(conn, specialties, states)
+    return table.rename_axis("specialty").reset_index(), None
+
+async def network_adequacy(request):
+    """
+    GET /adequacy/{level}: providers per 100k population by state or county, or (level "distance") the share of
+    the population within each precomputed distance of a provider of every requested specialty.
+    """
+    level = request.path_params["level"]
+    if level not in ("state", "county", "distance"):
+        raise HTTPException(404, f"Unknown adequacy level '{level}'")
+    params = request.query_params
+    specialties, states = params.getlist("specialty"), [state.upper() for state in params.getlist("state")]
+    instrumentation.label(filter_type=instrumentation.filter_type({"specialties": specialties, "states": states}))
+    if level == "distance" and not specialties:
+        raise HTTPException(400, "Distance adequacy needs at least one 'specialty'")
+    table, total = await run_query(request, _adequacy, level, specialties, states)
+    body = {"level": level, "rows": json.loads(table.to_json(orient="records"))}
+    if total is not None:
+        # Distinct providers over all the rows (a clinician in several states appears in each state's row)
+        body["total_providers"] = total
+    return JSONResponse(body)
+
+async def metrics(_request):
+    """GET /metrics: p50/p95 latency per endpoint, stage and filter type for this worker, in Prometheus text format."""
+    return PlainTextResponse(instrumentation.METRICS.prometheus(), media_type="text/plain; version=0.0.4")
+
+async def health(request):
+    manifest_id = await run_query(request, pq.load_manifest_id)
+    pool = request.app.state.pool
+    return JSONResponse({"status": "ok", "manifest_id": manifest_id, "pool_size": pool.size, "pool_idle": pool.idle()})
+
+# -------------------- Application --------------------
+
+def traced(handler):
+    """Record each request as an "api:<handler>" trace; the query functions it calls add their spans."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        with instrumentation.trace(f"api:{handler.__name__}"):
+            return await handler(request)
+    return wrapper
+
+async def http_error(_request, exc):
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+def create_app(db_path=None, pool_size=None):
+    """
+    Build the API. The pool is opened when the app starts, so every worker process of a process manager
+    (uvicorn --workers, gunicorn) gets connections of its own. Settings default to the environment
+    (PROVIDER_API_DB, PROVIDER_API_POOL_SIZE), which is how main() hands them to worker processes.
+    """
+    db_path = db_path or os.environ.get("PROVIDER_API_DB", pq.DB_PATH)
+    pool_size = pool_size or int(os.environ.get("PROVIDER_API_POOL_SIZE", POOL_SIZE))
+
+    @asynccontextmanager
+    async def lifespan(starlette_app):
+        starlette_app.state.pool = ConnectionPool(db_path, pool_size)
+        try:
+            yield
+        finally:
+            starlette_app.state.pool.close()
+
+    routes = [
+        Route("/health", health),
+        Route("/metrics", metrics),
+        Route("/providers", traced(search_providers)),
+        # Fixed paths before /providers/{npi}, which would otherwise match them
+        Route("/providers/near", traced(providers_near)),
+        Route("/providers/export", traced(export_providers)),
+        Route("/providers/{npi}", traced(provider_by_npi)),
+        Route("/networks", traced(list_networks)),
+        Route("/adequacy/{level}", traced(network_adequacy)),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan, exception_handlers={HTTPException: http_error})
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the provider database as a read-only HTTP/JSON API.")
+    parser.add_argument("--db", default=pq.DB_PATH, help="Path of the SQLite database built by db_setup.py")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (e.g. one per core)")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="Database connections per worker")
+    args = parser.parse_args()
+
+    os.environ["PROVIDER_API_DB"] = os.path.abspath(args.db)
+    os.environ["PROVIDER_API_POOL_SIZE"] = str(args.pool_size)
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import subprocess
+import datetime
+import numpy as np
+import pandas as pd
+
+import db_setup
+import data_loader
+import provider_query as pq
+import pagination
+from snapshot import write_snapshot, load_snapshot
+from synthetic_data import generate_csv
+
+BENCH_DIR = os.path.join(os.getcwd(), "benchmark_data")         # Generated CSVs and databases (reused across runs)
+RESULTS_DIR = os.path.join(os.getcwd(), "benchmark_results")    # One JSON file per run
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 3_000_000]
+REGRESSION_THRESHOLD = 1.2  # Flag stages that got more than 20% slower than the baseline...
+REGRESSION_MIN_SECONDS = 0.001  # ...and by more than a millisecond, so sub-millisecond noise isn't flagged
+
+# -------------------- Timing --------------------
+
+def timed(fn, repeat=1):
+    """Run fn `repeat` times; returns (last result, list of wall-clock seconds)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+def record(results, rows, stage, times, **extra):
+    entry = {"rows": rows, "stage": stage, "median_s": float(np.median(times)), "min_s": float(min(times)),
+             "runs": len(times), **extra}
+    results.append(entry)
+    print(f"  {stage:<28} median {entry['median_s'] * 1000:10.1f} ms  min {entry['min_s'] * 1000:10.1f} ms")
+
+# -------------------- Benchmark Stages --------------------
+
+def filter_cases(conn):
+    """Representative sidebar filters (one per filter path in main.py), derived from the loaded data."""
+    top_spec = conn.execute("SELECT pri_spec FROM providers GROUP BY pri_spec ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    top_state = conn.execute("SELECT st FROM providers GROUP BY st ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    lat, lon = conn.execute("SELECT lat, lon FROM locations JOIN providers USING (adrs_id) WHERE lat IS NOT NULL "
+                            "GROUP BY providers.zip ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    return {
+        "text": {"search_query": "smith card"},
+        "specialty": {"specialties": [top_spec]},
+        "state": {"states": [top_state]},
+        "radius": {"center": (lat, lon), "radius": 25},
+    }
+
+def bench_queries(results, rows, db_path, snapshot_dir, repeat):
+    conn = pq.connect(db_path)
+    try:
+        cases = filter_cases(conn)
+        for name, filters in cases.items():
+            count, times = timed(lambda: pagination.approximate_count(conn, **filters), repeat)
+            record(results, rows, f"count:{name}", times, matches=count)
+            # The cached match result main.py computes once per filter signature, then its first page
+            result, times = timed(lambda: pagination.sql_result(conn, **filters), repeat)
+            record(results, rows, f"result:{name}", times, cached_rowids=result.rowids is not None)
+            _, times = timed(lambda: pagination.result_page(conn, result, **filters), repeat)
+            record(results, rows, f"page:{name}", times)
+            # The API (and results too large to cache) page with keyset queries
+            _, times = timed(lambda: pagination.fetch_keyset_page(conn, **filters), repeat)
+            record(results, rows, f"keyset:{name}", times)
+
+        # Pagination render: the last page of the cached result, formatted for st.table as main.py does
+        filters = cases["specialty"]
+        result = pagination.sql_result(conn, **filters)
+        render = lambda: pq.format_provider_table(pagination.result_page(conn, result, pagination.LAST, **filters).rows)
+        _, times = timed(render, repeat)
+        record(results, rows, "render:last_page", times)
+
+        # Keyset pagination as main.py pages: the next page after page 1, and a jump deep into the alphabet
+        first = pagination.fetch_keyset_page(conn, **filters)
+        _, times = timed(lambda: pagination.fetch_keyset_page(conn, ("after", first.last_key), **filters), repeat)
+        record(results, rows, "keyset:next", times)
+        _, times = timed(lambda: pagination.fetch_keyset_page(conn, ("letter", "W"), **filters), repeat)
+        record(results, rows, "keyset:letter", times)
+
+        # Snapshot path main.py takes for specialty/state-only filters
+        snap = load_snapshot(snapshot_dir)
+        mask = lambda: np.flatnonzero(snap.isin_mask("pri_spec", filters["specialties"])
+                                      & snap.isin_mask("st", cases["state"]["states"]))
+        _, times = timed(mask, repeat)
+        record(results, rows, "snapshot:specialty+state", times)
+        # Building the cached match result (row ids in sort order) from the snapshot, and a page of it with the
+        # snapshot's precomputed names
+        result, times = timed(lambda: pagination.snapshot_result(snap, **filters), repeat)
+        record(results, rows, "result:snapshot", times)
+        _, times = timed(lambda: pagination.result_page(conn, result, snap=snap, **filters), repeat)
+        record(results, rows, "page:snapshot", times)
+    finally:
+        conn.close()
+
+def bench_size(rows, repeat, workers, skip_loader):
+    """Generate (or reuse) a CSV of `rows` rows, then time ingest, loading and every filter path."""
+    results = []
+    csv_path = os.path.join(BENCH_DIR, f"synthetic_{rows}.csv")
+    db_path = os.path.join(BENCH_DIR, f"providers_{rows}.db")
+    snapshot_dir = os.path.join(BENCH_DIR, f"snapshot_{rows}")
+    if not os.path.exists(csv_path):
+        print(f"Generating {rows:,} synthetic rows...")
+        generate_csv(csv_path, rows)
+
+    print(f"Benchmarking {rows:,} rows")
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    _, times = timed(lambda: db_setup.build_database(csv_path, db_path))
+    record(results, rows, "db_setup:build_database", times)
+    _, times = timed(lambda: write_snapshot(db_path, snapshot_dir))
+    record(results, rows, "db_setup:write_snapshot", times)
+    if not skip_loader:
+        _, times = timed(lambda: data_loader.load_physician_compare_data(workers=workers, csv_path=csv_path))
+        record(results, rows, "data_loader:load", times, workers=workers)
+    bench_queries(results, rows, db_path, snapshot_dir, repeat)
+    return results
+
+# -------------------- Reporting --------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    """Print the ratio of each stage's median to the baseline run's and flag regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r["rows"], r["stage"]): r["median_s"] for r in json.load(f)["results"]}
+    print(f"Comparison with {baseline_path}:")
+    for r in results:
+        before = baseline.get((r["rows"], r["stage"]))
+        if not before:
+            continue
+        ratio = r["median_s"] / before
+        regressed = ratio > REGRESSION_THRESHOLD and r["median_s"] - before > REGRESSION_MIN_SECONDS
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {r['rows']:>9,} {r['stage']:<28} {ratio:5.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, loading and filtering on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Dataset sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query benchmark")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for data_loader")
+    parser.add_argument("--skip-loader", action="store_true", help="Skip the data_loader.py benchmark")
+    parser.add_argument("--output", default=None, help="Results JSON path (default: benchmark_results/<time>_<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    results = []
+    for rows in args.sizes:
+        results.extend(bench_size(rows, args.repeat, args.workers, args.skip_loader))
+
+    commit = git_commit()
+    run = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{commit or 'nogit'}.json")
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
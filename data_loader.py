@@ -1,74 +1,53 @@
 import os
 import time
 import csv
+import argparse
+from collections import deque
 import pandas as pd
 import sqlite3
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from geocoding import geocode_zip_column, geocode_address_column, GEOCODE_BACKENDS
+from schema import apply_schema, memory_usage_mb, memory_report
+from normalization import (split_zip_column, normalize_state_column, normalize_phone_column, npi_valid_column,
+                           join_present)
+from instrumentation import span, trace
+from enrichment import (fetch_nppes, fetch_plan_net, NPPES_API_URL, NPPES_COLUMNS, PLAN_NET_COLUMNS,
+                        ENRICHMENT_CACHE_DIR, DEFAULT_TTL_DAYS)
+from networks import create_network_tables, save_memberships, MEMBERSHIPS_CSV_PATH
 
-# Import geopy for geocoding (currently not used due to commenting out)
-try:
-    from geopy.geocoders import Nominatim
-    geolocator = Nominatim(user_agent="physician_compare_geocoder", timeout=10)
-except ImportError:
-    geolocator = None
+# Rows per chunk handed to each worker process by the parallel pipeline
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Plan-Net FHIR endpoints queried for insurance networks, {payer name: base URL}; more can be added with --plan-net
+PLAN_NET_ENDPOINTS = {
+    # "YourPayerName": "https://payer-api.com/fhir/",
+}
 
 # -------------------- Utility Functions --------------------
 
-def normalize_phone(phone: str) -> str:
-    """Normalize phone numbers to the format (xxx) xxx-xxxx."""
-    if not phone or pd.isna(phone):
-        return None
-    digits = "".join(filter(str.isdigit, str(phone)))
-    if len(digits) == 10:
-        return f"({digits[0:3]}) {digits[3:6]}-{digits[6:10]}"
-    if len(digits) == 11 and digits.startswith("1"):
-        return f"({digits[1:4]}) {digits[4:7]}-{digits[7:11]}"
-    return digits if digits else None
-
-def format_address(line1: str, line2: str, city: str, state: str, zip_code: str, line2_suppression: str = None) -> str:
-    """Combine address parts into a single string for geocoding."""
-    parts = []
-    if line1 and not pd.isna(line1):
-        parts.append(str(line1).strip())
-    if line2 and not pd.isna(line2):
-        if line2_suppression and str(line2_suppression).strip().upper() == 'Y':
-            pass
-        else:
-            parts.append(str(line2).strip())
-    if city and not pd.isna(city):
-        parts.append(str(city).strip())
-    if state and not pd.isna(state):
-        parts.append(str(state).strip())
-    if zip_code and not pd.isna(zip_code):
-        parts.append(str(zip_code).strip())
-    return ", ".join(parts)
-
-# -------------------- Geocoding Functions --------------------
-# The following geocoding function and related code have been commented out to avoid
-# API rate limits and connection timeouts. The latitude and longitude fields will be set to None.
-
-# def geocode_address(address: str):
-#     """
-#     Geocode a full address string using Nominatim.
-#     Returns a tuple (address, latitude, longitude). If unsuccessful, returns (address, None, None).
-#     """
-#     if geolocator is None:
-#         return address, None, None
-#     try:
-#         location = geolocator.geocode(address)
-#         if location:
-#             return address, location.latitude, location.longitude
-#     except Exception as e:
-#         print(f"Error geocoding '{address}': {e}")
-#     time.sleep(1)  # Increase delay to respect rate limits
-#     return address, None, None
+def format_address_column(df: pd.DataFrame) -> pd.Series:
+    """Address parts of each row joined with ", " for geocoding (blank parts and suppressed second lines skipped)."""
+    def part(col):
+        if col not in df.columns:
+            empty = pd.Series("", index=df.index, dtype=object)
+            return empty, empty != ""
+        raw = df[col].astype(object).where(df[col].notna(), "").astype(str)
+        return raw.str.strip(), raw != ""
+
+    line2, has_line2 = part("address_line_2")
+    suppression, _ = part("address_line_2_suppression")
+    has_line2 = has_line2 & (suppression.str.upper() != "Y")
+    parts = [part("address_line_1"), (line2, has_line2), part("city"), part("state"), part("zip_code")]
+    return join_present(parts, ", ", df.index)
 
 # -------------------- Data Loading Function --------------------
 
-def load_physician_compare_data():
-    LOCAL_CSV_PATH = os.path.join(os.getcwd(), "Physician_Compare_National_Download.csv")
-    df = pd.read_csv(LOCAL_CSV_PATH, dtype=str)
-    
+def preprocess_physician_compare(df, keep_address=False):
+    """
+    Row-local preprocessing of Physician Compare rows: rename, strip, normalize phones and attach coordinates.
+    Works the same on the whole file or on any row range of it, which is what lets the pipeline run in parallel.
+    keep_address keeps the full_address column for street-level geocoding afterwards.
+    """
     # Rename columns for consistency
     df = df.rename(columns={
         "NPI": "npi",
@@ -101,84 +80,185 @@ def load_physician_compare_data():
     })
     
     # Strip whitespace from all string values
-    df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    for col in df.columns:
+        df[col] = df[col].str.strip()
     
-    # Normalize phone numbers
+    # Normalize keys and contact fields column-wise (normalization.py): 10-digit phones, ZIP5 + ZIP4,
+    # validated state codes and a Luhn check of every NPI
     if "phone_number" in df.columns:
-        df["phone_number"] = df["phone_number"].apply(normalize_phone)
+        df["phone_number"] = normalize_phone_column(df["phone_number"])
+    if "zip_code" in df.columns:
+        df["zip_code"], df["zip4"] = split_zip_column(df["zip_code"])
+    if "state" in df.columns:
+        df["state"] = normalize_state_column(df["state"])
+    if "npi" in df.columns:
+        df["npi_valid"] = npi_valid_column(df["npi"]).astype("Int8")
     
     # Generate a full address string for geocoding
-    df["full_address"] = df.apply(lambda row: format_address(
-        row.get("address_line_1"),
-        row.get("address_line_2"),
-        row.get("city"),
-        row.get("state"),
-        row.get("zip_code"),
-        row.get("address_line_2_suppression")
-    ), axis=1)
+    df["full_address"] = format_address_column(df)
     
-    # The following geocoding steps are commented out.
-    # They would normally:
-    # 1. Determine unique addresses to geocode.
-    # 2. Load a cache of previously geocoded addresses.
-    # 3. Parallelize geocoding for new addresses.
-    # 4. Map geocoded coordinates back to the DataFrame.
+    # Coordinates come from the bundled ZIP centroid table (offline, no API calls);
+    # street-level geocoding of full_address happens once over the merged frame (see load_physician_compare_data)
+    if "zip_code" in df.columns:
+        df["latitude"], df["longitude"] = geocode_zip_column(df["zip_code"])
+    else:
+        df["latitude"] = None
+        df["longitude"] = None
     
-    # Instead, we set latitude and longitude to None to bypass geocoding:
-    df["latitude"] = None  # Alternatively, leave the caching/geocoding logic here if desired.
-    df["longitude"] = None
+    if not keep_address:
+        df.drop(columns=["full_address"], inplace=True)
+    return df
+
+def preprocess_in_parallel(csv_path, workers, chunk_size=DEFAULT_CHUNK_SIZE, keep_address=False):
+    """
+    Split the CSV into row ranges of chunk_size rows, preprocess them in a process pool and
+    concatenate the results in file order. At most 2 * workers chunks are in flight at a time.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in pd.read_csv(csv_path, dtype=str, chunksize=chunk_size):
+            pending.append(executor.submit(preprocess_physician_compare, chunk, keep_address))
+            if len(pending) >= 2 * workers:
+                results.append(pending.popleft().result())
+        while pending:
+            results.append(pending.popleft().result())
+    return pd.concat(results) if results else pd.DataFrame()
+
+def load_physician_compare_data(workers=1, chunk_size=DEFAULT_CHUNK_SIZE, report_memory=False, csv_path=None,
+                                geocoder=None, geocode_options=None, nppes=False, nppes_options=None):
+    """
+    Load and preprocess the Physician Compare CSV, using a process pool when workers > 1,
+    and convert columns to the compact dtypes declared in schema.py.
+    With a geocoder backend (see geocoding.GEOCODE_BACKENDS), street addresses are geocoded through the
+    address cache and replace the ZIP centroid coordinates wherever they resolve.
+    With nppes, providers get the nppes_* columns from the NPI Registry API (nppes_options: see
+    enrichment.fetch_nppes).
+    """
+    LOCAL_CSV_PATH = csv_path or os.path.join(os.getcwd(), "Physician_Compare_National_Download.csv")
+    keep_address = geocoder is not None
+    with span("preprocess", workers=workers) as preprocess_span:
+        if workers > 1:
+            df = preprocess_in_parallel(LOCAL_CSV_PATH, workers, chunk_size, keep_address)
+        else:
+            df = preprocess_physician_compare(pd.read_csv(LOCAL_CSV_PATH, dtype=str), keep_address)
+        preprocess_span.rows = len(df)
+
+    # Geocoding runs in this process only, so one cache and one rate limit cover every chunk
+    if geocoder is not None:
+        with span("geocode"):
+            lat, lon = geocode_address_column(df["full_address"], backend=geocoder, **(geocode_options or {}))
+            df["latitude"] = lat.fillna(df["latitude"])
+            df["longitude"] = lon.fillna(df["longitude"])
+            df.drop(columns=["full_address"], inplace=True)
     
-    # Optionally, you could drop the 'full_address' column if it's not needed:
-    df.drop(columns=["full_address"], inplace=True)
+    # Categoricals are built once over the merged frame so every chunk shares one dictionary
+    before_mb = memory_usage_mb(df) if report_memory else None
+    with span("apply_schema"):
+        df = apply_schema(df)
+    if report_memory:
+        print("Memory usage by column (MB) before/after compact dtypes:")
+        print(memory_report(before_mb, df).to_string())
     
     # -------------------- (Optional) Merge with Additional Data --------------------
-    # Placeholder for NPPES data loading
-    npi_list = df["npi"].unique().tolist()
-    nppes_df = load_nppes_data(npi_list)
-    if not nppes_df.empty:
-        nppes_df = nppes_df.rename(columns={col: col.lower() for col in nppes_df.columns})
-        if "npi" not in nppes_df.columns and "NPI" in nppes_df.columns:
-            nppes_df = nppes_df.rename(columns={"NPI": "npi"})
-        overlap_cols = set(nppes_df.columns).intersection(set(df.columns)) - {"npi"}
-        if overlap_cols:
-            nppes_df = nppes_df.drop(columns=list(overlap_cols))
-        df = df.merge(nppes_df, on="npi", how="left")
-    
-    # Placeholder for Plan-Net data loading
-    plan_net_df = load_plan_net_data(npi_list)
-    if not plan_net_df.empty:
-        plan_net_df = plan_net_df.rename(columns={col: col.lower() for col in plan_net_df.columns})
-        if "npi" not in plan_net_df.columns and "NPI" in plan_net_df.columns:
-            plan_net_df = plan_net_df.rename(columns={"NPI": "npi"})
-        overlap_cols = set(plan_net_df.columns).intersection(set(df.columns)) - {"npi"}
-        if overlap_cols:
-            plan_net_df = plan_net_df.drop(columns=list(overlap_cols))
-        df = df.merge(plan_net_df, on="npi", how="left")
-    
+    # NPPES details are one row per NPI, added with a single join. Plan-Net memberships (many per NPI) are not
+    # merged onto provider rows; main() stores them in the network tables (see networks.py).
+    if nppes:
+        npi_list = df["npi"].dropna().unique().tolist()
+        nppes_df = apply_schema(load_nppes_data(npi_list, **(nppes_options or {})).set_index("npi"))
+        with span("join_nppes"):
+            df = df.join(nppes_df, on="npi")
+
     return df
 
-# Placeholder functions for additional data (NPPES and Plan-Net)
-def load_nppes_data(npi_list=None):
-    """Placeholder: return empty DataFrame for NPPES."""
-    return pd.DataFrame()
+def load_nppes_data(npi_list=None, **options):
+    """NPI Registry details for the NPIs (enrichment.fetch_nppes), one row per NPI with nppes_* columns."""
+    if not npi_list:
+        return pd.DataFrame(columns=NPPES_COLUMNS)
+    with span("load_nppes") as nppes_span:
+        nppes_df = fetch_nppes(npi_list, **options)
+        nppes_span.rows = len(nppes_df)
+    return nppes_df
 
-def load_plan_net_data(npi_list=None):
-    """Placeholder: return empty DataFrame for Plan-Net."""
-    return pd.DataFrame()
+def load_plan_net_data(npi_list=None, endpoints=None, **options):
+    """Network memberships (npi, payer, network_id, network_name) from the Plan-Net endpoints (default: PLAN_NET_ENDPOINTS)."""
+    endpoints = PLAN_NET_ENDPOINTS if endpoints is None else endpoints
+    if not npi_list or not endpoints:
+        return pd.DataFrame(columns=PLAN_NET_COLUMNS)
+    with span("load_plan_net") as plan_net_span:
+        plan_net_df = fetch_plan_net(npi_list, endpoints, **options)
+        plan_net_span.rows = len(plan_net_df)
+    return plan_net_df
 
 # -------------------- Main Script --------------------
 def main():
+    parser = argparse.ArgumentParser(description="Load and preprocess the CMS Physician Compare CSV into providers.sqlite.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for preprocessing (1 runs serially; output is identical either way)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows per chunk handed to each worker")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Print per-column memory usage before and after applying compact dtypes")
+    parser.add_argument("--geocode", choices=sorted(GEOCODE_BACKENDS), default=None,
+                        help="Geocode street addresses with this backend ('local' is an offline ZIP centroid stand-in)")
+    parser.add_argument("--geocode-rate", type=float, default=None,
+                        help="Maximum geocoding requests per second (default: the backend's limit)")
+    parser.add_argument("--geocode-workers", type=int, default=4, help="Concurrent geocoding requests")
+    parser.add_argument("--nppes", action="store_true", help="Enrich providers from the NPPES NPI Registry API")
+    parser.add_argument("--nppes-url", default=None,
+                        help=f"NPI Registry API URL (implies --nppes; default {NPPES_API_URL}, or a local enrichment_stub.py)")
+    parser.add_argument("--nppes-rate", type=float, default=10.0, help="Maximum NPPES requests per second")
+    parser.add_argument("--plan-net", action="append", default=[], metavar="PAYER=URL",
+                        help="Plan-Net FHIR endpoint to query in addition to PLAN_NET_ENDPOINTS (repeatable)")
+    parser.add_argument("--plan-net-rate", type=float, default=5.0, help="Maximum requests per second per Plan-Net endpoint")
+    parser.add_argument("--enrich-concurrency", type=int, default=8, help="Concurrent requests per enrichment API")
+    parser.add_argument("--enrich-cache", default=ENRICHMENT_CACHE_DIR,
+                        help="Directory of the raw response cache ('' disables caching)")
+    parser.add_argument("--enrich-ttl-days", type=float, default=DEFAULT_TTL_DAYS,
+                        help="Age after which cached responses are fetched again")
+    args = parser.parse_args()
+
     print("Start running data_loader.py ...")
-    pc_df = load_physician_compare_data()
-    print("First 5 rows of merged data:")
-    print(pc_df.head())
-    
-    # Save the processed DataFrame to SQLite
-    LOCAL_DB_PATH = os.path.join(os.getcwd(), "providers.sqlite")
-    conn = sqlite3.connect(LOCAL_DB_PATH)
-    pc_df.to_sql(name="providers", con=conn, if_exists="replace", index=False)
-    conn.close()
+    geocoder = GEOCODE_BACKENDS[args.geocode]() if args.geocode else None
+    plan_net_endpoints = dict(PLAN_NET_ENDPOINTS)
+    for item in args.plan_net:
+        payer, _, url = item.partition("=")
+        if not url:
+            parser.error(f"--plan-net expects PAYER=URL, got '{item}'")
+        plan_net_endpoints[payer] = url
+    fetch_options = {"concurrency": args.enrich_concurrency, "cache_dir": args.enrich_cache or None,
+                     "ttl_days": args.enrich_ttl_days}
+    nppes_options = {**fetch_options, "url": args.nppes_url or NPPES_API_URL, "rate": args.nppes_rate}
+    with trace("data_loader") as loader_trace:
+        pc_df = load_physician_compare_data(workers=args.workers, chunk_size=args.chunk_size, report_memory=args.memory_report,
+                                            geocoder=geocoder,
+                                            geocode_options={"rate": args.geocode_rate, "max_workers": args.geocode_workers},
+                                            nppes=args.nppes or bool(args.nppes_url), nppes_options=nppes_options)
+        print("First 5 rows of merged data:")
+        print(pc_df.head())
+        memberships = load_plan_net_data(pc_df["npi"].dropna().unique().tolist(), plan_net_endpoints,
+                                         **fetch_options, rate=args.plan_net_rate)
+
+        # Save the processed DataFrame to SQLite
+        LOCAL_DB_PATH = os.path.join(os.getcwd(), "providers.sqlite")
+        with span("to_sql") as save_span:
+            conn = sqlite3.connect(LOCAL_DB_PATH)
+            pc_df.to_sql(name="providers", con=conn, if_exists="replace", index=False)
+            # The normalized lookup columns get indexes, so ZIP / phone prefixes and NPIs are range scans
+            for col in ["npi", "zip_code", "phone_number"]:
+                if col in pc_df.columns:
+                    conn.execute(f"CREATE INDEX idx_providers_{col} ON providers({col})")
+            if not memberships.empty:
+                create_network_tables(conn, memberships)
+            conn.commit()
+            conn.close()
+            save_span.rows = len(pc_df)
     print(f"Data successfully saved to {LOCAL_DB_PATH}")
+    if not memberships.empty:
+        # db_setup.py --networks loads these into providers.db for the app's network filter
+        save_memberships(memberships)
+        print(f"{len(memberships):,} network memberships saved to {MEMBERSHIPS_CSV_PATH}")
+    print(loader_trace.report())
 
 if __name__ == "__main__":
     main()
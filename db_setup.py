@@ -1,49 +1,34 @@
 import os
+import sys
+import time
+import hashlib
+import datetime
 import sqlite3
+import argparse
 import pandas as pd
-import requests
+from geocoding import geocode_zip_column
+from snapshot import SNAPSHOT_DIR, write_snapshot
+from schema import apply_schema, sql_type
+from map_aggregation import create_map_rollups
+from adequacy import create_adequacy_rollups, refresh_adequacy_rollups
+from normalization import split_zip_column, normalize_state_column, normalize_phone_column, npi_valid_column
+from taxonomy import download_taxonomy, load_taxonomy, create_taxonomy_table
+from networks import create_network_tables, load_memberships
+from enrichment import fetch_plan_net
+from instrumentation import span, trace
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
 
 # Paths and URLs
 CMS_CSV_PATH = os.path.join(os.getcwd(), "Physician_Compare_National_Download.csv")  # Path to CMS Physician Compare CSV
-NUCC_TAXONOMY_CSV_URL = "https://www.nucc.org/images/stories/CSV/nucc_taxonomy_250.csv"
-LOCAL_TAXONOMY_PATH = os.path.join(os.getcwd(), "nucc_taxonomy_250.csv")
 DB_PATH = os.path.join(os.getcwd(), "providers.db")
 
-# Download the NUCC taxonomy CSV if not already present
-if not os.path.exists(LOCAL_TAXONOMY_PATH):
-    try:
-        print("Downloading NUCC taxonomy data...")
-        response = requests.get(NUCC_TAXONOMY_CSV_URL)
-        response.raise_for_status()
-        with open(LOCAL_TAXONOMY_PATH, "wb") as f:
-            f.write(response.content)
-        print("Downloaded NUCC taxonomy CSV to", LOCAL_TAXONOMY_PATH)
-    except Exception as e:
-        print("Failed to download NUCC taxonomy CSV. Please download it manually.", e)
-        raise
-
-# Load the NUCC taxonomy CSV to build a normalization map for specialty names
-taxonomy_df = pd.read_csv(LOCAL_TAXONOMY_PATH, dtype=str)
-taxonomy_df.fillna("", inplace=True)  # Replace NaN with empty string for easier handling
-# Build a set of official specialty names (classification and specialization) from the taxonomy
-official_specialties = set()
-for _, row in taxonomy_df.iterrows():
-    classification = row.get("Classification", "").strip()
-    specialization = row.get("Specialization", "").strip()
-    if specialization:  # If there is a specialization, include it
-        official_specialties.add(specialization)
-    if classification:  # Include classification as well (acts as a specialty when no specialization)
-        official_specialties.add(classification)
-# Create a mapping from uppercase specialty name to official casing
-specialty_name_map = {name.upper(): name for name in official_specialties}
-
-# Load the CMS Physician Compare data
-if not os.path.exists(CMS_CSV_PATH):
-    raise FileNotFoundError(f"CMS data file not found at {CMS_CSV_PATH}. Please update CMS_CSV_PATH.")
-print("Loading CMS Physician Compare data...")
-# Read CSV with all columns as strings (to preserve IDs, ZIP codes, etc.)
-providers_df = pd.read_csv(CMS_CSV_PATH, dtype=str)
+# Rows per chunk when streaming the CSV; peak memory scales with this rather than with the file size
+DEFAULT_CHUNK_SIZE = 100_000
 
 # Rename columns from the revised dataset to the original short names (for consistency)
 rename_map = {
@@ -94,67 +79,580 @@ rename_map = {
     "Clinician accepts Medicare assignment": "assgn",
     "Group accepts Medicare Assignment": "grp_assgn",
     "Group accepts Medicare assignment": "grp_assgn",
+    "ind_assgn": "assgn",                   # Clinician accepts Medicare assignment (current file layout)
     "Address ID": "adrs_id"
 }
-# Apply renaming for any columns that match
-for col, new_col in rename_map.items():
-    if col in providers_df.columns:
-        providers_df.rename(columns={col: new_col}, inplace=True)
-
-# Strip whitespace from all string values to ensure clean data
-providers_df = providers_df.map(lambda x: x.strip() if isinstance(x, str) else x)
 
-# Normalize specialty names (primary and secondary) using the taxonomy mapping
 spec_cols = ["pri_spec", "sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]
-for col in spec_cols:
-    if col in providers_df.columns:
-        providers_df[col] = providers_df[col].apply(
-            lambda val: specialty_name_map.get(val.strip().upper(), val) if pd.notna(val) else val
+sec_spec_cols = ["sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]
+
+# Columns that identify a provider row across monthly refreshes (matched case-insensitively)
+key_cols = ["npi", "ind_enrl_id", "adrs_id"]
+
+# Storage types for derived columns; source columns take their type from schema.py (TEXT unless declared)
+column_types = {"lat": "REAL", "lon": "REAL", "row_hash": "INTEGER", "row_seq": "INTEGER"}
+
+# Per-address columns, stored once per adrs_id in the locations table. Clinician rows reference a location
+# through adrs_id; cty/st/zip are also kept on providers as the indexed filter and search columns.
+location_cols = ["adr_ln_1", "adr_ln_2", "ln_2_sprs", "cty", "st", "zip", "zip4", "phn_numbr", "lat", "lon"]
+provider_location_cols = ["cty", "st", "zip"]
+
+# PRAGMAs for the bulk load: keep the rollback journal in memory, skip fsyncs and give SQLite a larger page cache
+bulk_load_pragmas = [
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",   # 256 MB
+    "PRAGMA temp_store = MEMORY",
+]
+
+# -------------------- Chunk Processing --------------------
+
+def clean_providers_chunk(providers_df, taxonomy):
+    """Rename, strip, normalize and geocode one chunk of the CMS CSV using column-wise operations."""
+    # Apply renaming for any columns that match
+    providers_df = providers_df.rename(columns={k: v for k, v in rename_map.items() if k in providers_df.columns})
+
+    # Strip whitespace from all string values to ensure clean data
+    for col in providers_df.columns:
+        providers_df[col] = providers_df[col].str.strip()
+
+    # Normalize keys and contact fields (normalization.py): ZIP+4 is split into 5-digit zip and zip4, phones are
+    # reduced to 10 digits and states validated, so the indexes on them serve prefix and equality lookups
+    if "zip" in providers_df.columns:
+        providers_df["zip"], providers_df["zip4"] = split_zip_column(providers_df["zip"])
+    if "st" in providers_df.columns:
+        providers_df["st"] = normalize_state_column(providers_df["st"])
+    if "phn_numbr" in providers_df.columns:
+        providers_df["phn_numbr"] = normalize_phone_column(providers_df["phn_numbr"])
+    if "NPI" in providers_df.columns:
+        # Rows are kept either way; npi_valid flags NPIs whose Luhn check digit doesn't match
+        providers_df["npi_valid"] = npi_valid_column(providers_df["NPI"]).astype("Int8")
+
+    # Normalize specialty names (primary and secondary) to NUCC names; each distinct value is matched once.
+    # The primary specialty also keeps its NUCC code, which links it to the taxonomy table's Grouping.
+    for col in spec_cols:
+        if col in providers_df.columns:
+            names, codes = taxonomy.normalize_column(providers_df[col])
+            providers_df[col] = names
+            if col == "pri_spec":
+                providers_df["pri_spec_code"] = codes
+
+    # Recalculate the combined secondary specialties column to reflect normalized names
+    if all(col in providers_df.columns for col in sec_spec_cols):
+        sec_all = pd.Series("", index=providers_df.index, dtype=object)
+        for col in sec_spec_cols:
+            specs = providers_df[col].fillna("").astype(str)
+            has_spec = specs != ""
+            sec_all = sec_all.mask(has_spec & (sec_all != ""), sec_all + ", " + specs)
+            sec_all = sec_all.mask(has_spec & (sec_all == ""), specs)
+        providers_df["sec_spec_all"] = sec_all
+
+    # Attach coordinates from the bundled ZIP centroid table (offline, no geocoding API calls)
+    if "zip" in providers_df.columns:
+        providers_df["lat"], providers_df["lon"] = geocode_zip_column(providers_df["zip"])
+
+    # Rows without an address ID get one derived from the address text, so they still share a location
+    if "adrs_id" in providers_df.columns:
+        address = pd.Series("~", index=providers_df.index, dtype=object)
+        for col in ["adr_ln_1", "adr_ln_2", "cty", "st", "zip"]:
+            if col in providers_df.columns:
+                address = address + "|" + providers_df[col].fillna("").astype(str).str.upper()
+        providers_df["adrs_id"] = providers_df["adrs_id"].where(providers_df["adrs_id"].fillna("") != "", address)
+
+    # Compact dtypes (categoricals, nullable integers) as declared in schema.py
+    return apply_schema(providers_df)
+
+def add_row_identity(providers_df):
+    """
+    Add row_key (NPI|enrollment ID|address ID) and row_hash (a 64-bit hash of the normalized row).
+    The same key can appear more than once, so rows are told apart later by row_seq (see assign_row_seq).
+    """
+    data_cols = list(providers_df.columns)
+    by_lower = {col.lower(): col for col in data_cols}
+    row_key = pd.Series("", index=providers_df.index, dtype=object)
+    for i, key in enumerate(col for col in key_cols if col in by_lower):
+        values = providers_df[by_lower[key]].fillna("").astype(str)
+        row_key = values if i == 0 else row_key + "|" + values
+    providers_df["row_key"] = row_key
+    hashes = pd.util.hash_pandas_object(providers_df[data_cols].astype(object), index=False)
+    providers_df["row_hash"] = hashes.to_numpy().view("int64")
+    providers_df["row_seq"] = None
+    return providers_df
+
+def split_locations(providers_df):
+    """
+    Split a cleaned chunk into (clinician rows, location rows). Location rows hold the per-address columns,
+    one row per adrs_id (the first one seen); clinician rows keep adrs_id as the reference to their location.
+    """
+    loc_cols = [col for col in location_cols if col in providers_df.columns]
+    if "adrs_id" not in providers_df.columns or not loc_cols:
+        return providers_df, None
+    locations_df = providers_df[["adrs_id"] + loc_cols].drop_duplicates("adrs_id")
+    dropped = [col for col in loc_cols if col not in provider_location_cols]
+    return providers_df.drop(columns=dropped), locations_df
+
+def chunk_rows(providers_df):
+    """Yield plain tuples for executemany, with NaN replaced by None (stored as NULL)."""
+    values = providers_df.astype(object).where(providers_df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+# -------------------- Database --------------------
+
+def create_providers_table(conn, columns, table="providers"):
+    """Replace the providers table (and its indexes, triggers and auxiliary search tables) with an empty one."""
+    if table == "providers":
+        conn.execute("DROP TABLE IF EXISTS providers_fts")
+        conn.execute("DROP TABLE IF EXISTS providers_geo")
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    col_defs = ", ".join(f'"{col}" {column_types.get(col) or sql_type(col)}' for col in columns)
+    conn.execute(f"CREATE TABLE {table} ({col_defs})")
+
+def create_locations_table(conn, columns):
+    """Replace the locations table (one row per adrs_id) and its spatial index with an empty one."""
+    conn.execute("DROP TABLE IF EXISTS locations_geo")
+    conn.execute("DROP TABLE IF EXISTS locations")
+    col_defs = ", ".join(f'"{col}" {column_types.get(col) or sql_type(col)}' for col in columns if col != "adrs_id")
+    conn.execute(f"CREATE TABLE locations (adrs_id TEXT PRIMARY KEY, {col_defs})")
+
+def upsert_locations_from_staging(conn, columns):
+    """
+    Insert new locations and update changed ones from providers_staging (first row per adrs_id, as in a full build),
+    then drop locations no provider references any more. Returns (inserted_or_updated, deleted).
+    """
+    col_list = ", ".join(f'"{col}"' for col in columns)
+    assignments = ", ".join(f'"{col}" = excluded."{col}"' for col in columns if col != "adrs_id")
+    changed = " OR ".join(f'locations."{col}" IS NOT excluded."{col}"' for col in columns if col != "adrs_id")
+    upserted = conn.execute(f"""
+        INSERT INTO locations ({col_list})
+        SELECT {col_list} FROM providers_staging
+        WHERE rowid IN (SELECT MIN(rowid) FROM providers_staging GROUP BY adrs_id)
+        ON CONFLICT(adrs_id) DO UPDATE SET {assignments} WHERE {changed}
+    """).rowcount
+    deleted = conn.execute("""
+        DELETE FROM locations WHERE NOT EXISTS (SELECT 1 FROM providers WHERE providers.adrs_id = locations.adrs_id)
+    """).rowcount
+    return upserted, deleted
+
+def assign_row_seq(conn, table):
+    """Number rows sharing a row_key (ordered by row_hash) so that (row_key, row_seq) is unique."""
+    conn.execute(f"""
+        UPDATE {table} SET row_seq = seq.n
+        FROM (SELECT rowid AS rid, ROW_NUMBER() OVER (PARTITION BY row_key ORDER BY row_hash) AS n FROM {table}) AS seq
+        WHERE seq.rid = {table}.rowid
+    """)
+
+def create_manifest_table(conn):
+    """Create the load_manifest table that records every full build and refresh."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS load_manifest (
+            id INTEGER PRIMARY KEY,
+            loaded_at TEXT,
+            mode TEXT,
+            source_file TEXT,
+            source_sha256 TEXT,
+            source_rows INTEGER,
+            inserted INTEGER,
+            updated INTEGER,
+            deleted INTEGER,
+            total_rows INTEGER
         )
+    """)
+
+def record_manifest(conn, mode, csv_path, checksum, source_rows, inserted, updated, deleted):
+    """Append a load_manifest row describing this load."""
+    create_manifest_table(conn)
+    total_rows = conn.execute("SELECT COUNT(*) FROM providers").fetchone()[0]
+    conn.execute(
+        "INSERT INTO load_manifest (loaded_at, mode, source_file, source_sha256, source_rows, inserted, updated, deleted, total_rows) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), mode, os.path.basename(csv_path),
+         checksum, source_rows, inserted, updated, deleted, total_rows),
+    )
 
-# Recalculate the combined secondary specialties column to reflect normalized names
-if all(col in providers_df.columns for col in ["sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]):
-    combined_list = providers_df[["sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]].fillna("").values.tolist()
-    sec_all = []
-    for specs in combined_list:
-        # Filter out empty strings and join multiple specialties with comma + space
-        specs_clean = [s for s in specs if s and str(s).strip() != ""]
-        if specs_clean:
-            sec_all.append(", ".join(specs_clean))
+def location_count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+    finally:
+        conn.close()
+
+def file_sha256(path):
+    """SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_indexes(conn, columns):
+    """Create indexes on searchable fields, the FTS5 search index and the R*Tree spatial index over locations."""
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE INDEX idx_prov_last_name ON providers(lst_nm)")
+        cur.execute("CREATE INDEX idx_prov_first_name ON providers(frst_nm)")
+        cur.execute("CREATE INDEX idx_prov_npi ON providers(NPI)")
+        # Keyset pagination sort key (provider_query.NAME_KEY, NPI_KEY): the expressions must match exactly
+        cur.execute("CREATE INDEX idx_prov_name_key ON providers(IFNULL(lst_nm, ''), IFNULL(NPI, ''))")
+        if "pri_spec" in columns:
+            cur.execute("CREATE INDEX idx_prov_pri_spec ON providers(pri_spec)")
+        if "pri_spec_code" in columns:
+            cur.execute("CREATE INDEX idx_prov_pri_spec_code ON providers(pri_spec_code)")
+        if "sec_spec_1" in columns:
+            cur.execute("CREATE INDEX idx_prov_sec_spec1 ON providers(sec_spec_1)")
+        if "sec_spec_2" in columns:
+            cur.execute("CREATE INDEX idx_prov_sec_spec2 ON providers(sec_spec_2)")
+        if "sec_spec_3" in columns:
+            cur.execute("CREATE INDEX idx_prov_sec_spec3 ON providers(sec_spec_3)")
+        if "sec_spec_4" in columns:
+            cur.execute("CREATE INDEX idx_prov_sec_spec4 ON providers(sec_spec_4)")
+        cur.execute("CREATE INDEX idx_prov_state ON providers(st)")
+        cur.execute("CREATE INDEX idx_prov_zip ON providers(zip)")
+        cur.execute("CREATE UNIQUE INDEX idx_prov_row_key ON providers(row_key, row_seq)")
+        if "adrs_id" in columns:
+            cur.execute("CREATE INDEX idx_prov_adrs_id ON providers(adrs_id)")
+        location_columns = [row[1] for row in cur.execute("PRAGMA table_info(locations)")]
+        if "phn_numbr" in location_columns:
+            # Phones are stored as 10 digits, so number-prefix lookups are range scans on this index
+            cur.execute("CREATE INDEX idx_loc_phone ON locations(phn_numbr)")
+
+        # Build an FTS5 full-text index (with prefix indexes) for the sidebar search box.
+        # It is an external-content table over providers, so the text itself is not duplicated.
+        fts_cols = [col for col in ["frst_nm", "lst_nm", "cty", "org_nm"] + spec_cols if col in columns]
+        cur.execute("DROP TABLE IF EXISTS providers_fts")
+        cur.execute(
+            f"CREATE VIRTUAL TABLE providers_fts USING fts5({', '.join(fts_cols)}, "
+            "content='providers', content_rowid='rowid', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+        )
+        cur.execute("INSERT INTO providers_fts(providers_fts) VALUES ('rebuild')")
+        # Keep the full-text index in sync with any later writes to providers
+        new_vals = ", ".join(f"new.{col}" for col in fts_cols)
+        old_vals = ", ".join(f"old.{col}" for col in fts_cols)
+        cur.executescript(f"""
+            CREATE TRIGGER providers_fts_ai AFTER INSERT ON providers BEGIN
+                INSERT INTO providers_fts(rowid, {', '.join(fts_cols)}) VALUES (new.rowid, {new_vals});
+            END;
+            CREATE TRIGGER providers_fts_ad AFTER DELETE ON providers BEGIN
+                INSERT INTO providers_fts(providers_fts, rowid, {', '.join(fts_cols)}) VALUES ('delete', old.rowid, {old_vals});
+            END;
+            CREATE TRIGGER providers_fts_au AFTER UPDATE ON providers BEGIN
+                INSERT INTO providers_fts(providers_fts, rowid, {', '.join(fts_cols)}) VALUES ('delete', old.rowid, {old_vals});
+                INSERT INTO providers_fts(rowid, {', '.join(fts_cols)}) VALUES (new.rowid, {new_vals});
+            END;
+        """)
+
+        # Spatial index for radius search: an R*Tree of location points keyed by locations.rowid
+        if "lat" in location_columns:
+            cur.execute("DROP TABLE IF EXISTS locations_geo")
+            cur.execute("CREATE VIRTUAL TABLE locations_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+            cur.execute(
+                "INSERT INTO locations_geo (id, min_lat, max_lat, min_lon, max_lon) "
+                "SELECT rowid, lat, lat, lon, lon FROM locations WHERE lat IS NOT NULL AND lon IS NOT NULL"
+            )
+            cur.executescript("""
+                CREATE TRIGGER locations_geo_ai AFTER INSERT ON locations WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+                    INSERT INTO locations_geo VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+                END;
+                CREATE TRIGGER locations_geo_ad AFTER DELETE ON locations BEGIN
+                    DELETE FROM locations_geo WHERE id = old.rowid;
+                END;
+                CREATE TRIGGER locations_geo_au AFTER UPDATE OF lat, lon ON locations BEGIN
+                    DELETE FROM locations_geo WHERE id = old.rowid;
+                    INSERT INTO locations_geo SELECT new.rowid, new.lat, new.lat, new.lon, new.lon
+                        WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+                END;
+            """)
+        conn.commit()
+    finally:
+        cur.close()
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# -------------------- Ingest --------------------
+
+class SchemaChanged(Exception):
+    """The CSV's columns no longer match the existing tables, so it can't be applied as a delta."""
+
+def build_database(csv_path=CMS_CSV_PATH, db_path=DB_PATH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream the CMS CSV into SQLite in fixed-size chunks inside a single transaction,
+    then build the indexes. A chunk_size of 0 reads the whole file at once.
+    Returns the number of provider rows loaded.
+    """
+    with span("taxonomy"):
+        download_taxonomy()
+        taxonomy = load_taxonomy()
+
+    # Load the CMS Physician Compare data
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"CMS data file not found at {csv_path}. Please update CMS_CSV_PATH.")
+    print("Loading CMS Physician Compare data...")
+    # Read CSV with all columns as strings (to preserve IDs, ZIP codes, etc.)
+    try:
+        if chunk_size:
+            chunks = pd.read_csv(csv_path, dtype=str, chunksize=chunk_size)
         else:
-            sec_all.append("")
-    providers_df["sec_spec_all"] = sec_all
+            chunks = [pd.read_csv(csv_path, dtype=str)]
+    except pd.errors.EmptyDataError as exc:
+        raise ValueError(f"CMS data file {csv_path} is empty") from exc
 
-# Replace any remaining NaN values with None (to store as NULL in database)
-providers_df = providers_df.where(pd.notna(providers_df), None)
+    print("Creating SQLite database and inserting data...")
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    total_rows = 0
+    columns = loc_columns = insert_sql = loc_sql = None
+    locations = None
+    try:
+        for pragma in bulk_load_pragmas:
+            conn.execute(pragma)
+        conn.execute("BEGIN")
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            with span("clean_chunk") as clean_span:
+                chunk, locations = split_locations(add_row_identity(clean_providers_chunk(chunk, taxonomy)))
+                clean_span.rows = len(chunk)
+            if columns is None:
+                columns = list(chunk.columns)
+                create_providers_table(conn, columns)
+                insert_sql = f"INSERT INTO providers VALUES ({', '.join('?' * len(columns))})"
+                if locations is not None:
+                    loc_columns = list(locations.columns)
+                    create_locations_table(conn, loc_columns)
+                    loc_sql = f"INSERT OR IGNORE INTO locations ({', '.join(loc_columns)}) VALUES ({', '.join('?' * len(loc_columns))})"
+            with span("insert_chunk") as insert_span:
+                conn.executemany(insert_sql, chunk_rows(chunk[columns]))
+                if locations is not None:
+                    conn.executemany(loc_sql, chunk_rows(locations[loc_columns]))
+                insert_span.rows = len(chunk)
+            total_rows += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"  {total_rows:,} rows loaded ({total_rows / elapsed:,.0f} rows/sec)")
+        if columns is None:
+            # Nothing was loaded: roll back rather than replace the existing tables with empty ones
+            raise ValueError(f"CMS data file {csv_path} has no provider rows")
+        with span("finish_load"):
+            assign_row_seq(conn, "providers")
+            create_taxonomy_table(conn, taxonomy)
+            record_manifest(conn, "full", csv_path, file_sha256(csv_path), total_rows, total_rows, 0, 0)
+            conn.commit()
+        load_seconds = time.perf_counter() - start
 
-# Create SQLite database and table, then insert data
-print("Creating SQLite database and inserting data...")
-conn = sqlite3.connect(DB_PATH)
-# Use pandas to_sql to create and populate the providers table
-providers_df.to_sql("providers", conn, if_exists="replace", index=False)
+        # Indexes are built after the load so the inserts don't pay for index maintenance
+        print("Building indexes...")
+        with span("indexes"):
+            create_indexes(conn, columns)
+        if locations is not None:
+            print("Building map and network-adequacy rollups...")
+            with span("map_rollups"):
+                create_map_rollups(conn)
+            with span("adequacy_rollups"):
+                create_adequacy_rollups(conn)
+            conn.commit()
+        # WAL lets readers (the Streamlit app) keep querying while the database is written later on
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
 
-# Create indexes on searchable fields for performance
-cur = conn.cursor()
-try:
-    cur.execute("CREATE INDEX idx_prov_last_name ON providers(lst_nm)")
-    cur.execute("CREATE INDEX idx_prov_first_name ON providers(frst_nm)")
-    if "pri_spec" in providers_df.columns:
-        cur.execute("CREATE INDEX idx_prov_pri_spec ON providers(pri_spec)")
-    if "sec_spec_1" in providers_df.columns:
-        cur.execute("CREATE INDEX idx_prov_sec_spec1 ON providers(sec_spec_1)")
-    if "sec_spec_2" in providers_df.columns:
-        cur.execute("CREATE INDEX idx_prov_sec_spec2 ON providers(sec_spec_2)")
-    if "sec_spec_3" in providers_df.columns:
-        cur.execute("CREATE INDEX idx_prov_sec_spec3 ON providers(sec_spec_3)")
-    if "sec_spec_4" in providers_df.columns:
-        cur.execute("CREATE INDEX idx_prov_sec_spec4 ON providers(sec_spec_4)")
-    cur.execute("CREATE INDEX idx_prov_state ON providers(st)")
-    cur.execute("CREATE INDEX idx_prov_zip ON providers(zip)")
-    conn.commit()
-finally:
-    cur.close()
-    conn.close()
-
-print(f"Database created at {DB_PATH} with {len(providers_df)} provider records.")
-print("Indexes on name, specialties, state, and ZIP code have been created.")
+    total_seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    if locations is not None:
+        print(f"Stored {location_count(db_path):,} unique locations for {total_rows:,} provider rows.")
+    print(f"Loaded {total_rows:,} rows in {load_seconds:.1f}s ({total_rows / max(load_seconds, 1e-9):,.0f} rows/sec), "
+          f"{total_seconds:.1f}s including indexes" + (f"; peak RSS {peak:,.0f} MB" if peak is not None else ""))
+    return total_rows
+
+def refresh_database(csv_path=CMS_CSV_PATH, db_path=DB_PATH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Apply a new CMS file to an existing database as a delta: rows are matched on (row_key, row_seq),
+    changed rows (different row_hash) are updated in place, new rows inserted and vanished rows deleted.
+    The delta happens in one transaction, so readers keep seeing the previous snapshot until commit (WAL);
+    the adequacy rollups are brought up to date afterwards in a short transaction of their own, which also
+    records the load manifest. Falls back to a full build when there is nothing to refresh or the CSV columns
+    changed (SchemaChanged); any other error rolls the delta back and is raised.
+    Returns a dict with the inserted/updated/deleted counts.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"CMS data file not found at {csv_path}. Please update CMS_CSV_PATH.")
+    conn = sqlite3.connect(db_path)
+    existing = [row[1] for row in conn.execute("PRAGMA table_info(providers)")]
+    loc_columns = [row[1] for row in conn.execute("PRAGMA table_info(locations)")]
+    if "row_key" not in existing or not loc_columns:
+        conn.close()
+        print("No refreshable providers table found; running a full build instead.")
+        total_rows = build_database(csv_path, db_path, chunk_size)
+        return {"inserted": total_rows, "updated": 0, "deleted": 0}
+
+    checksum = file_sha256(csv_path)
+    create_manifest_table(conn)
+    last = conn.execute("SELECT source_sha256 FROM load_manifest WHERE mode <> 'networks' ORDER BY id DESC LIMIT 1").fetchone()
+    if last and last[0] == checksum:
+        conn.close()
+        print("Source file is unchanged since the last load; nothing to refresh.")
+        return {"inserted": 0, "updated": 0, "deleted": 0}
+
+    with span("taxonomy"):
+        download_taxonomy()
+        taxonomy = load_taxonomy()
+    print("Refreshing providers from", csv_path)
+    start = time.perf_counter()
+    source_rows = 0
+    try:
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("BEGIN IMMEDIATE")
+        # Staging holds whole source rows: provider columns plus the per-address columns of locations
+        staging_cols = existing + [col for col in loc_columns if col not in existing]
+        create_providers_table(conn, staging_cols, table="providers_staging")
+        insert_sql = f"INSERT INTO providers_staging VALUES ({', '.join('?' * len(staging_cols))})"
+        chunks = pd.read_csv(csv_path, dtype=str, chunksize=chunk_size) if chunk_size else [pd.read_csv(csv_path, dtype=str)]
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            with span("clean_chunk") as clean_span:
+                chunk = add_row_identity(clean_providers_chunk(chunk, taxonomy))
+                clean_span.rows = len(chunk)
+            if sorted(chunk.columns) != sorted(staging_cols):
+                raise SchemaChanged("CSV columns differ from the existing providers and locations tables")
+            with span("stage_chunk") as stage_span:
+                conn.executemany(insert_sql, chunk_rows(chunk[staging_cols]))
+                stage_span.rows = len(chunk)
+            source_rows += len(chunk)
+        if source_rows == 0:
+            # An empty delta would delete every provider
+            raise ValueError(f"CMS data file {csv_path} has no provider rows")
+        with span("index_staging"):
+            assign_row_seq(conn, "providers_staging")
+            conn.execute("CREATE UNIQUE INDEX idx_staging_row_key ON providers_staging(row_key, row_seq)")
+
+        data_cols = [col for col in existing if col not in ("row_key", "row_seq")]
+        with span("apply_delta") as delta_span:
+            deleted = conn.execute("""
+                DELETE FROM providers WHERE NOT EXISTS (
+                    SELECT 1 FROM providers_staging s WHERE s.row_key = providers.row_key AND s.row_seq = providers.row_seq)
+            """).rowcount
+            assignments = ", ".join(f'"{col}" = s."{col}"' for col in data_cols)
+            updated = conn.execute(f"""
+                UPDATE providers SET {assignments}
+                FROM providers_staging AS s
+                WHERE s.row_key = providers.row_key AND s.row_seq = providers.row_seq AND s.row_hash <> providers.row_hash
+            """).rowcount
+            col_list = ", ".join(f'"{col}"' for col in existing)
+            inserted = conn.execute(f"""
+                INSERT INTO providers ({col_list})
+                SELECT {col_list} FROM providers_staging s WHERE NOT EXISTS (
+                    SELECT 1 FROM providers p WHERE p.row_key = s.row_key AND p.row_seq = s.row_seq)
+            """).rowcount
+            delta_span.rows = deleted + updated + inserted
+        with span("locations"):
+            locations_changed, locations_deleted = upsert_locations_from_staging(conn, loc_columns)
+        create_taxonomy_table(conn, taxonomy)
+        with span("map_rollups"):
+            create_map_rollups(conn)
+        conn.execute("DROP TABLE providers_staging")
+        conn.commit()
+    except SchemaChanged as e:
+        conn.rollback()
+        conn.close()
+        print(f"{e}; running a full build instead.")
+        total_rows = build_database(csv_path, db_path, chunk_size)
+        return {"inserted": total_rows, "updated": 0, "deleted": 0}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # Adequacy rollups are recomputed after the commit, reading the new data, so their distance computations
+    # don't extend the delta's write transaction (see adequacy.refresh_adequacy_rollups). The load manifest is
+    # recorded in the same transaction as the new rollups: readers key their caches on the manifest id, so they
+    # move to the new load together with its rollups. Should the rollups fail, no manifest is recorded and the
+    # next refresh of the file (an empty delta) retries them.
+    conn = sqlite3.connect(db_path)
+    try:
+        with span("adequacy_rollups"):
+            refresh_adequacy_rollups(conn, finish=lambda rollup_conn: record_manifest(
+                rollup_conn, "refresh", csv_path, checksum, source_rows, inserted, updated, deleted))
+    finally:
+        conn.close()
+
+    print(f"Refreshed {source_rows:,} source rows in {time.perf_counter() - start:.1f}s: "
+          f"{inserted:,} inserted, {updated:,} updated, {deleted:,} deleted; "
+          f"{locations_changed:,} locations added or changed, {locations_deleted:,} removed.")
+    return {"inserted": inserted, "updated": updated, "deleted": deleted,
+            "locations_changed": locations_changed, "locations_deleted": locations_deleted}
+
+def load_networks(db_path=DB_PATH, memberships_csv=None, plan_net_endpoints=None):
+    """
+    Replace the Plan-Net network tables (networks.create_network_tables) with the memberships in memberships_csv
+    (as written by data_loader.py) and/or fetched from plan_net_endpoints for the NPIs in the database.
+    Returns the number of memberships stored.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        frames = [load_memberships(memberships_csv)] if memberships_csv else []
+        if plan_net_endpoints:
+            npis = [row[0] for row in conn.execute("SELECT DISTINCT NPI FROM providers WHERE NPI IS NOT NULL")]
+            frames.append(fetch_plan_net(npis, plan_net_endpoints))
+        with span("network_tables") as network_span:
+            stored = create_network_tables(conn, pd.concat(frames, ignore_index=True))
+            # A manifest row of its own, so cached results and snapshots from before the new networks are dropped
+            source = memberships_csv or ",".join(plan_net_endpoints)
+            record_manifest(conn, "networks", source, None, stored, stored, 0, 0)
+            conn.commit()
+            network_span.rows = stored
+    finally:
+        conn.close()
+    print(f"Stored {stored:,} provider network memberships.")
+    return stored
+
+def main():
+    parser = argparse.ArgumentParser(description="Build providers.db from the CMS Physician Compare CSV.")
+    parser.add_argument("--csv", default=CMS_CSV_PATH, help="Path to the Physician Compare CSV")
+    parser.add_argument("--db", default=DB_PATH, help="Path of the SQLite database to create")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows per streamed chunk (0 loads the whole CSV at once)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Apply the CSV as a delta to an existing database instead of rebuilding it")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR,
+                        help="Where to write the memory-mapped columnar snapshot used for fast app startup")
+    parser.add_argument("--networks", default=None, metavar="CSV",
+                        help="Load Plan-Net network memberships from this CSV (npi, payer, network_id, network_name)")
+    parser.add_argument("--plan-net", action="append", default=[], metavar="PAYER=URL",
+                        help="Fetch network memberships from this Plan-Net FHIR endpoint (repeatable)")
+    args = parser.parse_args()
+    plan_net_endpoints = dict(item.partition("=")[::2] for item in args.plan_net)
+    with_networks = bool(args.networks or plan_net_endpoints)
+
+    if args.refresh:
+        with trace("refresh_database") as refresh_trace:
+            changes = refresh_database(args.csv, args.db, args.chunk_size)
+            if with_networks:
+                load_networks(args.db, args.networks, plan_net_endpoints)
+            if any(changes.values()) or with_networks:
+                with span("snapshot"):
+                    write_snapshot(args.db, args.snapshot_dir)
+                print(f"Columnar snapshot written to {args.snapshot_dir}.")
+        print(refresh_trace.report())
+        return
+
+    with trace("build_database") as build_trace:
+        total_rows = build_database(args.csv, args.db, args.chunk_size)
+        print(f"Database created at {args.db} with {total_rows} provider records.")
+        print("Indexes on name, specialties, state, and ZIP code have been created.")
+        print("Full-text search index (providers_fts) and spatial index (locations_geo) have been built.")
+        if with_networks:
+            load_networks(args.db, args.networks, plan_net_endpoints)
+        with span("snapshot"):
+            write_snapshot(args.db, args.snapshot_dir)
+        print(f"Columnar snapshot written to {args.snapshot_dir}.")
+    print(build_trace.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from normalization import npi_valid_column, normalize_phone_column
+
+# -------------------- Enrichment from NPPES and Plan-Net --------------------
+# Both APIs are queried by NPI, so a full Physician Compare load means millions of lookups. Requests run
+# concurrently on an asyncio loop (blocking `requests` calls on a bounded thread pool) under a concurrency cap and
+# a request-rate cap; every raw response is kept in a content-addressed on-disk cache, so re-runs within the TTL,
+# and runs resumed after an interruption, only fetch what is missing.
+
+NPPES_API_URL = "https://npiregistry.cms.hhs.gov/api/"
+NPPES_API_VERSION = "2.1"
+
+ENRICHMENT_CACHE_DIR = os.path.join(os.getcwd(), "enrichment_cache")
+DEFAULT_TTL_DAYS = 7        # NPPES publishes weekly updates
+
+# FHIR identifier system of NPIs, and the Plan-Net extension linking a PractitionerRole to its network
+NPI_SYSTEM = "http://hl7.org/fhir/sid/us-npi"
+NETWORK_EXTENSION = "http://hl7.org/fhir/us/davinci-pdex-plan-net/StructureDefinition/network-reference"
+
+# Statuses worth retrying with backoff; other HTTP errors fail the request straight away
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+NPPES_COLUMNS = ["npi", "nppes_enumeration_type", "nppes_status", "nppes_enumeration_date", "nppes_last_updated",
+                 "nppes_taxonomy_code", "nppes_taxonomy_desc", "nppes_license_state", "nppes_license", "nppes_phone"]
+PLAN_NET_COLUMNS = ["npi", "payer", "network_id", "network_name"]
+
+class EnrichmentError(Exception):
+    """Transient failure (throttling, 5xx); the request is retried with backoff."""
+
+# -------------------- Response Cache --------------------
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class ResponseCache:
+    """
+    On-disk cache of raw response bodies. Bodies are stored once under the sha256 of their content
+    (blobs/ab/abcd...), and each request (URL plus sorted parameters, hashed the same way) has a small entry in
+    requests/ pointing at its blob with the time it was fetched. Identical responses, such as the many "no results"
+    answers, share one blob. Entries older than the TTL are treated as misses and overwritten on the next fetch.
+    """
+
+    def __init__(self, directory=ENRICHMENT_CACHE_DIR, ttl_days=DEFAULT_TTL_DAYS):
+        self.directory = directory
+        self.ttl = ttl_days * 86400
+
+    @staticmethod
+    def request_key(url, params=None):
+        canonical = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or []))], separators=(",", ":"))
+        return _sha256(canonical.encode("utf-8"))
+
+    def _path(self, kind, digest):
+        return os.path.join(self.directory, kind, digest[:2], digest)
+
+    def get(self, url, params=None):
+        """Cached body for the request, or None if it was never fetched or has expired."""
+        try:
+            with open(self._path("requests", self.request_key(url, params)), "rb") as f:
+                entry = json.load(f)
+            if time.time() - entry["fetched_at"] > self.ttl:
+                return None
+            with open(self._path("blobs", entry["blob"]), "rb") as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, url, params, body):
+        digest = _sha256(body)
+        blob_path = self._path("blobs", digest)
+        if not os.path.exists(blob_path):
+            _write_atomic(blob_path, body)
+        entry = {"url": url, "params": [list(item) for item in params or []], "blob": digest, "fetched_at": time.time()}
+        _write_atomic(self._path("requests", self.request_key(url, params)), json.dumps(entry).encode("utf-8"))
+
+# -------------------- Concurrent Fetching --------------------
+
+def _params_list(params):
+    """Query parameters as a list of pairs (FHIR searches repeat keys such as _include)."""
+    return list(params.items()) if isinstance(params, dict) else list(params or [])
+
+class RateLimiter:
+    """asyncio counterpart of geocoding.TokenBucket: wait() returns when the next request may start."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+class Fetcher:
+    """
+    JSON GETs for one API: at most `concurrency` requests in flight, at most `rate` started per second (None: no
+    limit), transient failures retried with exponential backoff, bodies served from / stored in `cache`.
+    Create it inside the running event loop; close() releases its threads.
+    """
+
+    def __init__(self, cache=None, concurrency=8, rate=None, timeout=30, max_retries=3, backoff=1.0, headers=None):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.headers = headers or {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rate) if rate else None
+        # A pool of its own: asyncio's default executor has too few threads on small machines
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.local = threading.local()
+        self.stats = {"fetched": 0, "cached": 0, "failed": 0}
+
+    def _get(self, url, params):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers.update({"Accept": "application/json", **self.headers})
+        response = session.get(url, params=params, timeout=self.timeout)
+        if response.status_code in TRANSIENT_STATUS:
+            raise EnrichmentError(f"HTTP {response.status_code} from {response.url}")
+        response.raise_for_status()
+        return response.content
+
+    async def get_json(self, url, params=None):
+        params = _params_list(params)
+        if self.cache is not None:
+            body = self.cache.get(url, params)
+            if body is not None:
+                self.stats["cached"] += 1
+                return json.loads(body)
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                if self.limiter is not None:
+                    await self.limiter.wait()
+                try:
+                    body = await loop.run_in_executor(self.executor, self._get, url, params)
+                    break
+                except (EnrichmentError, requests.ConnectionError, requests.Timeout):
+                    if attempt == self.max_retries:
+                        self.stats["failed"] += 1
+                        raise
+                    await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+                except requests.RequestException:
+                    self.stats["failed"] += 1
+                    raise
+        data = json.loads(body)
+        self.stats["fetched"] += 1
+        if self.cache is not None:
+            self.cache.put(url, params, body)
+        return data
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def _run(fetch, **options):
+    """Run `fetch(fetcher)` on a fresh event loop with a Fetcher built from options; returns its result."""
+    cache_dir = options.pop("cache_dir", ENRICHMENT_CACHE_DIR)
+    ttl_days = options.pop("ttl_days", DEFAULT_TTL_DAYS)
+    cache = ResponseCache(cache_dir, ttl_days) if cache_dir else None
+
+    async def main():
+        fetcher = Fetcher(cache, **options)
+        try:
+            return await fetch(fetcher), fetcher.stats
+        finally:
+            fetcher.close()
+
+    return asyncio.run(main())
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _valid_npis(npis):
+    """Distinct NPIs that pass the Luhn check (others can't be in either registry), as strings."""
+    npis = pd.Series(pd.unique(pd.Series(list(npis), dtype="string").dropna()), dtype="string")
+    return npis[npi_valid_column(npis)].tolist()
+
+# -------------------- NPPES NPI Registry --------------------
+
+def parse_nppes_result(result):
+    """Flatten one NPI Registry result into a row of NPPES_COLUMNS (primary taxonomy, practice location phone)."""
+    basic = result.get("basic") or {}
+    taxonomies = result.get("taxonomies") or [{}]
+    primary = next((t for t in taxonomies if t.get("primary")), taxonomies[0])
+    location = next((a for a in result.get("addresses") or [] if a.get("address_purpose") == "LOCATION"), {})
+    return {
+        "npi": str(result.get("number")),
+        "nppes_enumeration_type": result.get("enumeration_type"),
+        "nppes_status": basic.get("status"),
+        "nppes_enumeration_date": basic.get("enumeration_date"),
+        "nppes_last_updated": basic.get("last_updated"),
+        "nppes_taxonomy_code": primary.get("code"),
+        "nppes_taxonomy_desc": primary.get("desc"),
+        "nppes_license_state": primary.get("state"),
+        "nppes_license": primary.get("license"),
+        "nppes_phone": location.get("telephone_number"),
+    }
+
+def fetch_nppes(npis, url=NPPES_API_URL, batch_size=1000, concurrency=8, rate=10.0, **options):
+    """
+    Look up NPIs in the NPPES NPI Registry. The registry answers one NPI per request, so NPIs are submitted in
+    batches of `batch_size` and each batch is fetched concurrently (see Fetcher for concurrency, rate and the
+    cache options cache_dir / ttl_days). NPIs the registry doesn't know, or that failed, are left out.
+    Returns a DataFrame of NPPES_COLUMNS, one row per NPI.
+    """
+    npis = _valid_npis(npis)
+
+    async def fetch(fetcher):
+        rows = []
+        for number, batch in enumerate(_batches(npis, batch_size)):
+            params = [[("version", NPPES_API_VERSION), ("number", npi)] for npi in batch]
+            responses = await asyncio.gather(*(fetcher.get_json(url, p) for p in params), return_exceptions=True)
+            for response in responses:
+                if not isinstance(response, Exception):
+                    rows.extend(parse_nppes_result(result) for result in response.get("results") or [])
+            if number % 10 == 9:
+                print(f"  NPPES: {min((number + 1) * batch_size, len(npis)):,}/{len(npis):,} NPIs")
+        return rows
+
+    rows, stats = _run(fetch, concurrency=concurrency, rate=rate, **options)
+    print(f"NPPES: {len(npis):,} NPIs, {stats['fetched']:,} fetched, {stats['cached']:,} cached, "
+          f"{stats['failed']:,} failed, {len(rows):,} found")
+    df = pd.DataFrame(rows, columns=NPPES_COLUMNS).drop_duplicates("npi")
+    df["nppes_phone"] = normalize_phone_column(df["nppes_phone"])
+    return df.reset_index(drop=True)
+
+# -------------------- Plan-Net (FHIR) --------------------
+
+def _reference(reference):
+    """'Type/id' of a FHIR reference, relative or absolute."""
+    return "/".join(reference.rstrip("/").split("/")[-2:]) if reference else None
+
+def _npi_identifier(identifiers):
+    for identifier in identifiers or []:
+        if identifier.get("system") == NPI_SYSTEM and identifier.get("value"):
+            return str(identifier["value"])
+    return None
+
+def next_link(bundle):
+    return next((link.get("url") for link in bundle.get("link") or [] if link.get("relation") == "next"), None)
+
+async def fhir_pages(fetcher, url, params=None):
+    """Async generator over the Bundles of a FHIR search, requesting each next page only once the last is consumed."""
+    while url:
+        bundle = await fetcher.get_json(url, params)
+        yield bundle
+        url, params = next_link(bundle), None
+
+def parse_plan_net_bundle(bundle, practitioner_npis, network_names):
+    """
+    Network memberships in one PractitionerRole search page, as (practitioner, network reference, display)
+    tuples. The practitioner is its NPI when the reference carries one, else a Practitioner reference resolved
+    later through `practitioner_npis`; included Practitioner and Organization resources are added to the
+    practitioner_npis / network_names lookups, as includes may arrive on a different page than the roles.
+    """
+    memberships = []
+    for entry in bundle.get("entry") or []:
+        resource = entry.get("resource") or {}
+        kind = resource.get("resourceType")
+        if kind == "Practitioner":
+            npi = _npi_identifier(resource.get("identifier"))
+            if npi:
+                practitioner_npis[f"Practitioner/{resource.get('id')}"] = npi
+        elif kind == "Organization":
+            network_names[f"Organization/{resource.get('id')}"] = resource.get("name")
+        elif kind == "PractitionerRole" and resource.get("active", True):
+            practitioner = resource.get("practitioner") or {}
+            key = _npi_identifier([practitioner.get("identifier") or {}]) or _reference(practitioner.get("reference"))
+            for extension in resource.get("extension") or []:
+                if extension.get("url") == NETWORK_EXTENSION:
+                    network = extension.get("valueReference") or {}
+                    memberships.append((key, _reference(network.get("reference")), network.get("display")))
+    return memberships
+
+def fetch_plan_net(npis, endpoints, batch_size=50, page_size=100, concurrency=4, rate=5.0, **options):
+    """
+    Network memberships of NPIs from Plan-Net FHIR endpoints ({payer name: base URL}). Each search asks for
+    `batch_size` NPIs at once (practitioner.identifier takes a comma-separated list), includes the practitioners
+    and networks, and is paged through as a stream; the searches of one endpoint run concurrently under its own
+    concurrency and rate caps (see Fetcher; cache options cache_dir / ttl_days).
+    Returns a DataFrame of PLAN_NET_COLUMNS, one row per (NPI, payer, network).
+    """
+    npis = _valid_npis(npis)
+    frames = []
+    for payer, base_url in endpoints.items():
+        url = base_url.rstrip("/") + "/PractitionerRole"
+
+        async def search(fetcher, batch, practitioner_npis, network_names):
+            params = [("practitioner.identifier", ",".join(f"{NPI_SYSTEM}|{npi}" for npi in batch)),
+                      ("_include", "PractitionerRole:practitioner"), ("_include", "PractitionerRole:network"),
+                      ("_count", str(page_size))]
+            memberships = []
+            try:
+                async for bundle in fhir_pages(fetcher, url, params):
+                    memberships.extend(parse_plan_net_bundle(bundle, practitioner_npis, network_names))
+            except (EnrichmentError, requests.RequestException, ValueError) as e:
+                print(f"  {payer}: search of {len(batch)} NPIs stopped: {e}")
+            return memberships
+
+        async def fetch(fetcher):
+            practitioner_npis, network_names = {}, {}
+            results = await asyncio.gather(*(search(fetcher, batch, practitioner_npis, network_names)
+                                             for batch in _batches(npis, batch_size)))
+            rows = []
+            for memberships in results:
+                for practitioner, network, display in memberships:
+                    npi = practitioner_npis.get(practitioner, practitioner)
+                    rows.append((npi, payer, network, network_names.get(network) or display or network))
+            return rows
+
+        rows, stats = _run(fetch, concurrency=concurrency, rate=rate, **options)
+        print(f"Plan-Net {payer}: {stats['fetched']:,} pages fetched, {stats['cached']:,} cached, "
+              f"{stats['failed']:,} failed, {len(rows):,} network memberships")
+        frames.append(pd.DataFrame(rows, columns=PLAN_NET_COLUMNS))
+    if not frames:
+        return pd.DataFrame(columns=PLAN_NET_COLUMNS)
+    df = pd.concat(frames, ignore_index=True)
+    # Only memberships of the requested NPIs (a practitioner reference that never resolved is dropped here)
+    df = df[df["npi"].isin(npis) & df["network_id"].notna()]
+    return df.drop_duplicates().reset_index(drop=True)
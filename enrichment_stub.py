@@ -0,0 +1,145 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from enrichment import NPI_SYSTEM, NETWORK_EXTENSION
+
+# -------------------- Local NPPES / Plan-Net Stub --------------------
+# A deterministic stand-in for the NPI Registry (GET /nppes/api/) and a Plan-Net FHIR server
+# (GET /fhir/PractitionerRole), for exercising the enrichment loaders without network access or API keys:
+#   python enrichment_stub.py --port 8800
+#   python data_loader.py --nppes-url http://127.0.0.1:8800/nppes/api/ --plan-net Stub=http://127.0.0.1:8800/fhir
+# Every valid NPI except roughly one in ten is known, with a taxonomy and 1-3 network memberships derived from a
+# hash of the NPI, so repeated runs see the same data.
+
+TAXONOMIES = [
+    ("207Q00000X", "Family Medicine"), ("207R00000X", "Internal Medicine"), ("207RC0000X", "Cardiovascular Disease"),
+    ("208000000X", "Pediatrics"), ("363LF0000X", "Nurse Practitioner, Family"), ("225100000X", "Physical Therapist"),
+]
+STATES = ["CA", "TX", "NY", "FL", "PA", "IL", "OH", "MA"]
+
+def _hash(npi):
+    return int(hashlib.md5(npi.encode("ascii")).hexdigest()[:12], 16)
+
+def _known(npi):
+    return npi.isdigit() and len(npi) == 10 and _hash(npi) % 10 != 0
+
+def nppes_response(npi):
+    if not _known(npi):
+        return {"result_count": 0, "results": []}
+    h = _hash(npi)
+    code, desc = TAXONOMIES[h % len(TAXONOMIES)]
+    state = STATES[(h >> 4) % len(STATES)]
+    return {"result_count": 1, "results": [{
+        "number": npi,
+        "enumeration_type": "NPI-1",
+        "basic": {"status": "A", "enumeration_date": f"20{(h >> 8) % 20:02d}-01-15", "last_updated": "2024-06-01"},
+        "addresses": [
+            {"address_purpose": "MAILING", "telephone_number": "800-555-0100"},
+            {"address_purpose": "LOCATION", "telephone_number": f"{200 + h % 700}-555-{h % 10000:04d}"},
+        ],
+        "taxonomies": [{"code": code, "desc": desc, "primary": True, "state": state, "license": f"L{h % 100000}"}],
+    }]}
+
+def network_memberships(npi, networks):
+    """Indexes of the networks a (known) NPI belongs to."""
+    h = _hash(npi)
+    return sorted({(h // 7 + i * 7919) % networks for i in range(1 + h % 3)})
+
+def plan_net_bundle(base_url, query, networks):
+    """One page of a PractitionerRole search by practitioner.identifier, with practitioners and networks included."""
+    values = dict(query).get("practitioner.identifier", "")
+    npis = [value.split("|")[-1] for value in values.split(",") if value]
+    count = int(dict(query).get("_count", 20))
+    offset = int(dict(query).get("_offset", 0))
+    roles = [(npi, network) for npi in npis if _known(npi) for network in network_memberships(npi, networks)]
+    page = roles[offset:offset + count]
+    entries = []
+    for npi, network in page:
+        entries.append({"fullUrl": f"{base_url}/PractitionerRole/{npi}-{network}", "search": {"mode": "match"},
+                        "resource": {"resourceType": "PractitionerRole", "id": f"{npi}-{network}", "active": True,
+                                     "practitioner": {"reference": f"Practitioner/{npi}"},
+                                     "extension": [{"url": NETWORK_EXTENSION,
+                                                    "valueReference": {"reference": f"Organization/net{network}"}}]}})
+    for npi in sorted({npi for npi, _ in page}):
+        entries.append({"search": {"mode": "include"},
+                        "resource": {"resourceType": "Practitioner", "id": npi,
+                                     "identifier": [{"system": NPI_SYSTEM, "value": npi}]}})
+    for network in sorted({network for _, network in page}):
+        entries.append({"search": {"mode": "include"},
+                        "resource": {"resourceType": "Organization", "id": f"net{network}",
+                                     "name": f"Stub Network {network:03d}"}})
+    bundle = {"resourceType": "Bundle", "type": "searchset", "total": len(roles),
+              "link": [{"relation": "self", "url": f"{base_url}/PractitionerRole?{urlencode(query)}"}], "entry": entries}
+    if offset + count < len(roles):
+        following = [(k, v) for k, v in query if k != "_offset"] + [("_offset", str(offset + count))]
+        bundle["link"].append({"relation": "next", "url": f"{base_url}/PractitionerRole?{urlencode(following)}"})
+    return bundle
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, {"error": "simulated outage"})
+            return
+        parts = urlsplit(self.path)
+        query = parse_qsl(parts.query)
+        if parts.path.rstrip("/") == "/nppes/api":
+            self._send(200, nppes_response(dict(query).get("number", "")))
+        elif parts.path == "/fhir/PractitionerRole":
+            base_url = f"http://{self.headers.get('Host')}/fhir"
+            self._send(200, plan_net_bundle(base_url, query, server.networks))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_stub_server(port=0, networks=20, latency=0.0, error_rate=0.0):
+    """The stub server bound to 127.0.0.1:port (0: any free port); server.request_count counts the requests served."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.networks, server.latency, server.error_rate = networks, latency, error_rate
+    server.request_count, server.lock = 0, threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    return server
+
+def start_stub_server(**options):
+    """Serve the stub on a background thread (see make_stub_server for the options); returns the server."""
+    server = make_stub_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local NPPES / Plan-Net stub for testing the enrichment loaders.")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--networks", type=int, default=20, help="Number of distinct networks")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of simulated latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    args = parser.parse_args()
+
+    server = make_stub_server(args.port, args.networks, args.latency, args.error_rate)
+    print(f"NPPES stub:    {server.base_url}/nppes/api/")
+    print(f"Plan-Net stub: {server.base_url}/fhir")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+
+# -------------------- Facets --------------------
+# A facet is a set of values (specialties, states, credentials, ...) with one bitmap per value: bit i is set when
+# snapshot row i has that value. Bitmaps are rows of a (values x words) uint64 matrix, so selecting values is an OR
+# of their rows, combining facets an AND, and the number of matches of every value under the other selections is
+# a popcount of (value row & mask): word-level operations over 1/64th of the table, with no group-by.
+
+# Facet name -> source columns (case-insensitive; the first present one is used, except for secondary specialties,
+# where a row has a value if any of the columns holds it)
+FACET_COLUMNS = {
+    "pri_spec": ["pri_spec"],
+    "sec_spec": ["sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"],
+    "st": ["st"],
+    "telehlth": ["telehlth", "is_telehealth"],
+    "assgn": ["assgn"],
+    "cred": ["cred"],
+    "pri_spec_code": ["pri_spec_code"],     # NUCC codes: taxonomy grouping selections are ORs of these
+}
+MULTI_COLUMN_FACETS = {"sec_spec"}
+
+# Sidebar / build_query filter names for each facet (groupings select pri_spec_code values through the taxonomy)
+FACET_FILTERS = {
+    "specialties": "pri_spec",
+    "secondary_specialties": "sec_spec",
+    "states": "st",
+    "telehealth": "telehlth",
+    "assignment": "assgn",
+    "credentials": "cred",
+}
+
+# Values whose bitmaps are combined at a time when counting (bounds the temporary values x words matrix)
+COUNT_BLOCK = 32
+
+def word_count(rows):
+    return (rows + 63) // 64
+
+def pack_mask(mask):
+    """Boolean row mask -> bitmap words (bit i of the little-endian bit string is row i)."""
+    packed = np.packbits(mask, bitorder="little")
+    padded = np.zeros(word_count(len(mask)) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+def unpack_words(words, rows):
+    """Bitmap words -> boolean row mask of length rows."""
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), count=rows, bitorder="little").view(bool)
+
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+def popcount(words):
+    """Number of set bits in each row (last axis) of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    # numpy < 2.0: count the bits of each byte through a lookup table
+    return _BYTE_BITS[np.ascontiguousarray(words).view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+# -------------------- Building --------------------
+
+def facet_sources(columns):
+    """{facet: [column names]} for the facets whose columns are among `columns` (matched case-insensitively)."""
+    by_lower = {col.lower(): col for col in columns}
+    sources = {}
+    for facet, candidates in FACET_COLUMNS.items():
+        present = [by_lower[col] for col in candidates if col in by_lower]
+        if present:
+            sources[facet] = present if facet in MULTI_COLUMN_FACETS else present[:1]
+    return sources
+
+def write_facets(out_dir, rows, codes, categories):
+    """
+    Write one bitmap matrix per facet (facet_<name>.npy, values x words) from the snapshot's dictionary-encoded
+    columns: `codes` maps column -> int16 codes (-1 missing), `categories` column -> sorted values.
+    Returns {facet: sorted values} for the snapshot metadata.
+    """
+    facets = {}
+    for facet, columns in facet_sources(list(codes)).items():
+        values = sorted({value for col in columns for value in categories[col]}, key=str)
+        position = {value: i for i, value in enumerate(values)}
+        # Each column's codes translated to positions in the facet's value list (-1 stays missing)
+        mapped = [np.append(np.array([position[v] for v in categories[col]], dtype=np.int32), -1)[np.asarray(codes[col])]
+                  for col in columns]
+        bitmaps = np.lib.format.open_memmap(os.path.join(out_dir, f"facet_{facet}.npy"), mode="w+", dtype=np.uint64,
+                                            shape=(len(values), word_count(rows)))
+        for i in range(len(values)):
+            mask = mapped[0] == i
+            for more in mapped[1:]:
+                mask |= more == i
+            bitmaps[i] = pack_mask(mask)
+        bitmaps.flush()
+        del bitmaps
+        facets[facet] = values
+    return facets
+
+# -------------------- Querying --------------------
+
+class FacetIndex:
+    """Memory-mapped facet bitmaps of a snapshot (see write_facets); `values` maps facet -> its sorted values."""
+
+    def __init__(self, path, values, rows):
+        self.rows = rows
+        self.words = word_count(rows)
+        self.values = values
+        self._position = {facet: {value: i for i, value in enumerate(vals)} for facet, vals in values.items()}
+        self._bitmaps = {facet: np.load(os.path.join(path, f"facet_{facet}.npy"), mmap_mode="r") for facet in values}
+
+    def all_rows(self):
+        words = np.full(self.words, np.iinfo(np.uint64).max, dtype=np.uint64)
+        if self.rows % 64:
+            words[-1] = np.uint64((1 << (self.rows % 64)) - 1)
+        return words
+
+    def selection_words(self, facet, selected):
+        """OR of the bitmaps of the selected values of one facet (values not in the facet match nothing)."""
+        lookup = self._position.get(facet, {})
+        positions = [lookup[value] for value in selected if value in lookup]
+        if not positions:
+            return np.zeros(self.words, dtype=np.uint64)
+        return np.bitwise_or.reduce(self._bitmaps[facet][sorted(positions)], axis=0)
+
+    def match_words(self, selections, base=None):
+        """AND over facets of their selections ({facet: values}; empty selections are skipped), within `base` words."""
+        words = self.all_rows() if base is None else base.copy()
+        for facet, selected in selections.items():
+            if selected:
+                words &= self.selection_words(facet, selected)
+        return words
+
+    def counts(self, facet, words):
+        """Matches of every value of a facet within `words`, as an int64 array aligned with self.values[facet]."""
+        bitmaps = self._bitmaps[facet]
+        counts = np.empty(len(bitmaps), dtype=np.int64)
+        for start in range(0, len(bitmaps), COUNT_BLOCK):
+            counts[start:start + COUNT_BLOCK] = popcount(bitmaps[start:start + COUNT_BLOCK] & words)
+        return counts
+
+    def facet_counts(self, selections, base=None, facets=None):
+        """
+        Live counts for a faceted sidebar: for each facet (default: all), {value: matches} under every *other*
+        facet's selection (and `base`), so a facet's own counts don't collapse to its selected values.
+        """
+        result = {}
+        for facet in facets or self.values:
+            if facet not in self.values:
+                continue
+            others = {name: selected for name, selected in selections.items() if name != facet}
+            words = self.match_words(others, base)
+            result[facet] = dict(zip(self.values[facet], self.counts(facet, words).tolist()))
+        return result
@@ -0,0 +1,238 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# Bundled ZIP centroid table (zip, city, state, county, lat, lon) so geocoding needs no network access
+ZIP_CENTROIDS_PATH = os.path.join(os.getcwd(), "zip_centroids.csv")
+
+_zip_centroids = None
+
+# -------------------- ZIP Centroid Table --------------------
+
+def load_zip_centroids(path=ZIP_CENTROIDS_PATH):
+    """Load the ZIP centroid table once per process, indexed by 5-digit ZIP."""
+    global _zip_centroids
+    if _zip_centroids is None:
+        df = pd.read_csv(path, dtype={"zip": str, "city": str, "state": str, "county": str})
+        df["city_key"] = df["city"].str.upper()
+        _zip_centroids = df.set_index("zip")
+    return _zip_centroids
+
+def zip5(zip_codes):
+    """Reduce a Series of raw ZIP values (5 or 9 digits, possibly with a dash) to 5-digit ZIPs."""
+    return zip_codes.astype("string").str.extract(r"^\s*(\d{5})", expand=False)
+
+def geocode_zip_column(zip_codes):
+    """
+    Look up latitude/longitude for a Series of ZIP codes from the centroid table.
+    Returns a tuple of two float Series (lat, lon) aligned with the input; unknown ZIPs are NaN.
+    """
+    centroids = load_zip_centroids()
+    keys = zip5(zip_codes)
+    lat = keys.map(centroids["lat"]).astype(float)
+    lon = keys.map(centroids["lon"]).astype(float)
+    return lat, lon
+
+# -------------------- User Input Geocoding --------------------
+
+def geocode_address(location: str):
+    """
+    Resolve a user-entered location ("10001", "Boston, MA", "Boston") to (latitude, longitude).
+    ZIPs map to their centroid; city names map to the mean centroid of the city's ZIPs.
+    Returns (None, None) if the location cannot be resolved.
+    """
+    if not location or not location.strip():
+        return None, None
+    centroids = load_zip_centroids()
+    text = location.strip()
+    zip_match = re.search(r"\b(\d{5})(?:-?\d{4})?\b", text)
+    if zip_match:
+        if zip_match.group(1) in centroids.index:
+            row = centroids.loc[zip_match.group(1)]
+            return float(row["lat"]), float(row["lon"])
+        return None, None
+    # "City, ST" or "City ST" -> restrict to that state; otherwise pick the state where the city has the most ZIPs
+    city_match = re.match(r"^(.*?)[,\s]+([A-Za-z]{2})$", text)
+    matches = centroids.iloc[0:0]
+    if city_match:
+        city, state = city_match.group(1).strip().upper(), city_match.group(2).upper()
+        matches = centroids[(centroids["city_key"] == city) & (centroids["state"] == state)]
+    if matches.empty:
+        matches = centroids[centroids["city_key"] == text.rstrip(",").upper()]
+        if not matches.empty:
+            matches = matches[matches["state"] == matches["state"].value_counts().idxmax()]
+    if matches.empty:
+        return None, None
+    return float(matches["lat"].mean()), float(matches["lon"].mean())
+
+# -------------------- Address Geocoding --------------------
+# Street-level geocoding of full_address strings through a pluggable backend. Addresses are deduplicated
+# (clinicians at one practice share an address), results are kept in an on-disk SQLite cache, and misses are
+# resolved by a thread pool behind a token-bucket rate limiter, so re-runs only touch new addresses.
+
+GEOCODE_CACHE_PATH = os.path.join(os.getcwd(), "geocode_cache.db")
+
+class GeocodeError(Exception):
+    """Transient backend failure (timeout, throttling, 5xx); the request is retried with backoff."""
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a token is available; tokens refill at `rate` per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class ZipCentroidBackend:
+    """
+    Offline stand-in backend: resolves an address to the centroid of the ZIP code it ends with.
+    Needs no network access and no rate limit, which makes it suitable for tests and for seeding the cache.
+    """
+    name = "zip_centroid"
+    rate = None
+
+    def geocode(self, address):
+        match = re.search(r"(\d{5})(?:-?\d{4})?\s*$", address)
+        centroids = load_zip_centroids()
+        if not match or match.group(1) not in centroids.index:
+            return None
+        row = centroids.loc[match.group(1)]
+        return float(row["lat"]), float(row["lon"])
+
+class NominatimBackend:
+    """OpenStreetMap Nominatim via geopy (optional dependency); the public service allows one request per second."""
+    name = "nominatim"
+    rate = 1.0
+
+    def __init__(self, user_agent="physician_compare_geocoder", timeout=10):
+        from geopy.geocoders import Nominatim
+        from geopy.exc import GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.transient_errors = (GeocoderTimedOut, GeocoderUnavailable, GeocoderServiceError)
+
+    def geocode(self, address):
+        try:
+            location = self.geolocator.geocode(address)
+        except self.transient_errors as e:
+            raise GeocodeError(str(e)) from e
+        return (location.latitude, location.longitude) if location else None
+
+GEOCODE_BACKENDS = {"local": ZipCentroidBackend, "nominatim": NominatimBackend}
+
+def normalize_address_key(addresses):
+    """Cache key for a Series of addresses: uppercase with runs of whitespace collapsed."""
+    return addresses.astype("string").str.upper().str.replace(r"\s+", " ", regex=True).str.strip()
+
+class GeocodeCache:
+    """
+    SQLite cache of geocoding results keyed by normalized address. Addresses the backend could not find are
+    stored with NULL coordinates so they are not retried; addresses that failed with errors are not stored.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                address TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                backend TEXT,
+                geocoded_at TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def lookup(self, keys):
+        """Cached (lat, lon) for the given keys, as a DataFrame indexed by address (only cached keys appear)."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_keys (address TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM lookup_keys")
+        self.conn.executemany("INSERT OR IGNORE INTO lookup_keys VALUES (?)", ((key,) for key in keys))
+        return pd.read_sql_query(
+            "SELECT c.address, c.lat, c.lon FROM geocode_cache c JOIN lookup_keys USING (address)",
+            self.conn, index_col="address")
+
+    def store(self, results, backend_name):
+        """Upsert (address, lat, lon) results and commit, so an interrupted run resumes from this point."""
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?, ?)",
+            [(address, lat, lon, backend_name, now) for address, lat, lon in results])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def _resolve(backend, bucket, address, max_retries, backoff):
+    """Geocode one address with rate limiting and exponential backoff; returns (address, lat, lon) or None on failure."""
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            coords = backend.geocode(address)
+            return (address, *coords) if coords else (address, None, None)
+        except GeocodeError as e:
+            if attempt == max_retries:
+                print(f"Error geocoding '{address}': {e}")
+                return None
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+def geocode_addresses(addresses, backend=None, cache_path=GEOCODE_CACHE_PATH, rate=None, max_workers=4,
+                      max_retries=3, backoff=1.0, checkpoint_every=500):
+    """
+    Geocode the distinct values of a Series of full addresses.
+    Cached addresses are served from the cache; the rest go to `backend` (default: ZipCentroidBackend) through
+    max_workers threads, at most `rate` requests/second (default: the backend's own limit), and are checkpointed
+    into the cache every `checkpoint_every` addresses.
+    Returns a DataFrame of lat/lon indexed by normalized address key.
+    """
+    backend = backend or ZipCentroidBackend()
+    rate = rate or backend.rate
+    keys = normalize_address_key(addresses).dropna().unique()
+    keys = [key for key in keys if key]
+    cache = GeocodeCache(cache_path)
+    try:
+        found = cache.lookup(keys)
+        misses = [key for key in keys if key not in found.index]
+        print(f"Geocoding {len(keys):,} unique addresses: {len(found):,} cached, {len(misses):,} to resolve")
+        bucket = TokenBucket(rate) if rate else None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for start in range(0, len(misses), checkpoint_every):
+                batch = misses[start:start + checkpoint_every]
+                results = executor.map(lambda key: _resolve(backend, bucket, key, max_retries, backoff), batch)
+                results = [r for r in results if r is not None]
+                cache.store(results, backend.name)
+                done = min(start + checkpoint_every, len(misses))
+                if done == len(misses) or (start // checkpoint_every) % 10 == 9:
+                    print(f"  {done:,}/{len(misses):,} addresses resolved")
+        return cache.lookup(keys)
+    finally:
+        cache.close()
+
+def geocode_address_column(addresses, **kwargs):
+    """
+    Geocode a Series of full addresses (see geocode_addresses for the options).
+    Returns a tuple of two float Series (lat, lon) aligned with the input; unresolved addresses are NaN.
+    """
+    coords = geocode_addresses(addresses, **kwargs)
+    keys = normalize_address_key(addresses)
+    return keys.map(coords["lat"]).astype(float), keys.map(coords["lon"]).astype(float)
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# JSON-lines file every finished trace is appended to (unset: no log)
+METRICS_LOG_ENV = "PROVIDER_METRICS_LOG"
+
+# Recent durations kept per (trace, span, filter type) for the p50/p95 summaries
+LATENCY_WINDOW = 1000
+QUANTILES = [0.5, 0.95]
+
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024) if hasattr(os, "sysconf") else None
+
+def current_rss_mb():
+    """Current resident set size of this process in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, TypeError):
+        return None
+
+# -------------------- Spans and Traces --------------------
+
+class Span:
+    """One timed stage: duration, optional row count, RSS change and free-form attributes."""
+
+    def __init__(self, name, depth, attrs):
+        self.name = name
+        self.depth = depth
+        self.attrs = attrs
+        self.rows = None
+        self.seconds = None
+        self.rss_delta_mb = None
+
+    def as_dict(self):
+        record = {"name": self.name, "depth": self.depth, "seconds": round(self.seconds, 6)}
+        if self.rows is not None:
+            record["rows"] = int(self.rows)
+        if self.rss_delta_mb is not None:
+            record["rss_delta_mb"] = round(self.rss_delta_mb, 2)
+        if self.attrs:
+            record["attrs"] = self.attrs
+        return record
+
+class Trace:
+    """
+    The spans recorded during one unit of work (a Streamlit rerun, an API request, a database build), in the
+    order they started. `labels` classify the trace for the latency summaries, e.g. its filter_type.
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.spans = []
+        self.depth = 0
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+
+    def as_dict(self):
+        return {"time": datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+                "trace": self.name, "labels": self.labels, "seconds": round(self.seconds, 6),
+                "spans": [span.as_dict() for span in self.spans]}
+
+    def report(self):
+        """
+        Plain-text breakdown for CLI output, indented by nesting. Repeated stages (e.g. one span per chunk) are
+        summed into one line with their call count.
+        """
+        stages = {}
+        for span in self.spans:
+            if span.seconds is None:
+                continue
+            calls, seconds, rows, rss = stages.get((span.depth, span.name), (0, 0.0, None, None))
+            if span.rows is not None:
+                rows = (rows or 0) + span.rows
+            if span.rss_delta_mb is not None:
+                rss = (rss or 0.0) + span.rss_delta_mb
+            stages[(span.depth, span.name)] = (calls + 1, seconds + span.seconds, rows, rss)
+        lines = [f"{self.name}: {self.seconds:,.2f}s"]
+        for (depth, name), (calls, seconds, rows, rss) in stages.items():
+            extra = f" x{calls:,}" if calls > 1 else ""
+            extra += f", {rows:,} rows" if rows is not None else ""
+            extra += f", RSS {rss:+,.1f} MB" if rss is not None else ""
+            lines.append(f"  {'  ' * depth}{name}: {seconds:,.2f}s{extra}")
+        return "\n".join(lines)
+
+_current = contextvars.ContextVar("instrumentation_trace", default=None)
+
+def current_trace():
+    return _current.get()
+
+def start_trace(name, **labels):
+    """Start a trace and make it current for this thread / task (spans elsewhere are recorded into it)."""
+    trace = Trace(name, labels)
+    _current.set(trace)
+    return trace
+
+def finish_trace(trace):
+    """Stop the trace, feed it to the process-wide METRICS and append it to the JSON-lines log if configured."""
+    if trace.seconds is None:
+        trace.seconds = time.perf_counter() - trace._start
+    if _current.get() is trace:
+        _current.set(None)
+    METRICS.observe(trace)
+    log_trace(trace)
+    return trace
+
+@contextmanager
+def trace(name, **labels):
+    """Context-manager form of start_trace / finish_trace; restores any enclosing trace afterwards."""
+    token = _current.set(None)
+    current = start_trace(name, **labels)
+    try:
+        yield current
+    finally:
+        finish_trace(current)
+        _current.reset(token)
+
+def label(**labels):
+    """Add labels to the current trace (e.g. the filter type, once the filters are known)."""
+    current = _current.get()
+    if current is not None:
+        current.labels.update(labels)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a stage of the current trace. The yielded Span takes a row count (`span.rows = len(df)`). Without a
+    current trace the block still runs, unrecorded.
+    """
+    current = _current.get()
+    if current is None:
+        yield Span(name, 0, attrs)
+        return
+    record = Span(name, current.depth, attrs)
+    current.spans.append(record)
+    current.depth += 1
+    rss = current_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        current.depth -= 1
+        if rss is not None:
+            record.rss_delta_mb = current_rss_mb() - rss
+
+def timed(name=None, rows=None):
+    """
+    Decorator recording each call as a span named `name` (default: module.function). `rows` maps the return
+    value to a row count, e.g. timed(rows=len).
+    """
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(span_name) as record:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    record.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+def filter_type(filters):
+    """Label for a filter combination, e.g. "search+states" or "none" (center and radius count as "radius")."""
+    names = {"search_query": "search", "center": "radius", "radius": "radius", "zip_code": "zip"}
+    active = sorted({names.get(key, key) for key, value in filters.items() if value})
+    return "+".join(active) or "none"
+
+# -------------------- Metrics Export --------------------
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+class Metrics:
+    """
+    Process-wide latency statistics: per (trace, span, filter type), the last LATENCY_WINDOW durations for
+    quantiles plus running totals for Prometheus' _count and _sum. The whole trace is recorded as span "total".
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._totals = {}
+
+    def _add(self, key, seconds):
+        recent = self._recent.get(key)
+        if recent is None:
+            recent = self._recent[key] = deque(maxlen=self.window)
+        recent.append(seconds)
+        count, total = self._totals.get(key, (0, 0.0))
+        self._totals[key] = (count + 1, total + seconds)
+
+    def observe(self, trace):
+        kind = trace.labels.get("filter_type", "none")
+        with self._lock:
+            self._add((trace.name, "total", kind), trace.seconds)
+            # Nested calls to the same stage are summed, so a span is counted once per trace
+            stages = {}
+            for span in trace.spans:
+                if span.seconds is not None:
+                    stages[span.name] = stages.get(span.name, 0.0) + span.seconds
+            for name, seconds in stages.items():
+                self._add((trace.name, name, kind), seconds)
+
+    def summary(self, trace_name=None, span_name=None):
+        """Rows of {trace, span, filter_type, count, p50_ms, p95_ms}, sorted by trace, span and filter type."""
+        with self._lock:
+            items = [(key, list(recent), self._totals[key][0]) for key, recent in self._recent.items()]
+        rows = []
+        for (name, stage, kind), recent, count in sorted(items):
+            if (trace_name and name != trace_name) or (span_name and stage != span_name):
+                continue
+            rows.append({"trace": name, "span": stage, "filter_type": kind, "count": count,
+                         "p50_ms": _quantile(recent, 0.5) * 1000, "p95_ms": _quantile(recent, 0.95) * 1000})
+        return rows
+
+    def prometheus(self, metric="provider_span_seconds"):
+        """Prometheus text exposition: one summary per (trace, span, filter type) with p50/p95 quantiles."""
+        lines = [f"# HELP {metric} Duration of instrumented stages by trace, span and filter type.",
+                 f"# TYPE {metric} summary"]
+        with self._lock:
+            items = [(key, list(recent), self._totals[key]) for key, recent in self._recent.items()]
+        for (name, stage, kind), recent, (count, total) in sorted(items):
+            labels = f'trace="{name}",span="{stage}",filter_type="{kind}"'
+            for q in QUANTILES:
+                lines.append(f'{metric}{{{labels},quantile="{q}"}} {_quantile(recent, q):.6f}')
+            lines.append(f"{metric}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+_log_lock = threading.Lock()
+
+def log_trace(trace, path=None):
+    """Append the trace as one JSON line to `path` (default: $PROVIDER_METRICS_LOG; nothing if neither is set)."""
+    path = path or os.environ.get(METRICS_LOG_ENV)
+    if not path:
+        return
+    line = json.dumps(trace.as_dict(), default=str) + "\n"
+    with _log_lock, open(path, "a") as f:
+        f.write(line)
+
+def load_log(path):
+    """Rebuild Metrics from a JSON-lines trace log (e.g. one collected in production)."""
+    metrics = Metrics(window=sys.maxsize)
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            trace = Trace(record["trace"], record.get("labels", {}))
+            trace.seconds = record["seconds"]
+            for item in record.get("spans", []):
+                span = Span(item["name"], item.get("depth", 0), item.get("attrs", {}))
+                span.seconds = item["seconds"]
+                trace.spans.append(span)
+            metrics.observe(trace)
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a JSON-lines trace log: p50/p95 latency per filter type.")
+    parser.add_argument("log", help=f"Trace log written through ${METRICS_LOG_ENV}")
+    parser.add_argument("--trace", default=None, help="Only this trace name (e.g. rerun, api, build_database)")
+    parser.add_argument("--span", default="total", help="Span to summarize ('total' is the whole trace; '' for all)")
+    parser.add_argument("--prometheus", action="store_true", help="Print Prometheus text format instead of a table")
+    args = parser.parse_args()
+
+    metrics = load_log(args.log)
+    if args.prometheus:
+        print(metrics.prometheus(), end="")
+        return
+    print(f"{'trace':<24} {'span':<36} {'filter type':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in metrics.summary(args.trace, args.span or None):
+        print(f"{row['trace']:<24} {row['span']:<36} {row['filter_type']:<28} {row['count']:>7,} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
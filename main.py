@@ -1,230 +1,270 @@
+import re
 import streamlit as st
 import pandas as pd
-import numpy as np
-import sqlite3
-#from data_loader import geocode_address  # Reuse the existing geocoding function
+import provider_query as pq
+import snapshot
+import adequacy
+import pagination
+import taxonomy
+import instrumentation
+import networks
+from result_cache import ResultCache
+from geocoding import geocode_address  # Offline ZIP/city geocoding from the bundled ZIP centroid table
+from map_aggregation import map_points
+
+# --- Data Access and Caching ---
+@st.cache_resource
+def get_connection():
+    """Open a shared read-only connection to the provider database."""
+    return pq.connect(pq.DB_PATH)
+
+@st.cache_resource(max_entries=2)
+def load_snapshot(manifest_id):
+    """
+    Memory-map the columnar snapshot written by db_setup.py for one load of the database (shared by all sessions
+    and worker processes); None when the snapshot on disk belongs to another load.
+    """
+    snap = snapshot.load_snapshot(snapshot.SNAPSHOT_DIR)
+    return snap if snap is not None and snap.manifest_id == manifest_id else None
+
+def get_snapshot(manifest_id):
+    """
+    The snapshot of the current database load. Looked up by manifest id on every rerun, so a refresh switches
+    to its new snapshot (or to SQL until the snapshot is written) instead of serving rows of the old one.
+    """
+    snap = load_snapshot(manifest_id)
+    if snap is None:
+        # Don't remember a miss (db_setup.py writes the snapshot right after committing the load); only this
+        # load's entry is dropped, so sessions still on the other cached snapshot keep it
+        load_snapshot.clear(manifest_id)
+    return snap
 
-# --- Data Loading and Caching ---
 @st.cache_data
-def load_provider_data():
-    """Load provider data from the SQLite database and return as DataFrame."""
-    conn = sqlite3.connect('providers.db')
-    df = pd.read_sql("SELECT * FROM providers LIMIT 10000", conn)
-    conn.close()
-    # Rename columns for clarity (if applicable)
-    col_renames = {
-        'frst_nm': 'first_name',
-        'lst_nm': 'last_name',
-        'mid_nm': 'middle_name',
-        'cty': 'city',
-        'st': 'state',
-        'zip': 'zip_code',
-        'phn_numbr': 'phone',
-        'assgn': 'medicare_assignment',
-        'Is_Telehealth': 'telehealth'
-    }
-    df.rename(columns={k: v for k, v in col_renames.items() if k in df.columns}, inplace=True)
-    # If the data has separate name fields, create a full name for easy display/search
-    if 'first_name' in df.columns and 'last_name' in df.columns:
-        df['provider_name'] = df['first_name'].str.strip() + " " + df['last_name'].str.strip()
-        df['provider_name'] = df['provider_name'].str.replace(r'\s+', ' ', regex=True)  # clean double spaces
-    else:
-        # If there's already a combined name field, use it
-        df['provider_name'] = df.get('provider_name', df.get('name'))
-    return df
+def load_filter_options(manifest_id):
+    """
+    Load the distinct specialties, states and taxonomy groupings for the sidebar
+    (from the snapshot dictionaries, else their indexes).
+    """
+    snap = get_snapshot(manifest_id)
+    if snap is not None and snap.has_column('pri_spec') and snap.has_column('st'):
+        return snap.categories('pri_spec'), snap.categories('st'), snap.groupings()
+    conn = get_connection()
+    groupings = taxonomy.provider_groupings(conn) if taxonomy.has_taxonomy(conn) else []
+    return pq.distinct_values(conn, 'pri_spec'), pq.distinct_values(conn, 'st'), groupings
+
+@st.cache_data
+def load_network_options(manifest_id):
+    """Plan-Net networks for the sidebar as {network_id: "Name (payer)"}, empty when none were loaded."""
+    return dict(networks.network_options(get_connection()))
+
+@st.cache_data(max_entries=256)
+def load_facet_counts(manifest_id, signature, _snap):
+    """
+    Live sidebar counts for a filter signature (pq.filter_signature of the multiselect values), from the snapshot's
+    facet bitmaps: {filter name: {value: matches}} (see snapshot.ProviderSnapshot.facet_counts).
+    """
+    return _snap.facet_counts(**dict(signature))
+
+@st.cache_data(max_entries=256)
+def load_name_suggestions(manifest_id, text, _snap):
+    """'Did you mean' corrections of a search text from the snapshot's name trigram index (name_index.py)."""
+    return _snap.names.suggest(text)
+
+@st.cache_resource
+def get_result_cache():
+    """LRU of matching row ids per filter signature, shared by all sessions (see result_cache.py)."""
+    return ResultCache()
 
-# Load data
-providers_df = load_provider_data()
+def facet_multiselect(label, name, options, counts, format_func=str):
+    """Sidebar multiselect for one filter; with counts for it, every option shows its matches ("Cardiology (1,204)")."""
+    value_counts = counts.get(name)
+    if value_counts is not None:
+        plain = format_func
+        format_func = lambda value: f"{plain(value)} ({value_counts.get(value, 0):,})"
+    return st.sidebar.multiselect(label, options, key=f"filter_{name}", format_func=format_func)
+
+def set_search_query(text):
+    st.session_state.search_query = text
+
+def set_page_cursor(cursor):
+    st.session_state.page_cursor = cursor
+
+def jump_to_letter():
+    letter = st.session_state.page_letter
+    st.session_state.page_cursor = ("letter", letter) if letter else pagination.FIRST
+
+# Every rerun is one trace: the stages below (and the instrumented query functions they call) are timed into it
+rerun_trace = instrumentation.start_trace("rerun")
+
+conn = get_connection()
+location_columns = pq.table_columns(conn, 'locations')
+has_coordinates = 'lat' in location_columns and 'lon' in location_columns
+# Everything below reads the same load of the database: caches are keyed on its manifest id
+manifest_id = pq.load_manifest_id(conn)
+with instrumentation.span("filter_options"):
+    all_specialties, all_states, all_groupings = load_filter_options(manifest_id)
+snap = get_snapshot(manifest_id)
+facet_index = snap.facets if snap is not None else None
+network_labels = load_network_options(manifest_id)
+
+# Live facet counts come from the snapshot's per-value bitmaps. The multiselect values are read from session state
+# before the widgets are drawn, so the counts in their labels already reflect this rerun's selections.
+facet_filters = ['specialties', 'groupings', 'states', 'networks', 'secondary_specialties', 'credentials',
+                 'telehealth', 'assignment']
+counts = {}
+if facet_index is not None:
+    with instrumentation.span("facet_counts"):
+        selections = {name: st.session_state.get(f"filter_{name}", []) for name in facet_filters}
+        if not snap.has_networks:
+            selections.pop('networks')
+        counts = load_facet_counts(manifest_id, pq.filter_signature(**selections), snap)
 
 # --- Sidebar Filters ---
 st.sidebar.header("Filter Providers")
 # Full-text search input
-search_query = st.sidebar.text_input("Search (Name, City, Specialty)")
+search_query = st.sidebar.text_input("Search (Name, City, Specialty, Phone)", key='search_query')
 # Primary Specialty multiselect (unique values from primary specialty field)
-if 'pri_spec' in providers_df.columns:
-    all_specialties = sorted(providers_df['pri_spec'].dropna().unique().tolist())
-else:
-    all_specialties = []
-selected_specialties = st.sidebar.multiselect("Primary Specialty", all_specialties)
+selected_specialties = facet_multiselect("Primary Specialty", 'specialties', all_specialties, counts)
+# NUCC taxonomy grouping of the primary specialty (e.g. "Allopathic & Osteopathic Physicians")
+selected_groupings = facet_multiselect("Specialty Grouping", 'groupings', all_groupings, counts)
 # State multiselect (two-letter state codes)
-if 'state' in providers_df.columns:
-    all_states = sorted(providers_df['state'].dropna().unique().tolist())
-else:
-    all_states = []
-selected_states = st.sidebar.multiselect("State", all_states)
+selected_states = facet_multiselect("State", 'states', all_states, counts)
+# Insurance network multiselect (Plan-Net memberships loaded with db_setup.py --networks); options are network ids,
+# so thousands of networks cost one dictionary lookup per label
+selected_networks = (facet_multiselect("Insurance Network", 'networks', list(network_labels), counts, network_labels.get)
+                     if network_labels else [])
+# Further facets, listed from the snapshot's facet dictionaries
+more_facets = [("Secondary Specialty", 'secondary_specialties', 'sec_spec'), ("Credential", 'credentials', 'cred'),
+               ("Telehealth", 'telehealth', 'telehlth'), ("Accepts Medicare Assignment", 'assignment', 'assgn')]
+more_selections = {}
+for label, name, facet in more_facets:
+    options = facet_index.values.get(facet, []) if facet_index is not None else []
+    more_selections[name] = facet_multiselect(label, name, options, counts) if options else []
+if counts:
+    st.sidebar.caption("Counts reflect the selections above (not the search box or location).")
 # Location (City or ZIP) and Radius
 location_input = st.sidebar.text_input("City or ZIP Code")
 radius = st.sidebar.slider("Search radius (miles)", min_value=0, max_value=100, value=0)
 # Network Adequacy toggle
 show_network = st.sidebar.checkbox("Network Adequacy Analysis")
 
-# --- Apply Filters to Data ---
-df_filtered = providers_df.copy()
-
-# 1. Full-text search across name, city, and specialties
-if search_query:
-    query = search_query.strip().lower()
-    # Filter rows where any relevant field contains the query substring (case-insensitive)
-    df_filtered = df_filtered[
-        df_filtered['provider_name'].str.contains(query, case=False, na=False) |
-        df_filtered['city'].str.contains(query, case=False, na=False) |
-        df_filtered['pri_spec'].str.contains(query, case=False, na=False) |
-        df_filtered.get('sec_spec_1', pd.Series(dtype=str)).str.contains(query, case=False, na=False) |
-        df_filtered.get('sec_spec_2', pd.Series(dtype=str)).str.contains(query, case=False, na=False) |
-        df_filtered.get('sec_spec_3', pd.Series(dtype=str)).str.contains(query, case=False, na=False) |
-        df_filtered.get('sec_spec_4', pd.Series(dtype=str)).str.contains(query, case=False, na=False)
-    ]
-
-# 2. Primary specialty filter
-if selected_specialties:
-    df_filtered = df_filtered[df_filtered['pri_spec'].isin(selected_specialties)]
-
-# 3. State filter
-if selected_states:
-    df_filtered = df_filtered[df_filtered['state'].isin(selected_states)]
-
-# 4. Location + radius filter
+# --- Translate Filters into a Query ---
+# All filtering happens in SQLite; only the current page and a COUNT(*) are pulled into memory.
+filters = {
+    'search_query': search_query,
+    'specialties': selected_specialties,
+    'states': selected_states,
+    'groupings': selected_groupings,
+    'networks': selected_networks,
+    **more_selections,
+}
+# A search made only of digits and phone punctuation looks up phone numbers (by prefix) instead of text
+if search_query and re.fullmatch(r"[\d\s().+-]*\d{3}[\d\s().+-]*", search_query.strip()):
+    filters['phone'] = search_query
+    filters['search_query'] = None
+
 center_lat, center_lon = None, None
 if location_input:
-    # Geocode the input location (could be city/state or ZIP)
-    center_lat, center_lon = geocode_address(location_input)
-    if center_lat is not None and center_lon is not None and radius is not None and radius > 0:
-        # Ensure provider data has latitude/longitude columns for distance calculation
-        if 'lat' in df_filtered.columns and 'lon' in df_filtered.columns:
-            # Convert to radians for vectorized haversine calculation
-            lat_r = np.radians(df_filtered['lat'].astype(float))
-            lon_r = np.radians(df_filtered['lon'].astype(float))
-            clat_r = np.radians(center_lat)
-            clon_r = np.radians(center_lon)
-            # Haversine formula for distance in miles
-            dlat = lat_r - clat_r
-            dlon = lon_r - clon_r
-            a = np.sin(dlat/2)**2 + np.cos(clat_r) * np.cos(lat_r) * np.sin(dlon/2)**2
-            c = 2 * np.arcsin(np.sqrt(a))
-            distances = 3958.8 * c  # Earth radius ~3958.8 miles
-            # Filter providers within the radius
-            mask = distances <= radius
-            df_filtered = df_filtered[mask].copy()
-            df_filtered['distance_miles'] = distances[mask].round(1)  # store distance (rounded) for display
-            # Sort by distance (nearest first)
-            df_filtered.sort_values('distance_miles', inplace=True)
+    location = location_input.strip()
+    if radius is not None and radius > 0:
+        # Geocode the input location (could be city/state or ZIP)
+        center_lat, center_lon = geocode_address(location)
+        if center_lat is not None and center_lon is not None:
+            if has_coordinates:
+                filters['center'] = (center_lat, center_lon)
+                filters['radius'] = radius
+            else:
+                # If no coordinates in data, cannot apply radius filter
+                st.warning("Provider coordinates not available for radius filtering.")
         else:
-            # If no coordinates in data, cannot apply radius filter
-            st.warning("Provider coordinates not available for radius filtering.")
-            # (If needed, could fall back to filtering by exact city/ZIP match as a crude approach)
+            st.warning(f"Could not find a location matching '{location}'. Try a 5-digit ZIP or 'City, ST'.")
+    elif location.isdigit():
+        # Without a radius, a ZIP (or ZIP prefix) is matched directly against the ZIP index
+        filters['zip_code'] = location
+
+instrumentation.label(filter_type=instrumentation.filter_type(filters))
+
+# Facet/grouping/network-only selections are answered from the snapshot: facet selections become ORs and ANDs of
+# per-value bitmaps, networks the union of their member rows, and only the current page is read from SQLite.
+use_snapshot = (snap is not None and snap.has_column('pri_spec') and snap.has_column('st') and snap.name_order is not None
+                and (not selected_groupings or snap.has_column('pri_spec_code'))
+                and (not selected_networks or snap.has_networks)
+                and not any(value for key, value in filters.items() if key not in snapshot.SNAPSHOT_FILTERS))
+
+# Matching row ids are cached per normalized filter signature, so reruns that don't change the filters
+# (page turns, the adequacy toggle, other sessions asking the same question) skip the filter chain entirely.
+result_cache = get_result_cache()
+signature = pq.filter_signature(**filters)
+source = 'snapshot' if use_snapshot else 'sql'
+if use_snapshot:
+    compute_result = lambda: pagination.snapshot_result(snap, **filters)
+else:
+    compute_result = lambda: pagination.sql_result(conn, **filters)
+with instrumentation.span("result", source=source) as result_span:
+    result = result_cache.get_or_compute((source, signature), manifest_id, compute_result)
+    result_span.rows = result.count
+cache_stats = result_cache.stats()
+st.sidebar.caption(f"Result cache: {cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses, "
+                   f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1e6:.1f} MB)")
+
 # --- Display Results in Main Section ---
 
 # Header for results
 st.title("Provider Directory")
-num_results = len(df_filtered)
-st.markdown(f"**Found {num_results} providers** matching your criteria.")
+num_results = result.count
+st.markdown(f"**Found {pagination.format_count(num_results, exact=result.exact)} providers** matching your criteria.")
+
+# A search that finds nothing gets typo-tolerant suggestions from the name trigram index, each kept only if it
+# finds providers under the other filters
+if num_results == 0 and filters.get('search_query') and snap is not None and snap.names is not None:
+    with instrumentation.span("name_suggestions"):
+        suggestions = []
+        for suggestion, _, _ in load_name_suggestions(manifest_id, search_query, snap):
+            count = pagination.approximate_count(conn, **{**filters, 'search_query': suggestion})
+            if count:
+                suggestions.append((suggestion.title(), count))
+    if suggestions:
+        st.markdown("Did you mean:")
+        for suggestion, count in suggestions:
+            st.button(f"{suggestion} ({pagination.format_count(count)})", key=f"suggestion_{suggestion}",
+                      on_click=set_search_query, args=(suggestion,))
 
 # Map of providers (if any and if coordinates available)
 if num_results > 0:
-    if 'lat' in df_filtered.columns and 'lon' in df_filtered.columns:
-        # Drop rows without coordinates to plot
-        map_data = df_filtered[['lat', 'lon']].dropna()
+    if has_coordinates:
+        # Points are aggregated in SQLite (state/ZIP rollups or a grid), so at most MAP_POINT_BUDGET reach the browser
+        map_data, map_level = map_points(conn, **filters)
         if not map_data.empty:
-            st.map(map_data)  # Plot all provider locations on a map&#8203;:contentReference[oaicite:3]{index=3}
+            with instrumentation.span("render_map"):
+                st.map(map_data, latitude='lat', longitude='lon', size='size')  # Plot provider locations on a map&#8203;:contentReference[oaicite:3]{index=3}
+            st.caption(f"{len(map_data):,} map points, aggregated by {map_level}")
     else:
         st.info("Map view not available (missing provider coordinates in data).")
 
 
-# --- Provider table with pagination ---
+# --- Provider table with keyset pagination ---
 if num_results > 0:
-    # Build a list of dictionary records from the filtered data (all rows)
-    table_records = []
-    for idx, row in df_filtered.iterrows():
-        # Build Provider Name (use 'provider_name' field; append credential if available)
-        name_line = row.get('provider_name', '')
-        if row.get('Cred') and pd.notna(row.get('Cred')):
-            name_line += ", " + str(row['Cred'])
-        
-        # Build Specialty string: combine primary specialty with secondary specialties
-        specialties = ""
-        if row.get('pri_spec'):
-            specialties = str(row['pri_spec'])
-        sec_list = []
-        for col in ['sec_spec_1', 'sec_spec_2', 'sec_spec_3', 'sec_spec_4']:
-            val = row.get(col)
-            if val and pd.notna(val) and str(val).strip():
-                sec_list.append(str(val))
-        if sec_list:
-            specialties += "; " + "; ".join(sec_list)
-        
-        # Build Address string: combine address line 1, address line 2, and City/State/ZIP
-        address_parts = []
-        if row.get('adr_ln_1'):
-            address_parts.append(str(row['adr_ln_1']).strip())
-        if row.get('adr_ln_2') and str(row['adr_ln_2']).strip():
-            address_parts.append(str(row['adr_ln_2']).strip())
-        city_state_zip = []
-        if row.get('city'):
-            city_state_zip.append(str(row['city']).strip())
-        if row.get('state'):
-            city_state_zip.append(str(row['state']).strip())
-        if row.get('zip_code'):
-            city_state_zip.append(str(row['zip_code']).strip())
-        if city_state_zip:
-            address_parts.append(", ".join(city_state_zip))
-        address = "; ".join(address_parts)
-        
-        # Phone number
-        phone = str(row.get('phone')).strip() if row.get('phone') else ""
-        
-        # Telehealth availability
-        tele = row.get('telehealth')
-        if tele and pd.notna(tele):
-            tele = str(tele).strip().upper()
-            tele_text = "Yes" if tele in ["Y", "TRUE", "1"] else "No"
-        else:
-            tele_text = "No"
-        
-        # Medicare assignment acceptance
-        assign_val = row.get('medicare_assignment')
-        if assign_val and pd.notna(assign_val):
-            assign_val = str(assign_val).strip().upper()
-            if assign_val == 'Y':
-                assign_text = "Yes"
-            elif assign_val == 'M':
-                assign_text = "Partial (May Accept)"
-            else:
-                assign_text = assign_val
-        else:
-            assign_text = ""
-        
-        # Distance (if calculated)
-        distance = row.get('distance_miles', "")
-        
-        # Append all collected fields to the records list
-        table_records.append({
-            "Provider Name": name_line,
-            "Specialty": specialties,
-            "Address": address,
-            "Phone": phone,
-            "Telehealth": tele_text,
-            "Accepts Medicare": assign_text,
-            "Distance (miles)": distance
-        })
-
-    # Convert records to DataFrame
-    table_df = pd.DataFrame(table_records)
-    
-    # --- Pagination ---
-    page_size = 20
-    total_rows = len(table_df)
-    total_pages = (total_rows - 1) // page_size + 1
-    
-    # Create a number input for the page number if more than one page exists
-    if total_pages > 1:
-        page_number = st.number_input("Page", min_value=1, max_value=total_pages, step=1, value=1)
-    else:
-        page_number = 1
-    start_idx = (page_number - 1) * page_size
-    end_idx = start_idx + page_size
+    # Pages are addressed by a cursor on the sort key (distance, last name + NPI), so every page costs the same
+    # as the first; the cursor starts over whenever the filters or the database load change.
+    page_state = (source, signature, manifest_id)
+    if st.session_state.get('page_state') != page_state:
+        st.session_state.page_state = page_state
+        st.session_state.page_cursor = pagination.FIRST
+        st.session_state.page_letter = ""
+    if pagination.supports_letters(**filters):
+        st.selectbox("Jump to last name", [""] + pq.LETTERS, key='page_letter', on_change=jump_to_letter)
 
-    # Display the paginated table
-    st.table(table_df.iloc[start_idx:end_idx])
+    cursor = st.session_state.page_cursor
+    page = pagination.result_page(conn, result, cursor, snap=snap, **filters)
+
+    # Format only the rows on the current page for display
+    table_df = pq.format_provider_table(page.rows)
+    with instrumentation.span("render_table") as render_span:
+        st.table(table_df)
+        render_span.rows = len(table_df)
+    prev_col, next_col = st.columns(2)
+    prev_col.button("Previous", on_click=set_page_cursor, args=(("before", page.first_key),), disabled=not page.has_prev)
+    next_col.button("Next", on_click=set_page_cursor, args=(("after", page.last_key),), disabled=not page.has_next)
 
 
 
@@ -232,46 +272,55 @@ if num_results > 0:
 # --- Network Adequacy Analysis ---
 if show_network:
     st.header("Network Adequacy Analysis")
-    # Hardcoded population data (by state for simplicity)
-    population = {
-        'AL': 4903185, 'AK': 731545, 'AZ': 7278717, 'AR': 3017804, 'CA': 39512223,
-        'CO': 5758736, 'CT': 3565287, 'DE': 973764, 'DC': 705749, 'FL': 21477737,
-        'GA': 10617423, 'HI': 1415872, 'ID': 1787065, 'IL': 12671821, 'IN': 6732219,
-        'IA': 3155070, 'KS': 2913314, 'KY': 4467673, 'LA': 4648794, 'ME': 1344212,
-        'MD': 6045680, 'MA': 6892503, 'MI': 9986857, 'MN': 5639632, 'MS': 2976149,
-        'MO': 6137428, 'MT': 1068778, 'NE': 1934408, 'NV': 3080156, 'NH': 1359711,
-        'NJ': 8882190, 'NM': 2096829, 'NY': 19453561, 'NC': 10488084, 'ND': 762062,
-        'OH': 11689100, 'OK': 3956971, 'OR': 4217737, 'PA': 12801989, 'RI': 1059361,
-        'SC': 5148714, 'SD': 884659, 'TN': 6829174, 'TX': 28995881, 'UT': 3205958,
-        'VT': 623989, 'VA': 8535519, 'WA': 7614893, 'WV': 1792147, 'WI': 5822434,
-        'WY': 578759
-    }
-    # Determine relevant population (for selected states or overall)
-    if selected_states:
-        # Use selected states to determine population base
-        pop_total = sum(population.get(st, 0) for st in selected_states)
-        region_desc = "selected states"
-    elif location_input:
-        # If no state filter, use state(s) of providers in results (approximate region)
-        states_in_results = df_filtered['state'].unique()
-        pop_total = sum(population.get(st, 0) for st in states_in_results)
-        region_desc = f"region around **{location_input}**"
+    if not adequacy.has_rollups(conn):
+        st.info("Network adequacy rollups are missing; rebuild the database with db_setup.py.")
     else:
-        # Default: use all states (national total) if no specific region filter
-        pop_total = sum(population.values())
-        region_desc = "the entire United States"
-    provider_count = len(df_filtered)
-    st.write(f"**Region:** {region_desc}")
-    st.write(f"**Total population (approx):** {pop_total:,}")
-    st.write(f"**Total providers (filtered):** {provider_count}")
-    if pop_total > 0:
-        providers_per_100k = (provider_count / pop_total) * 100000
-        st.write(f"**Providers per 100,000 population:** {providers_per_100k:.1f}")
-        # Example benchmark: ~50 per 100k is one provider per 2,000 people&#8203;:contentReference[oaicite:4]{index=4}
-        benchmark = 50.0
-        if providers_per_100k >= benchmark:
-            st.success(f"Provider density is above the common adequacy benchmark (~{benchmark} per 100k).")
+        # Read from the rollups built by db_setup.py: cost does not depend on the number of matching providers
+        st.caption("Based on the specialty and state selections; counts are distinct clinicians (NPIs).")
+        by_state = adequacy.state_adequacy(conn, selected_specialties, selected_states)
+        region_desc = "selected states" if selected_states else "the entire United States"
+        # Distinct NPIs across the region: a clinician practicing in several states counts once
+        provider_count = adequacy.total_providers(conn, selected_specialties, selected_states)
+        pop_total = float(by_state['population'].sum())
+        st.write(f"**Region:** {region_desc}")
+        st.write(f"**Total population (approx):** {pop_total:,.0f}")
+        st.write(f"**Total providers:** {provider_count:,}")
+        if pop_total > 0:
+            providers_per_100k = (provider_count / pop_total) * 100000
+            st.write(f"**Providers per 100,000 population:** {providers_per_100k:.1f}")
+            # Example benchmark: ~50 per 100k is one provider per 2,000 people&#8203;:contentReference[oaicite:4]{index=4}
+            benchmark = 50.0
+            if providers_per_100k >= benchmark:
+                st.success(f"Provider density is above the common adequacy benchmark (~{benchmark} per 100k).")
+            else:
+                st.warning(f"Provider density is below the common adequacy benchmark (~{benchmark} per 100k).")
         else:
-            st.warning(f"Provider density is below the common adequacy benchmark (~{benchmark} per 100k).")
-    else:
-        st.write("Population data not available for the selected region.")
+            st.write("Population data not available for the selected region.")
+
+        st.subheader("By state")
+        st.dataframe(by_state.rename(columns={'state': 'State', 'providers': 'Providers', 'population': 'Population',
+                                              'per_100k': 'Per 100k'}).round(1), hide_index=True)
+        if selected_states:
+            st.subheader("Least-served counties")
+            by_county = adequacy.county_adequacy(conn, selected_specialties, selected_states)
+            st.dataframe(by_county.head(20).rename(columns={'state': 'State', 'county': 'County', 'providers': 'Providers',
+                                                            'population': 'Population', 'per_100k': 'Per 100k'}).round(1),
+                         hide_index=True)
+        if selected_specialties:
+            st.subheader("Population within reach of a provider")
+            coverage = adequacy.distance_adequacy(conn, selected_specialties, selected_states)
+            st.dataframe((coverage * 100).round(1).astype(str) + "%")
+
+instrumentation.finish_trace(rerun_trace)
+
+# --- Debug: timing breakdown of this rerun ---
+if st.sidebar.checkbox("Show timing breakdown"):
+    st.sidebar.caption(f"This rerun: {rerun_trace.seconds * 1000:,.0f} ms ({rerun_trace.labels.get('filter_type', 'none')})")
+    timings = pd.DataFrame([{'Stage': '· ' * span.depth + span.name, 'ms': span.seconds * 1000, 'Rows': span.rows,
+                             'RSS Δ (MB)': span.rss_delta_mb} for span in rerun_trace.spans])
+    if not timings.empty:
+        st.sidebar.dataframe(timings.round(1), hide_index=True)
+    latency = pd.DataFrame(instrumentation.METRICS.summary("rerun", "total"))
+    if not latency.empty:
+        st.sidebar.caption("Rerun latency by filter type (this process)")
+        st.sidebar.dataframe(latency[['filter_type', 'count', 'p50_ms', 'p95_ms']].round(1), hide_index=True)
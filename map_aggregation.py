@@ -0,0 +1,126 @@
+import pandas as pd
+import provider_query as pq
+from instrumentation import timed
+
+# Upper bound on the number of points sent to st.map, whatever the size of the result
+MAP_POINT_BUDGET = 2000
+
+# Marker scale (degrees) for the rollup levels, which have no grid cell of their own
+ROLLUP_MARKER_DEGREES = {"state": 1.0, "ZIP code": 0.05}
+
+# Grid cell sizes (degrees) to choose from, finest first; 0.005 degrees is roughly half a kilometre
+GRID_CELL_SIZES = [0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0]
+
+# Cell sizes for the first aggregation pass in SQLite, and the most cells that pass may hand to pandas
+SQL_CELL_SIZES = [0.005, 0.05, 0.5, 5.0]
+SQL_CELL_LIMIT = 50_000
+
+METERS_PER_DEGREE = 111_000
+
+# -------------------- Rollups --------------------
+
+def create_map_rollups(conn):
+    """
+    (Re)build the precomputed map rollups used for the common unfiltered views:
+    map_rollup_state (one point per state) and map_rollup_zip (one point per 5-digit ZIP).
+    Each point is the provider-weighted mean of the state's / ZIP's location coordinates.
+    """
+    # Separate statements rather than executescript, which would commit a surrounding refresh transaction
+    conn.execute("DROP TABLE IF EXISTS map_rollup_state")
+    conn.execute("""
+        CREATE TABLE map_rollup_state AS
+        SELECT providers.st AS st, AVG(locations.lat) AS lat, AVG(locations.lon) AS lon, COUNT(*) AS providers
+        FROM providers JOIN locations ON locations.adrs_id = providers.adrs_id
+        WHERE locations.lat IS NOT NULL AND locations.lon IS NOT NULL
+        GROUP BY providers.st
+    """)
+    conn.execute("DROP TABLE IF EXISTS map_rollup_zip")
+    conn.execute("""
+        CREATE TABLE map_rollup_zip AS
+        SELECT SUBSTR(providers.zip, 1, 5) AS zip5, providers.st AS st,
+               AVG(locations.lat) AS lat, AVG(locations.lon) AS lon, COUNT(*) AS providers
+        FROM providers JOIN locations ON locations.adrs_id = providers.adrs_id
+        WHERE locations.lat IS NOT NULL AND locations.lon IS NOT NULL
+        GROUP BY zip5, providers.st
+    """)
+    conn.execute("CREATE INDEX idx_map_rollup_zip_st ON map_rollup_zip(st)")
+
+# -------------------- Binning --------------------
+
+def bin_points(points, budget=MAP_POINT_BUDGET, start=None):
+    """
+    Bin weighted points (lat, lon, providers) into the finest grid from GRID_CELL_SIZES (no finer than `start`)
+    that leaves at most `budget` cells. Returns (binned points, cell size in degrees); points already within
+    budget are returned unchanged with a cell size of None.
+    """
+    if len(points) <= budget:
+        return points, None
+    cell = next(size for size in GRID_CELL_SIZES if size >= (start or 0))
+    while True:
+        weighted = points.assign(
+            gy=((points["lat"] + 90) // cell).astype(int), gx=((points["lon"] + 180) // cell).astype(int),
+            wlat=points["lat"] * points["providers"], wlon=points["lon"] * points["providers"])
+        cells = weighted.groupby(["gy", "gx"])[["wlat", "wlon", "providers"]].sum()
+        if len(cells) <= budget or cell == GRID_CELL_SIZES[-1]:
+            break
+        cell = next(size for size in GRID_CELL_SIZES if size > cell)
+    binned = pd.DataFrame({"lat": cells["wlat"] / cells["providers"], "lon": cells["wlon"] / cells["providers"],
+                           "providers": cells["providers"]})
+    return binned.nlargest(budget, "providers").reset_index(drop=True), cell
+
+def grid_points(conn, budget=MAP_POINT_BUDGET, **filters):
+    """
+    Aggregate the locations of matching providers into grid cells in SQLite, then coarsen them in pandas
+    until at most `budget` cells remain. Returns (points with provider-weighted mean lat/lon and a providers
+    count, cell size in degrees, None when the unaggregated locations already fit the budget).
+    """
+    from_sql, where, params = pq.build_query(indexes=pq.search_indexes(conn), **filters)
+    from_sql += " JOIN locations ON locations.adrs_id = providers.adrs_id"
+    where = f"{where} AND locations.lat IS NOT NULL" if where else " WHERE locations.lat IS NOT NULL"
+    # Latitude/longitude are shifted to be non-negative, so CAST truncation is a floor
+    sql = (f"SELECT AVG(locations.lat) AS lat, AVG(locations.lon) AS lon, COUNT(*) AS providers FROM {from_sql}{where} "
+           f"GROUP BY CAST((locations.lat + 90.0) / ? AS INTEGER), CAST((locations.lon + 180.0) / ? AS INTEGER) LIMIT ?")
+    # SQLite reduces the rows to cells at the finest SQL_CELL_SIZES level that yields at most SQL_CELL_LIMIT cells
+    for cell in SQL_CELL_SIZES:
+        points = pd.read_sql(sql, conn, params=params + [cell, cell, SQL_CELL_LIMIT + 1])
+        if len(points) <= SQL_CELL_LIMIT:
+            break
+    binned, coarser = bin_points(points, budget, start=cell)
+    return binned, coarser or cell
+
+# -------------------- Map Data --------------------
+
+def _has_rollups(conn):
+    rows = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN ('map_rollup_state', 'map_rollup_zip')")
+    return rows.fetchone()[0] == 2
+
+@timed("map_points", rows=lambda points: len(points[0]))
+def map_points(conn, budget=MAP_POINT_BUDGET, **filters):
+    """
+    Points for st.map, never more than `budget` of them: columns lat, lon, providers (count behind the point)
+    and size (radius in metres, scaled by count). Returns (points, description of the aggregation level).
+    Unfiltered views read the per-state rollup, state-only views the per-ZIP rollup; everything else is
+    binned into a grid sized to the extent of the result.
+    """
+    active = {key for key, value in filters.items() if value}
+    if _has_rollups(conn) and not active:
+        points = pd.read_sql("SELECT lat, lon, providers FROM map_rollup_state", conn)
+        points, cell = bin_points(points, budget)
+        level = "state"
+    elif _has_rollups(conn) and active == {"states"}:
+        states = list(filters["states"])
+        points = pd.read_sql(f"SELECT lat, lon, providers FROM map_rollup_zip WHERE st IN ({', '.join('?' * len(states))})",
+                             conn, params=states)
+        points, cell = bin_points(points, budget)
+        level = "ZIP code" if cell is None else f"{cell}° grid"
+    else:
+        points, cell = grid_points(conn, budget, **filters)
+        level = f"{cell}° grid"
+
+    if points.empty:
+        return points.assign(size=pd.Series(dtype=float)), level
+    # Marker radius: a fraction of the cell (or a few km for rollups), growing with the square root of the count
+    base = (cell or ROLLUP_MARKER_DEGREES[level]) * METERS_PER_DEGREE / 2
+    points["size"] = base * (points["providers"] / points["providers"].max()) ** 0.5
+    points["size"] = points["size"].clip(lower=base / 5)
+    return points, level
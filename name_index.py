@@ -0,0 +1,169 @@
+import os
+import re
+import itertools
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# -------------------- Name Trigram Index --------------------
+# Typo-tolerant lookup of the words in provider and organization names ("jonson" -> "johnson"). Every distinct
+# name word (term) is split into trigrams of "  term " (padded like pg_trgm, so word starts weigh more), and an
+# inverted index maps each trigram to the terms containing it. A misspelled word gathers candidates by trigram
+# overlap, which only touches the postings of its ~len+1 trigrams, and just the best-overlapping few are re-ranked
+# with a bounded edit distance. Terms are kept with the number of providers whose name contains them, so that
+# among equally close corrections the common one wins.
+
+# Source columns of the indexed words (matched case-insensitively): provider_name is frst_nm + lst_nm
+NAME_COLUMNS = ["frst_nm", "lst_nm", "org_nm"]
+
+# Trigram alphabet: space, a-z, 0-9 (text is lowercased and stripped of accents first)
+ALPHABET = " abcdefghijklmnopqrstuvwxyz0123456789"
+TRIGRAMS = len(ALPHABET) ** 3
+_SYMBOL = np.zeros(256, dtype=np.int32)
+_SYMBOL[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(len(ALPHABET))
+
+# Best-overlapping candidates re-ranked with the edit distance, per query word
+RERANK_CANDIDATES = 200
+
+def words(text):
+    """Lowercased ASCII words of a text (accents dropped), the unit both the index and queries work on."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def max_edits(word):
+    """Edits tolerated for a word of this length: none up to 2 characters, 1 up to 5, then 2."""
+    return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+def trigram_ids(word):
+    """Distinct trigram ids of "  word "."""
+    codes = _SYMBOL[np.frombuffer(f"  {word} ".encode("ascii"), dtype=np.uint8)]
+    return np.unique(codes[:-2] * len(ALPHABET) ** 2 + codes[1:-1] * len(ALPHABET) + codes[2:])
+
+def edit_distance(a, b, bound):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions and adjacent transpositions) between
+    a and b, or bound + 1 as soon as it is known to exceed bound.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if cost and before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > bound:
+            return bound + 1
+        before, previous = previous, current
+    return min(previous[-1], bound + 1)
+
+# -------------------- Building --------------------
+
+def chunk_term_counts(chunk):
+    """Providers per name word in a chunk of provider rows (each row counts a word once, whichever column has it)."""
+    by_lower = {col.lower(): col for col in chunk.columns}
+    texts = pd.concat([chunk[by_lower[col]] for col in NAME_COLUMNS if col in by_lower])
+    texts = texts.dropna().astype(str).str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+    terms = texts.str.lower().str.findall(r"[a-z0-9]+").explode().dropna()
+    terms = terms[~terms.str.isdigit()]      # suite / group numbers are not worth correcting
+    pairs = pd.DataFrame({"row": terms.index, "term": terms.to_numpy()}).drop_duplicates()
+    return pairs["term"].value_counts()
+
+def write_name_index(out_dir, term_counts):
+    """
+    Write the trigram index from {term: providers} counts (a Series, e.g. the sum of chunk_term_counts):
+    the terms as ASCII bytes + offsets, their provider counts, and the trigram postings as compressed sparse rows
+    (the terms containing trigram t are name_trigram_terms[offsets[t]:offsets[t + 1]]). Returns the number of terms.
+    """
+    term_counts = term_counts.sort_values(ascending=False, kind="stable")
+    terms = term_counts.index.tolist()
+    data = "".join(terms).encode("ascii")
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in terms], out=offsets[1:])
+    with open(os.path.join(out_dir, "name_terms.bin"), "wb") as f:
+        f.write(data)
+    np.save(os.path.join(out_dir, "name_terms.offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "name_term_counts.npy"), term_counts.to_numpy(dtype=np.int64))
+
+    # Trigrams of every padded term at once: symbol codes of "  term " strings laid end to end, one trigram per
+    # position whose three characters belong to the same term
+    padded = np.frombuffer("".join(f"  {term} " for term in terms).encode("ascii"), dtype=np.uint8)
+    codes = _SYMBOL[padded].astype(np.int64)
+    lengths = np.diff(offsets) + 3
+    term_of = np.repeat(np.arange(len(terms), dtype=np.int64), lengths)
+    ends = np.cumsum(lengths)
+    valid = np.flatnonzero(np.arange(len(padded) - 2) + 2 < ends[term_of[:-2]])
+    trigrams = codes[valid] * len(ALPHABET) ** 2 + codes[valid + 1] * len(ALPHABET) + codes[valid + 2]
+    # Distinct (trigram, term) pairs, ordered by trigram then term
+    pairs = np.unique(trigrams * len(terms) + term_of[valid])
+    trigram_offsets = np.zeros(TRIGRAMS + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // len(terms), minlength=TRIGRAMS), out=trigram_offsets[1:])
+    np.save(os.path.join(out_dir, "name_trigram_offsets.npy"), trigram_offsets)
+    np.save(os.path.join(out_dir, "name_trigram_terms.npy"), (pairs % len(terms)).astype(np.int32))
+    return len(terms)
+
+# -------------------- Querying --------------------
+
+class NameIndex:
+    """Memory-mapped name trigram index written by write_name_index()."""
+
+    def __init__(self, path):
+        self._offsets = np.load(os.path.join(path, "name_terms.offsets.npy"), mmap_mode="r")
+        self._data = np.memmap(os.path.join(path, "name_terms.bin"), dtype=np.uint8, mode="r") \
+            if self._offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self.counts = np.load(os.path.join(path, "name_term_counts.npy"), mmap_mode="r")
+        self._lengths = np.diff(self._offsets)
+        self._trigram_offsets = np.load(os.path.join(path, "name_trigram_offsets.npy"), mmap_mode="r")
+        self._trigram_terms = np.load(os.path.join(path, "name_trigram_terms.npy"), mmap_mode="r")
+
+    def term(self, i):
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode("ascii")
+
+    def corrections(self, word, limit=5, max_distance=None):
+        """
+        Index terms within max_distance edits of a word (default: max_edits), closest first and then by providers:
+        a list of (term, distance, providers). A word that is itself a term comes back first with distance 0.
+        """
+        bound = max_edits(word) if max_distance is None else max_distance
+        if not word or len(self.counts) == 0:
+            return []
+        grams = trigram_ids(word)
+        postings = [self._trigram_terms[self._trigram_offsets[g]:self._trigram_offsets[g + 1]] for g in grams]
+        overlap = np.bincount(np.concatenate(postings), minlength=len(self.counts))
+        # Each edit changes at most 3 trigrams of the word, so a match keeps all but 3 * bound of them
+        overlap[np.abs(self._lengths - len(word)) > bound] = 0
+        candidates = np.flatnonzero(overlap >= max(len(grams) - 3 * bound, 1))
+        if len(candidates) > RERANK_CANDIDATES:
+            best = np.argpartition(-overlap[candidates], RERANK_CANDIDATES)[:RERANK_CANDIDATES]
+            candidates = candidates[best]
+        matches = []
+        for i in candidates.tolist():
+            term = self.term(i)
+            distance = edit_distance(word, term, bound)
+            if distance <= bound:
+                matches.append((term, distance, int(self.counts[i])))
+        matches.sort(key=lambda match: (match[1], -match[2], match[0]))
+        return matches[:limit]
+
+    def suggest(self, text, limit=5):
+        """
+        Corrected versions of a search text, each word replaced by a close index term (words that are terms, or
+        have no close term, are kept): a list of (suggestion, distance, providers) ordered by total edits and then
+        by the providers of the rarest word, excluding the text itself. providers is an upper bound on the matches.
+        """
+        options = []
+        for word in words(text):
+            found = self.corrections(word, limit)
+            if not found or found[0][1] == 0:
+                found = [(word, 0, found[0][2] if found else 0)]
+            options.append(found)
+        suggestions = []
+        for combination in itertools.islice(itertools.product(*options), 1000):
+            distance = sum(match[1] for match in combination)
+            if distance:
+                suggestions.append((" ".join(match[0] for match in combination), distance,
+                                    min(match[2] for match in combination)))
+        suggestions.sort(key=lambda suggestion: (suggestion[1], -suggestion[2], suggestion[0]))
+        return suggestions[:limit]
@@ -0,0 +1,87 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from enrichment import PLAN_NET_COLUMNS
+
+# Network memberships as written by data_loader.py (one row per NPI, payer and network; see enrichment.fetch_plan_net)
+MEMBERSHIPS_CSV_PATH = os.path.join(os.getcwd(), "plan_net_memberships.csv")
+
+# -------------------- Memberships --------------------
+
+def load_memberships(path=MEMBERSHIPS_CSV_PATH):
+    """Read a memberships CSV (columns npi, payer, network_id, network_name) with every column as text."""
+    return pd.read_csv(path, dtype=str)[PLAN_NET_COLUMNS]
+
+def save_memberships(memberships, path=MEMBERSHIPS_CSV_PATH):
+    memberships[PLAN_NET_COLUMNS].to_csv(path, index=False)
+
+# -------------------- Database --------------------
+
+def create_network_tables(conn, memberships):
+    """
+    (Re)create the provider <-> network membership tables from a memberships frame:
+    networks holds one row per (payer, network) with a small integer network_id, its name and its NPI count;
+    provider_networks holds (network_id, npi) pairs. The junction is a WITHOUT ROWID table clustered on
+    (network_id, npi), so "NPIs in these networks" reads one contiguous key range per network, and
+    idx_provider_networks_npi covers the reverse lookup. Memberships are keyed by NPI rather than providers.rowid,
+    so they stay valid across refreshes of the providers table.
+    Returns the number of memberships stored.
+    """
+    conn.execute("DROP TABLE IF EXISTS provider_networks")
+    conn.execute("DROP TABLE IF EXISTS networks")
+    conn.execute("CREATE TABLE networks (network_id INTEGER PRIMARY KEY, payer TEXT, network_ref TEXT, name TEXT, "
+                 "providers INTEGER, UNIQUE (payer, network_ref))")
+    conn.execute("CREATE TABLE provider_networks (network_id INTEGER NOT NULL, npi TEXT NOT NULL, "
+                 "PRIMARY KEY (network_id, npi)) WITHOUT ROWID")
+    memberships = memberships.dropna(subset=["npi", "payer", "network_id"])
+    memberships = memberships.drop_duplicates(["npi", "payer", "network_id"])
+    networks = (memberships.drop_duplicates(["payer", "network_id"])
+                .assign(network_name=lambda df: df["network_name"].fillna(df["network_id"]))
+                .sort_values(["network_name", "payer"], key=lambda col: col.str.lower(), ignore_index=True))
+    networks["providers"] = networks.set_index(["payer", "network_id"]).index.map(
+        memberships.groupby(["payer", "network_id"]).size())
+    networks.index += 1
+    conn.executemany("INSERT INTO networks VALUES (?, ?, ?, ?, ?)",
+                     zip(networks.index.tolist(), networks["payer"], networks["network_id"], networks["network_name"],
+                         networks["providers"].tolist()))
+    # Integer network ids for every membership, from one index lookup over the (payer, network) pairs
+    lookup = pd.MultiIndex.from_frame(networks[["payer", "network_id"]])
+    ids = lookup.get_indexer(pd.MultiIndex.from_frame(memberships[["payer", "network_id"]])) + 1
+    pairs = pd.DataFrame({"network_id": ids, "npi": memberships["npi"].to_numpy()}).sort_values(["network_id", "npi"])
+    conn.executemany("INSERT INTO provider_networks VALUES (?, ?)", pairs.itertuples(index=False, name=None))
+    conn.execute("CREATE INDEX idx_provider_networks_npi ON provider_networks(npi, network_id)")
+    return len(pairs)
+
+def has_networks(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'networks'").fetchone() is not None
+
+def network_options(conn):
+    """Networks for the sidebar, ordered by name: a list of (network_id, label) with label "Name (payer)"."""
+    if not has_networks(conn):
+        return []
+    rows = conn.execute("SELECT network_id, name, payer FROM networks ORDER BY network_id")
+    return [(network_id, f"{name} ({payer})") for network_id, name, payer in rows]
+
+def unknown_networks(conn, network_ids):
+    """The given network ids that are not in the networks table (all of them when no memberships are loaded)."""
+    if not network_ids or not has_networks(conn):
+        return list(network_ids)
+    known = {row[0] for row in conn.execute(
+        f"SELECT network_id FROM networks WHERE network_id IN ({', '.join('?' * len(network_ids))})", list(network_ids))}
+    return [network_id for network_id in network_ids if network_id not in known]
+
+def network_postings(conn, rowids):
+    """
+    Membership as compressed sparse rows over snapshot row positions: (offsets, rows) where the positions of the
+    providers in network k are rows[offsets[k]:offsets[k + 1]], in ascending order. `rowids` is the snapshot's
+    sorted providers.rowid array; providers of an NPI that has several rows are all members.
+    """
+    cursor = conn.execute(
+        "SELECT provider_networks.network_id, providers.rowid FROM provider_networks "
+        "JOIN providers ON providers.NPI = provider_networks.npi ORDER BY provider_networks.network_id, providers.rowid")
+    pairs = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2)
+    max_id = conn.execute("SELECT IFNULL(MAX(network_id), 0) FROM networks").fetchone()[0]
+    offsets = np.zeros(max_id + 2, dtype=np.int64)
+    np.cumsum(np.bincount(pairs[:, 0], minlength=max_id + 1), out=offsets[1:])
+    return offsets, np.searchsorted(rowids, pairs[:, 1]).astype(np.int32)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# USPS codes accepted as states: the 50 states, DC, the territories and the military "states" (AA/AE/AP)
+STATE_CODES = frozenset([
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA",
+    "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK",
+    "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY",
+    "DC", "PR", "VI", "GU", "AS", "MP", "FM", "MH", "PW", "AA", "AE", "AP",
+])
+
+# An NPI's 10th digit is a Luhn check digit over its first 9 digits prefixed with 80840 (the US health
+# industry prefix); that prefix always adds 24 to the Luhn sum.
+NPI_PREFIX_LUHN_SUM = 24
+
+# All functions take and return pandas Series aligned with the input: missing or unusable values become <NA>.
+
+def _text(values):
+    return values.astype("string").str.strip()
+
+def digits_column(values):
+    """The digits of each value, everything else removed."""
+    return _text(values).str.replace(r"\D", "", regex=True)
+
+def join_present(parts, sep, index):
+    """Row-wise join of the present values in parts (a list of (values, present) pairs) with sep."""
+    out = pd.Series("", index=index, dtype=object)
+    started = pd.Series(False, index=index)
+    for values, present in parts:
+        prefix = started.map({True: sep, False: ""})
+        out = out.mask(present, out + prefix + values)
+        started = started | present
+    return out
+
+# -------------------- Phone Numbers --------------------
+
+def normalize_phone_column(phones):
+    """
+    Phone numbers as bare 10-digit NANP strings ("(617) 555-0100" -> "6175550100", a leading country code 1
+    dropped), which keeps them sortable for prefix range scans. Values that don't have 10 digits become <NA>.
+    """
+    digits = digits_column(phones).str.replace(r"^1(\d{10})$", r"\1", regex=True)
+    return digits.where(digits.str.len() == 10)
+
+def format_phone_column(phones):
+    """Display form (xxx) xxx-xxxx for 10-digit phone strings; anything else is passed through."""
+    text = _text(phones)
+    return text.str.replace(r"^(\d{3})(\d{3})(\d{4})$", r"(\1) \2-\3", regex=True)
+
+# -------------------- ZIP Codes and States --------------------
+
+def split_zip_column(zips):
+    """
+    Split ZIP / ZIP+4 values in any of the forms found in CMS files ("02118", "021181234", "02118-1234") into
+    (zip5, zip4) Series. Values that lost their leading zero on the way through a spreadsheet (4 or 8 digits)
+    are padded back; anything else that isn't 5 or 9 digits becomes <NA> in both.
+    """
+    digits = digits_column(zips)
+    length = digits.str.len()
+    digits = digits.mask(length.isin([4, 8]), "0" + digits)
+    length = digits.str.len()
+    valid = length.isin([5, 9])
+    zip5 = digits.str.slice(0, 5).where(valid)
+    zip4 = digits.str.slice(5, 9).where(valid & (length == 9))
+    return zip5, zip4
+
+def normalize_state_column(states):
+    """Upper-cased two-letter USPS codes; anything not in STATE_CODES becomes <NA>."""
+    codes = _text(states).str.upper()
+    return codes.where(codes.isin(STATE_CODES))
+
+# -------------------- NPI --------------------
+
+def npi_valid_column(npis):
+    """
+    Boolean Series: True where the value is a 10-digit NPI with a correct Luhn check digit. The check runs on a
+    (rows x 10) digit matrix, so a whole chunk is validated with a handful of numpy operations.
+    """
+    text = _text(npis)
+    shaped = text.str.fullmatch(r"\d{10}").fillna(False).to_numpy(dtype=bool)
+    valid = np.zeros(len(text), dtype=bool)
+    if shaped.any():
+        joined = "".join(text[shaped].tolist()).encode("ascii")
+        digits = (np.frombuffer(joined, dtype=np.uint8) - ord("0")).reshape(-1, 10).astype(np.int16)
+        # Counting from the right of the 9 payload digits, every other digit (starting with the last) is doubled
+        doubled = digits[:, 0:9:2] * 2
+        doubled -= 9 * (doubled > 9)
+        total = doubled.sum(axis=1) + digits[:, 1:9:2].sum(axis=1) + NPI_PREFIX_LUHN_SUM
+        valid[shaped] = (10 - total % 10) % 10 == digits[:, 9]
+    return pd.Series(valid, index=npis.index)
@@ -0,0 +1,236 @@
+import bisect
+import numpy as np
+import pandas as pd
+import provider_query as pq
+from instrumentation import timed
+from snapshot import SNAPSHOT_FILTERS
+
+PAGE_SIZE = 20
+
+# Counts stop at COUNT_LIMIT matches; larger results are reported as "10,000+"
+COUNT_LIMIT = 10_000
+
+# Cursor modes: first page, the page after / before a key (before None = last page), or the first page at or
+# after a letter
+FIRST = ("first", None)
+LAST = ("before", None)
+
+class KeysetPage:
+    """
+    One page of providers plus the keys needed to move from it: `first_key` / `last_key` are passed back as
+    ("before", first_key) / ("after", last_key) cursors. Keys are sort-key tuples for keyset pages and
+    positions for pages of a cached MatchResult, so a cursor is only valid for the result that produced it.
+    """
+
+    def __init__(self, rows, first_key, last_key, has_prev, has_next):
+        self.rows = rows
+        self.first_key = first_key
+        self.last_key = last_key
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+# -------------------- Counting --------------------
+
+def approximate_count(conn, **filters):
+    """Number of matching providers, counted up to COUNT_LIMIT + 1 (anything above COUNT_LIMIT means 'more than')."""
+    return pq.count_providers(conn, limit=COUNT_LIMIT + 1, **filters)
+
+def format_count(count, exact=False):
+    return f"{COUNT_LIMIT:,}+" if count > COUNT_LIMIT and not exact else f"{count:,}"
+
+# -------------------- SQL Keyset Pages --------------------
+
+def _has_radius(filters):
+    return filters.get("center") is not None and bool(filters.get("radius"))
+
+def sort_order(filters, from_sql):
+    """
+    Sort-key expressions for a query, most significant first: distance for radius searches, then FTS relevance
+    for text searches, then last name, NPI and rowid. Returns (expressions, params bound by the expressions).
+    """
+    keys, params = [], []
+    if _has_radius(filters):
+        keys.append("haversine_miles(locations.lat, locations.lon, ?, ?)")
+        params += list(filters["center"])
+    if "hits" in from_sql:
+        keys.append("hits.hit_rank")
+    return keys + [pq.NAME_KEY, pq.NPI_KEY, "providers.rowid"], params
+
+def supports_letters(**filters):
+    """Jump-to-letter needs last name to lead the sort key (no radius or text search)."""
+    return not _has_radius(filters) and not (filters.get("search_query") or "").strip()
+
+def _seek(aliases, op):
+    """
+    WHERE clause for "sort key {op} cursor": the leading key is compared on its own first, so SQLite can seek
+    the sort-key index instead of scanning for the row-value comparison.
+    """
+    lead, rest = aliases[0], aliases[1:]
+    return (f"{lead} {op}= ? AND ({lead} {op} ? OR ({', '.join(rest)}) {op} ({', '.join('?' * len(rest))}))",
+            lambda key: [key[0], key[0]] + list(key[1:]))
+
+def _keyset_rows(conn, cursor, page_size, filters):
+    """
+    Raw rows of the page at `cursor`: (column names, row tuples, sort-key tuples, has_prev, has_next), with the
+    short "before" page and the letter-past-the-end cases already resolved to the first / last page. Raises
+    ValueError for a cursor key without one value per sort key (e.g. a cursor from a differently filtered search).
+    """
+    mode, key = cursor
+    from_sql, where, params = pq.build_query(indexes=pq.search_indexes(conn), **filters)
+    keys, key_params = sort_order(filters, from_sql)
+    aliases = [f"_key{i}" for i in range(len(keys))]
+    if mode in ("after", "before") and key is not None and len(key) != len(keys):
+        raise ValueError(f"Cursor has {len(key)} sort-key values, these filters sort on {len(keys)}")
+    inner = (f"SELECT providers.*{pq.location_select(conn)}, "
+             + ", ".join(f"{expr} AS {alias}" for expr, alias in zip(keys, aliases))
+             + f" FROM {from_sql}{pq.LOCATION_JOIN}{where}")
+    # The outer query is flattened by SQLite, so the name-key seek still reaches idx_prov_name_key
+    sql, outer_params, descending = f"SELECT * FROM ({inner})", [], mode == "before"
+    if mode == "after":
+        clause, bind = _seek(aliases, ">")
+        sql += f" WHERE {clause}"
+        outer_params = bind(key)
+    elif mode == "before" and key is not None:
+        clause, bind = _seek(aliases, "<")
+        sql += f" WHERE {clause}"
+        outer_params = bind(key)
+    elif mode == "letter":
+        sql += " WHERE _key0 >= ?"
+        outer_params = [key]
+    direction = " DESC" if descending else ""
+    sql += " ORDER BY " + ", ".join(alias + direction for alias in aliases) + " LIMIT ?"
+    cursor_rows = conn.execute(sql, key_params + params + outer_params + [page_size + 1])
+    names = [col[0] for col in cursor_rows.description]
+    rows = cursor_rows.fetchall()
+
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if descending:
+        rows.reverse()
+        if not more and len(rows) < page_size:
+            # Less than a full page before the cursor (short result, or the data changed): show the first page instead
+            return _keyset_rows(conn, FIRST, page_size, filters)
+    # The sort-key columns come last: split them off as the page's keys
+    width = len(names) - len(aliases)
+    page_keys = [row[width:] for row in rows]
+    rows = [row[:width] for row in rows]
+    if mode == "first":
+        has_prev, has_next = False, more
+    elif mode == "after":
+        has_prev, has_next = True, more
+    elif mode == "before":
+        has_prev, has_next = more, key is not None
+    else:
+        if not rows:
+            # Nothing at or after the letter: show the last page instead
+            return _keyset_rows(conn, LAST, page_size, filters)
+        has_next = more
+        earlier = conn.execute(f"SELECT 1 FROM ({inner}) WHERE _key0 < ? LIMIT 1", key_params + params + [key])
+        has_prev = earlier.fetchone() is not None
+    return names[:width], rows, page_keys, has_prev, has_next
+
+@timed("fetch_keyset_page", rows=lambda page: len(page.rows))
+def fetch_keyset_page(conn, cursor=FIRST, page_size=PAGE_SIZE, **filters):
+    """
+    Fetch the page of providers at `cursor` by seeking on the sort key: cost depends on page_size, not on how
+    deep the page is. One extra row is read to tell whether another page follows in the direction of travel.
+    """
+    names, rows, page_keys, has_prev, has_next = _keyset_rows(conn, cursor, page_size, filters)
+    df = pd.DataFrame.from_records(rows, columns=names)
+    if _has_radius(filters):
+        df["distance_miles"] = [round(page_key[0], 1) for page_key in page_keys]
+    first_key, last_key = (page_keys[0], page_keys[-1]) if page_keys else (None, None)
+    return KeysetPage(pq.prepare_provider_frame(df), first_key, last_key, has_prev, has_next)
+
+@timed("fetch_keyset_records", rows=lambda page: len(page.rows))
+def fetch_keyset_records(conn, cursor=FIRST, page_size=PAGE_SIZE, **filters):
+    """
+    fetch_keyset_page with the rows as plain dicts (provider_query.provider_records) instead of a DataFrame,
+    for callers that serialize each page straight away and would only pay for building the frame.
+    """
+    names, rows, page_keys, has_prev, has_next = _keyset_rows(conn, cursor, page_size, filters)
+    records = pq.provider_records(names, rows)
+    if _has_radius(filters):
+        for record, page_key in zip(records, page_keys):
+            record["distance_miles"] = round(page_key[0], 1)
+    first_key, last_key = (page_keys[0], page_keys[-1]) if page_keys else (None, None)
+    return KeysetPage(records, first_key, last_key, has_prev, has_next)
+
+# -------------------- Cached Results --------------------
+
+class MatchResult:
+    """
+    The providers matching one filter signature, as cached in result_cache.ResultCache: `rowids` in sort-key
+    order and `letter_positions` (index of the first last name at or after each of LETTERS, None when last name
+    doesn't lead the sort key). Results over COUNT_LIMIT rows that SQLite would have to sort in full keep only
+    their (approximate) count, and are paged with keyset queries instead.
+    """
+
+    def __init__(self, count, rowids=None, letter_positions=None, exact=True):
+        self.count = count
+        self.rowids = rowids
+        self.letter_positions = letter_positions
+        self.exact = exact
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.rowids, self.letter_positions) if array is not None)
+
+@timed("snapshot_result", rows=lambda result: result.count)
+def snapshot_result(snap, **filters):
+    """Rows of the snapshot matching the facet/grouping/network filters, ordered through the snapshot's name order."""
+    mask = snap.filter_mask(**{name: value for name, value in filters.items() if name in SNAPSHOT_FILTERS})
+    ranks = np.flatnonzero(mask[snap.name_order])
+    letters = np.searchsorted(ranks, [snap.letter_rank(letter) for letter in pq.LETTERS])
+    return MatchResult(len(ranks), snap.rowid[snap.name_order[ranks]], letters)
+
+@timed("sql_result", rows=lambda result: result.count)
+def sql_result(conn, **filters):
+    """Matching rowids in sort-key order, read in one query; only the count when there are over COUNT_LIMIT."""
+    count = approximate_count(conn, **filters)
+    if count > COUNT_LIMIT:
+        return MatchResult(count, exact=False)
+    from_sql, where, params = pq.build_query(indexes=pq.search_indexes(conn), **filters)
+    keys, key_params = sort_order(filters, from_sql)
+    sql = f"SELECT providers.rowid, {pq.NAME_KEY} FROM {from_sql}{pq.LOCATION_JOIN}{where} ORDER BY {', '.join(keys)}"
+    # Sort-key expressions in ORDER BY come after the WHERE clause, so their parameters are bound last
+    rows = conn.execute(sql, params + key_params).fetchall()
+    rowids = np.array([row[0] for row in rows], dtype=np.int64)
+    letters = None
+    if supports_letters(**filters):
+        names = [row[1] for row in rows]
+        letters = np.array([bisect.bisect_left(names, letter) for letter in pq.LETTERS], dtype=np.int64)
+    return MatchResult(len(rows), rowids, letters)
+
+@timed("result_page", rows=lambda page: len(page.rows))
+def result_page(conn, result, cursor=FIRST, page_size=PAGE_SIZE, snap=None, **filters):
+    """
+    Page through a cached MatchResult: keys are positions in result.rowids, so a page is a slice plus one
+    rowid lookup, with the provider names read from `snap` (the snapshot of the same load) when given. Rows deleted since the result was cached are left out, so a page can come back short (even
+    empty) while its keys still step through the slice. Results without rowids are paged with fetch_keyset_page.
+    """
+    if result.rowids is None:
+        return fetch_keyset_page(conn, cursor, page_size, **filters)
+    mode, key = cursor
+    total = len(result.rowids)
+    last_start = max(total - page_size, 0)
+    if mode == "after":
+        start = key + 1
+    elif mode == "before":
+        start = last_start if key is None else max(key - page_size, 0)
+    elif mode == "letter":
+        # Past the last match, the letter lands on the last page
+        start = min(int(result.letter_positions[pq.LETTERS.index(key)]), last_start)
+    else:
+        start = 0
+    end = min(start + page_size, total)
+    rowids = result.rowids[start:end]
+    names = snap.provider_names(rowids) if snap is not None else None
+    rows = pq.fetch_providers_by_rowid(conn, rowids, names)
+    if _has_radius(filters) and not rows.empty:
+        # A refresh can drop a location's coordinates after the result was cached: its distance is left missing
+        distances = [pq.haversine_miles(lat, lon, *filters["center"]) for lat, lon in zip(rows["lat"], rows["lon"])]
+        rows["distance_miles"] = [None if pd.isna(distance) else round(distance, 1) for distance in distances]
+    if start >= end:
+        return KeysetPage(rows, None, None, start > 0, False)
+    return KeysetPage(rows, start, end - 1, start > 0, end < total)
@@ -0,0 +1,381 @@
+import os
+import re
+import math
+import sqlite3
+import pandas as pd
+from instrumentation import timed
+from normalization import format_phone_column, join_present
+
+DB_PATH = os.path.join(os.getcwd(), "providers.db")
+
+# Rename columns for clarity in the app (database short names -> display names). Keys are lowercase: the source
+# files vary in case (Cred / cred, Telehlth / telehlth), so columns are matched case-insensitively.
+COL_RENAMES = {
+    'frst_nm': 'first_name',
+    'lst_nm': 'last_name',
+    'mid_nm': 'middle_name',
+    'cty': 'city',
+    'st': 'state',
+    'zip': 'zip_code',
+    'phn_numbr': 'phone',
+    'assgn': 'medicare_assignment',
+    'telehlth': 'telehealth',
+    'is_telehealth': 'telehealth',
+    'cred': 'Cred'
+}
+
+# Columns the sidebar is allowed to list distinct values for (all backed by an index in db_setup.py)
+FACET_COLUMNS = {"pri_spec", "st", "zip"}
+
+SECONDARY_SPECIALTY_COLUMNS = ["sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]
+
+# Columns scanned by the free-text search box when the FTS5 index is not available
+SEARCH_COLUMNS = ["cty", "pri_spec", "sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4"]
+
+# Per-address columns that live in the locations table (one row per adrs_id) and are joined in for display
+LOCATION_COLUMNS = ["adr_ln_1", "adr_ln_2", "ln_2_sprs", "zip4", "phn_numbr", "lat", "lon"]
+LOCATION_JOIN = " LEFT JOIN locations ON locations.adrs_id = providers.adrs_id"
+
+# Stable sort key for keyset pagination (pagination.py): last name, then NPI, then rowid. Backed by
+# idx_prov_name_key in db_setup.py; NULLs are folded to '' so every row has a comparable key.
+NAME_KEY = "IFNULL(providers.lst_nm, '')"
+NPI_KEY = "IFNULL(providers.NPI, '')"
+LETTERS = [chr(code) for code in range(ord("A"), ord("Z") + 1)]
+
+EARTH_RADIUS_MILES = 3958.8
+
+# -------------------- Connection Helpers --------------------
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between two points (None if any coordinate is missing)."""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+def connect(db_path=DB_PATH, cached_statements=128):
+    """
+    Open a read-only connection to the provider database with the distance function registered.
+    `cached_statements` is the number of prepared statements sqlite3 keeps per connection (keyed by SQL text).
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False,
+                           cached_statements=cached_statements)
+    conn.create_function("haversine_miles", 4, haversine_miles, deterministic=True)
+    return conn
+
+def table_columns(conn, table="providers"):
+    """Return the set of column names present in a table."""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def search_indexes(conn):
+    """
+    Return which auxiliary tables built by db_setup.py exist: a subset of {'providers_fts', 'locations_geo',
+    'provider_networks'} (the last only once Plan-Net memberships are loaded).
+    """
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name IN ('providers_fts', 'locations_geo', 'provider_networks')"
+    )
+    return frozenset(row[0] for row in rows)
+
+def location_select(conn):
+    """Select-list suffix joining in the per-address columns present in the locations table."""
+    present = table_columns(conn, "locations")
+    return "".join(f", locations.{col}" for col in LOCATION_COLUMNS if col in present)
+
+def load_manifest_id(conn):
+    """Id of the latest load_manifest entry (changes on every build/refresh), or None if there is none."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'load_manifest'").fetchone() is None:
+        return None
+    return conn.execute("SELECT MAX(id) FROM load_manifest").fetchone()[0]
+
+# -------------------- Filter -> SQL --------------------
+
+def bounding_box(lat, lon, radius_miles):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_miles around (lat, lon)."""
+    dlat = math.degrees(radius_miles / EARTH_RADIUS_MILES)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(math.degrees(radius_miles / (EARTH_RADIUS_MILES * cos_lat)), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _next_prefix(prefix):
+    """Smallest string greater than every string starting with prefix (for index range scans)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def fts_match_expression(text):
+    """
+    Turn free text into an FTS5 MATCH expression where every word is a quoted prefix term,
+    e.g. "card bost" -> '"card"* "bost"*'. Returns None if the text has no searchable words.
+    """
+    tokens = re.findall(r"[^\W_]+", text.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def build_query(search_query=None, specialties=None, states=None, zip_code=None, center=None, radius=None,
+                groupings=None, phone=None, networks=None, secondary_specialties=None, telehealth=None,
+                assignment=None, credentials=None, indexes=frozenset()):
+    """
+    Translate sidebar selections into a parameterized FROM/WHERE pair.
+    Returns a tuple (from_sql, where_sql, params); where_sql is an empty string when no filter is active.
+    `indexes` names the auxiliary tables available (see search_indexes): with providers_fts the text search
+    runs as a ranked FTS5 MATCH and exposes hits.hit_rank for ordering; with locations_geo the radius
+    bounding box is answered by the R*Tree; without provider_networks a network filter matches nothing. Radius filters run on the (far fewer) unique locations and
+    select providers by adrs_id. Column references are qualified so the result can be joined to locations.
+    """
+    fts = "providers_fts" in indexes
+    from_sql, clauses, params = "providers", [], []
+    if search_query and search_query.strip():
+        match = fts_match_expression(search_query) if fts else None
+        if match:
+            # CROSS JOIN keeps the FTS hits as the outer loop; otherwise SQLite may scan the state / specialty
+            # index and re-run the MATCH subquery for every row it finds
+            from_sql = ("(SELECT rowid AS hit_rowid, rank AS hit_rank FROM providers_fts WHERE providers_fts MATCH ?) AS hits "
+                        "CROSS JOIN providers ON providers.rowid = hits.hit_rowid")
+            params.append(match)
+        elif not fts:
+            pattern = f"%{_escape_like(search_query.strip())}%"
+            likes = ["(TRIM(providers.frst_nm) || ' ' || TRIM(providers.lst_nm)) LIKE ? ESCAPE '\\'"]
+            likes += [f"providers.{col} LIKE ? ESCAPE '\\'" for col in SEARCH_COLUMNS]
+            clauses.append("(" + " OR ".join(likes) + ")")
+            params += [pattern] * len(likes)
+    if specialties:
+        # IN (...) on pri_spec / st lets SQLite use idx_prov_pri_spec / idx_prov_state
+        clauses.append(f"providers.pri_spec IN ({', '.join('?' * len(specialties))})")
+        params += list(specialties)
+    if states:
+        clauses.append(f"providers.st IN ({', '.join('?' * len(states))})")
+        params += list(states)
+    if secondary_specialties:
+        # A secondary specialty may sit in any of the four slots, each backed by its own index
+        placeholders = ", ".join("?" * len(secondary_specialties))
+        clauses.append("(" + " OR ".join(f"providers.{col} IN ({placeholders})" for col in SECONDARY_SPECIALTY_COLUMNS) + ")")
+        params += list(secondary_specialties) * len(SECONDARY_SPECIALTY_COLUMNS)
+    for column, values in (("telehlth", telehealth), ("assgn", assignment), ("cred", credentials)):
+        if values:
+            clauses.append(f"providers.{column} IN ({', '.join('?' * len(values))})")
+            params += list(values)
+    if groupings:
+        # Taxonomy groupings select the NUCC codes under them, then providers through idx_prov_pri_spec_code
+        clauses.append(f"providers.pri_spec_code IN (SELECT code FROM taxonomy WHERE grouping IN ({', '.join('?' * len(groupings))}))")
+        params += list(groupings)
+    if networks and "provider_networks" not in indexes:
+        # No memberships loaded: no provider is in any network
+        clauses.append("0")
+    elif networks:
+        # Network members come from the provider_networks primary key (network_id, npi), then idx_prov_npi
+        clauses.append(f"providers.NPI IN (SELECT npi FROM provider_networks WHERE network_id IN ({', '.join('?' * len(networks))}))")
+        params += [int(network) for network in networks]
+    zip_prefix = re.sub(r"\D", "", zip_code or "")[:5]
+    if zip_prefix:
+        # ZIPs are stored as 5 digits (the +4 is locations.zip4), so a prefix is a range scan over idx_prov_zip
+        clauses.append("providers.zip >= ? AND providers.zip < ?")
+        params += [zip_prefix, _next_prefix(zip_prefix)]
+    phone_prefix = re.sub(r"\D", "", phone or "")
+    if len(phone_prefix) == 11 and phone_prefix.startswith("1"):
+        phone_prefix = phone_prefix[1:]
+    if phone_prefix:
+        # Phones are stored as 10 digits, so a number prefix is a range scan over idx_loc_phone
+        clauses.append("providers.adrs_id IN (SELECT adrs_id FROM locations WHERE phn_numbr >= ? AND phn_numbr < ?)")
+        params += [phone_prefix, _next_prefix(phone_prefix)]
+    if center is not None and radius:
+        center_lat, center_lon = center
+        min_lat, max_lat, min_lon, max_lon = bounding_box(center_lat, center_lon, radius)
+        # Cheap bounding-box prefilter first, exact distance only on the remaining candidate locations
+        if "locations_geo" in indexes:
+            box = ("rowid IN (SELECT id FROM locations_geo "
+                   "WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?)")
+        else:
+            box = "lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"
+        clauses.append(f"providers.adrs_id IN (SELECT adrs_id FROM locations "
+                       f"WHERE {box} AND haversine_miles(lat, lon, ?, ?) <= ?)")
+        params += [min_lat, max_lat, min_lon, max_lon, center_lat, center_lon, radius]
+    where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return from_sql, where_sql, params
+
+# -------------------- Queries --------------------
+
+@timed("count_providers")
+def count_providers(conn, limit=None, **filters):
+    """Return the number of providers matching the filters (counting stops at `limit` when given)."""
+    from_sql, where, params = build_query(indexes=search_indexes(conn), **filters)
+    if limit is not None:
+        sql = f"SELECT COUNT(*) FROM (SELECT 1 FROM {from_sql}{where} LIMIT ?)"
+        return conn.execute(sql, params + [limit]).fetchone()[0]
+    return conn.execute(f"SELECT COUNT(*) FROM {from_sql}{where}", params).fetchone()[0]
+
+def filter_signature(**filters):
+    """
+    Normalized, hashable form of the sidebar filters: empty filters dropped, text stripped and lowercased,
+    multiselect values sorted. Filters that select the same providers map to the same signature.
+    """
+    signature = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, str):
+            value = value.strip()
+            value = value.lower() if name == "search_query" else value
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            value = tuple(sorted(value)) if name != "center" else tuple(round(float(v), 6) for v in value)
+        if value:
+            signature.append((name, value))
+    return tuple(signature)
+
+def distinct_values(conn, column, **filters):
+    """Return sorted distinct non-null values of an indexed column for the given filters."""
+    if column not in FACET_COLUMNS:
+        raise ValueError(f"Unsupported facet column: {column}")
+    from_sql, where, params = build_query(indexes=search_indexes(conn), **filters)
+    where = f"{where} AND providers.{column} IS NOT NULL" if where else f" WHERE providers.{column} IS NOT NULL"
+    rows = conn.execute(f"SELECT DISTINCT providers.{column} FROM {from_sql}{where} ORDER BY 1", params)
+    return [row[0] for row in rows]
+
+@timed("fetch_providers_by_rowid", rows=len)
+def fetch_providers_by_rowid(conn, rowids, names=None):
+    """
+    Fetch the providers with the given rowids (e.g. one page of a snapshot filter), in the order given. Rowids that
+    are gone (deleted by a refresh since the page was cut) are skipped, so the frame can be shorter than rowids.
+    `names` are precomputed provider names for the rowids (from the snapshot), used instead of building them.
+    """
+    rowids = [int(r) for r in rowids]
+    select = f"SELECT providers.rowid AS _rowid, providers.*{location_select(conn)} FROM providers{LOCATION_JOIN}"
+    if not rowids:
+        return prepare_provider_frame(pd.read_sql(f"{select} LIMIT 0", conn).drop(columns="_rowid"))
+    df = pd.read_sql(f"{select} WHERE providers.rowid IN ({', '.join('?' * len(rowids))})", conn, params=rowids)
+    df = df.set_index("_rowid")
+    kept = [i for i, rowid in enumerate(rowids) if rowid in df.index]
+    df = df.loc[[rowids[i] for i in kept]].reset_index(drop=True)
+    return prepare_provider_frame(df, None if names is None else [names[i] for i in kept])
+
+@timed("fetch_providers_by_npi", rows=len)
+def fetch_providers_by_npi(conn, npi):
+    """Fetch every row for an NPI (one per practice location / group enrollment) through idx_prov_npi."""
+    sql = (f"SELECT providers.*{location_select(conn)} FROM providers{LOCATION_JOIN} "
+           "WHERE providers.NPI = ? ORDER BY providers.rowid")
+    return prepare_provider_frame(pd.read_sql(sql, conn, params=[str(npi)]))
+
+def display_columns(names):
+    """Display names of database columns (COL_RENAMES, any case); when two columns map to one name the first wins."""
+    display, taken = [], set(names)
+    for name in names:
+        renamed = COL_RENAMES.get(name.lower(), name)
+        if renamed != name and renamed in taken:
+            renamed = name
+        taken.add(renamed)
+        display.append(renamed)
+    return display
+
+def prepare_provider_frame(df, names=None):
+    """Rename database columns for display and build the combined provider_name field (or take it from names)."""
+    df = df.set_axis(display_columns(list(df.columns)), axis=1)
+    if names is not None:
+        df['provider_name'] = pd.Series(names, index=df.index, dtype=object)
+    # If the data has separate name fields, create a full name for easy display/search
+    elif 'first_name' in df.columns and 'last_name' in df.columns:
+        df['provider_name'] = df['first_name'].str.strip() + " " + df['last_name'].str.strip()
+        df['provider_name'] = df['provider_name'].str.replace(r'\s+', ' ', regex=True)  # clean double spaces
+    else:
+        # If there's already a combined name field, use it
+        df['provider_name'] = df.get('provider_name', df.get('name'))
+    return df
+
+def _full_name(first, last):
+    if first is None or last is None:
+        return None
+    return re.sub(r"\s+", " ", f"{first.strip()} {last.strip()}")
+
+def provider_records(names, rows):
+    """
+    Row tuples (as read from a cursor with the given column names) -> dicts shaped like prepare_provider_frame:
+    display column names plus provider_name, without building a DataFrame.
+    """
+    keys = display_columns(list(names))
+    records = [dict(zip(keys, row)) for row in rows]
+    if "first_name" in keys and "last_name" in keys:
+        for record in records:
+            record["provider_name"] = _full_name(record["first_name"], record["last_name"])
+    return records
+
+# -------------------- Display Formatting --------------------
+
+TABLE_COLUMNS = ["Provider Name", "Specialty", "Address", "Phone", "Telehealth", "Accepts Medicare", "Distance (miles)"]
+
+TELEHEALTH_YES = ["Y", "TRUE", "1"]
+ASSIGNMENT_LABELS = {'Y': "Yes", 'M': "Partial (May Accept)"}
+
+def _text_column(df, col):
+    """Return (values, present) for a column: values as strings ('' when missing), present where non-empty."""
+    if col not in df.columns:
+        empty = pd.Series("", index=df.index, dtype=object)
+        return empty, empty != ""
+    values = df[col].where(df[col].notna(), "").astype(str)
+    return values, values != ""
+
+@timed("format_provider_table", rows=len)
+def format_provider_table(df):
+    """
+    Build the display table (Provider Name, Specialty, Address, ...) for a page of providers
+    using column-wise string operations instead of a per-row loop.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+    index = df.index
+    # Provider Name, with the credential appended if available
+    names, _ = _text_column(df, 'provider_name')
+    cred, has_cred = _text_column(df, 'Cred')
+    names = names.mask(has_cred, names + ", " + cred)
+
+    # Specialty: primary specialty followed by any non-blank secondary specialties
+    specialties, _ = _text_column(df, 'pri_spec')
+    secondary = []
+    for col in ['sec_spec_1', 'sec_spec_2', 'sec_spec_3', 'sec_spec_4']:
+        values, _ = _text_column(df, col)
+        secondary.append((values, values.str.strip() != ""))
+    sec_joined = join_present(secondary, "; ", index)
+    has_secondary = pd.Series(False, index=index)
+    for _, present in secondary:
+        has_secondary = has_secondary | present
+    specialties = specialties.mask(has_secondary, specialties + "; " + sec_joined)
+
+    # Address: line 1; line 2; City, State, ZIP
+    line1, has_line1 = _text_column(df, 'adr_ln_1')
+    line2, _ = _text_column(df, 'adr_ln_2')
+    line2 = line2.str.strip()
+    city_state_zip = []
+    for col in ['city', 'state', 'zip_code']:
+        values, present = _text_column(df, col)
+        city_state_zip.append((values.str.strip(), present))
+    zip4, has_zip4 = _text_column(df, 'zip4')
+    zip_values, has_zip = city_state_zip[2]
+    city_state_zip[2] = (zip_values.mask(has_zip & has_zip4, zip_values + "-" + zip4), has_zip)
+    csz_joined = join_present(city_state_zip, ", ", index)
+    has_csz = city_state_zip[0][1] | city_state_zip[1][1] | city_state_zip[2][1]
+    address = join_present([(line1.str.strip(), has_line1), (line2, line2 != ""), (csz_joined, has_csz)], "; ", index)
+
+    phone, _ = _text_column(df, 'phone')
+    phone = format_phone_column(phone).fillna("")
+
+    # Telehealth and Medicare assignment are low-cardinality codes, so translate them by lookup
+    tele, _ = _text_column(df, 'telehealth')
+    tele_text = pd.Series("No", index=index, dtype=object).mask(tele.str.strip().str.upper().isin(TELEHEALTH_YES), "Yes")
+    assign = _text_column(df, 'medicare_assignment')[0].str.strip().str.upper()
+    assign_text = assign.map(ASSIGNMENT_LABELS).fillna(assign)
+
+    if 'distance_miles' in df.columns:
+        distance = df['distance_miles'].astype(object).where(df['distance_miles'].notna(), "")
+    else:
+        distance = pd.Series("", index=index, dtype=object)
+
+    table = pd.DataFrame({
+        "Provider Name": names,
+        "Specialty": specialties,
+        "Address": address,
+        "Phone": phone.str.strip(),
+        "Telehealth": tele_text,
+        "Accepts Medicare": assign_text,
+        "Distance (miles)": distance,
+    }, columns=TABLE_COLUMNS)
+    return table.reset_index(drop=True)
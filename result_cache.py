@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+# Bounds on the results kept per process (all Streamlit sessions share one cache)
+RESULT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+RESULT_CACHE_MAX_ENTRIES = 256
+
+class ResultCache:
+    """
+    Size-bounded LRU of query results keyed by filter signature (provider_query.filter_signature), shared by
+    every session in the process. Values expose `nbytes`, which counts against max_bytes. The cache remembers
+    the load manifest id its entries were computed under and empties itself when a lookup brings a new one,
+    so a rebuild or refresh of the database never serves stale rows.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._manifest_id = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_manifest(self, manifest_id):
+        if manifest_id != self._manifest_id:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._manifest_id = manifest_id
+
+    def get(self, signature, manifest_id):
+        """Cached value for the signature, or None (counted as a hit or a miss)."""
+        with self._lock:
+            self._check_manifest(manifest_id)
+            value = self._entries.get(signature)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(signature)
+            self.hits += 1
+            return value
+
+    def put(self, signature, manifest_id, value):
+        """Store a value, evicting least recently used entries until the cache is within its bounds."""
+        with self._lock:
+            self._check_manifest(manifest_id)
+            old = self._entries.pop(signature, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            if value.nbytes > self.max_bytes:
+                return
+            self._entries[signature] = value
+            self.bytes += value.nbytes
+            while self.bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_compute(self, signature, manifest_id, compute):
+        """Cached value for the signature, computing and storing it with compute() on a miss."""
+        value = self.get(signature, manifest_id)
+        if value is None:
+            value = compute()
+            self.put(signature, manifest_id, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.bytes,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
@@ -0,0 +1,64 @@
+import pandas as pd
+
+# Compact in-memory dtypes for provider columns, keyed by lowercase column name.
+# Both naming schemes are listed: db_setup.py's CMS short names and data_loader.py's descriptive names.
+# Enumerations (states, specialties, flags, credentials) repeat millions of times, so they become categoricals
+# (one small integer code per row plus a shared dictionary); counts and years become nullable integers.
+CATEGORY_COLUMNS = [
+    "st", "state",
+    "cty", "city",
+    "zip", "zip_code",          # ZIPs are fixed-width digit strings with ~40k distinct values: dictionary-encode them
+    "zip4",
+    "pri_spec", "pri_spec_code", "sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4",
+    "gndr", "gender",
+    "cred", "credential",
+    "med_sch", "med_school",
+    "telehlth", "is_telehealth", "telehealth",
+    "assgn", "ind_assgn", "grp_assgn", "medicare_assignment",
+    "ln_2_sprs", "address_line_2_suppression",
+    # NPPES enrichment (data_loader.py)
+    "nppes_enumeration_type", "nppes_status", "nppes_taxonomy_code", "nppes_taxonomy_desc", "nppes_license_state",
+]
+INTEGER_COLUMNS = {
+    "grd_yr": "Int16", "grad_year": "Int16",
+    "num_org_mem": "Int32", "number_of_group_members": "Int32",
+    "npi_valid": "Int8",
+}
+COLUMN_DTYPES = {**{col: "category" for col in CATEGORY_COLUMNS}, **INTEGER_COLUMNS}
+
+# SQLite storage type for columns that are not TEXT
+SQL_TYPES = {"Int8": "INTEGER", "Int16": "INTEGER", "Int32": "INTEGER"}
+
+def column_dtype(col):
+    """Declared compact dtype for a column name (case-insensitive), or None if it stays a plain string."""
+    return COLUMN_DTYPES.get(col.lower())
+
+def sql_type(col, default="TEXT"):
+    """SQLite column type for a column under this schema."""
+    return SQL_TYPES.get(column_dtype(col) or "", default)
+
+def apply_schema(df):
+    """Convert the columns of df that the schema declares to their compact dtypes (in place) and return df."""
+    for col in df.columns:
+        dtype = column_dtype(col)
+        if dtype is None or df[col].dtype == dtype:
+            continue
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").round().astype(dtype)
+    return df
+
+def memory_usage_mb(df):
+    """Deep memory usage of each column of df in MB."""
+    return df.memory_usage(deep=True, index=False) / (1024 * 1024)
+
+def memory_report(before_mb, df):
+    """
+    Compare per-column memory (MB) captured with memory_usage_mb() before apply_schema against df afterwards.
+    Returns a DataFrame with before_mb, after_mb, dtype and ratio columns plus a TOTAL row.
+    """
+    report = pd.DataFrame({"before_mb": before_mb, "after_mb": memory_usage_mb(df), "dtype": df.dtypes.astype(str)})
+    report.loc["TOTAL"] = [report["before_mb"].sum(), report["after_mb"].sum(), ""]
+    report["ratio"] = (report["before_mb"] / report["after_mb"]).round(1)
+    return report.round(2)
@@ -0,0 +1,311 @@
+import os
+import glob
+import json
+import shutil
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+from provider_query import NAME_KEY, NPI_KEY, LETTERS
+from networks import has_networks, network_postings
+from facets import FacetIndex, FACET_FILTERS, write_facets, pack_mask, unpack_words, popcount
+from name_index import NameIndex, chunk_term_counts, write_name_index
+from taxonomy import grouping_codes
+
+SNAPSHOT_DIR = os.path.join(os.getcwd(), "providers_snapshot")
+
+# Low-cardinality columns stored as dictionary-encoded int16 codes (-1 = missing), matched case-insensitively
+CATEGORY_COLUMNS = ["st", "pri_spec", "pri_spec_code", "sec_spec_1", "sec_spec_2", "sec_spec_3", "sec_spec_4",
+                    "assgn", "ind_assgn", "grp_assgn", "telehlth", "is_telehealth", "cred", "gndr"]
+FLOAT_COLUMNS = ["lat", "lon"]
+
+# Filters answered by ProviderSnapshot.filter_mask (any other active filter needs SQL)
+SNAPSHOT_FILTERS = set(FACET_FILTERS) | {"groupings", "networks"}
+
+# -------------------- Snapshot Reader --------------------
+
+class ProviderSnapshot:
+    """
+    Read-only, memory-mapped columnar view of the providers table written by write_snapshot().
+    Arrays are np.load(mmap_mode='r') views, so every process mapping the same snapshot shares its pages.
+    Row i of every array corresponds to providers.rowid == snapshot.rowid[i].
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.rows = meta["rows"]
+        self.manifest_id = meta.get("manifest_id")
+        self.rowid = self._load("rowid.npy")
+        # Row positions in last name / NPI / rowid order (pagination.py), absent in snapshots from older builds
+        self.name_order = self._load("name_order.npy") if os.path.exists(os.path.join(path, "name_order.npy")) else None
+        # Precomputed provider_name (UTF-8 bytes + offsets), absent in snapshots from older builds
+        self._name_offsets = None
+        if os.path.exists(os.path.join(path, "provider_name.offsets.npy")):
+            self._name_offsets = self._load("provider_name.offsets.npy")
+            self._name_data = np.memmap(os.path.join(path, "provider_name.bin"), dtype=np.uint8, mode="r") \
+                if self._name_offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        # Plan-Net network memberships (see networks.network_postings), absent when the build had none
+        self.has_networks = meta.get("networks", False)
+        if self.has_networks:
+            self._network_offsets = self._load("network_offsets.npy")
+            self._network_rows = self._load("network_rows.npy")
+        # Per-value row bitmaps of the sidebar facets (facets.py), absent in snapshots from older builds
+        self.facets = FacetIndex(path, meta["facets"], self.rows) if meta.get("facets") else None
+        # Trigram index of the name words for "did you mean" suggestions (name_index.py), absent in older snapshots
+        self.names = NameIndex(path) if meta.get("name_terms") else None
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.path, filename), mmap_mode="r")
+
+    def has_column(self, col):
+        return col in self.meta["categories"] or col in self.meta["floats"]
+
+    def categories(self, col):
+        """Dictionary (sorted distinct values) of a category column."""
+        return self.meta["categories"][col]
+
+    def codes(self, col):
+        """int16 code array of a category column; -1 marks missing values."""
+        return self._load(f"{col}.codes.npy")
+
+    def isin_mask(self, col, values):
+        """Boolean row mask for `col in values`, evaluated as an integer comparison on the category codes."""
+        lookup = {value: code for code, value in enumerate(self.categories(col))}
+        targets = np.array([lookup[value] for value in values if value in lookup], dtype=np.int16)
+        return np.isin(self.codes(col), targets)
+
+    def network_mask(self, networks):
+        """Boolean row mask of the providers in any of the given networks (ids from the networks table)."""
+        mask = np.zeros(self.rows, dtype=bool)
+        for network in networks:
+            if 0 <= network < len(self._network_offsets) - 1:
+                mask[self._network_rows[self._network_offsets[network]:self._network_offsets[network + 1]]] = True
+        return mask
+
+    def grouping_codes(self, groupings):
+        """NUCC codes under the given taxonomy groupings (as read by taxonomy.grouping_codes at build time)."""
+        return [code for grouping in groupings for code in self.meta.get("groupings", {}).get(grouping, [])]
+
+    def _base_words(self, groupings=None, networks=None):
+        """Bitmap words of the taxonomy grouping and network selections (None when neither is set)."""
+        base = pack_mask(self.network_mask(networks)) if networks else None
+        if groupings:
+            words = self.facets.selection_words("pri_spec_code", self.grouping_codes(groupings))
+            base = words if base is None else base & words
+        return base
+
+    def _facet_selections(self, selections):
+        return {FACET_FILTERS[name]: values for name, values in selections.items() if name in FACET_FILTERS and values}
+
+    def filter_mask(self, groupings=None, networks=None, **selections):
+        """
+        Row mask for the sidebar's selections: facet filters by their facets.FACET_FILTERS names (specialties,
+        states, credentials, ...), taxonomy groupings and networks; all rows when none is set. With facet bitmaps
+        this is an OR per facet and an AND across facets on bitmap words; network masks cost the size of the
+        selected networks. Snapshots without bitmaps support specialties, states, groupings and networks only.
+        """
+        if self.facets is not None:
+            words = self.facets.match_words(self._facet_selections(selections), self._base_words(groupings, networks))
+            return unpack_words(words, self.rows)
+        mask = self.network_mask(networks) if networks else np.ones(self.rows, dtype=bool)
+        if selections.get("specialties"):
+            mask &= self.isin_mask("pri_spec", selections["specialties"])
+        if selections.get("states"):
+            mask &= self.isin_mask("st", selections["states"])
+        if groupings:
+            mask &= self.isin_mask("pri_spec_code", self.grouping_codes(groupings))
+        return mask
+
+    def facet_counts(self, groupings=None, networks=None, **selections):
+        """
+        Live counts for the sidebar under the current selections (same arguments as filter_mask):
+        {facet filter name: {value: count}} plus "groupings": {grouping: count}. Each facet is counted under the
+        other facets' selections, so its own options keep their counts while some are selected.
+        """
+        facet_selections = self._facet_selections(selections)
+        counts = self.facets.facet_counts(facet_selections, self._base_words(groupings, networks),
+                                          facets=list(FACET_FILTERS.values()))
+        result = {name: counts[facet] for name, facet in FACET_FILTERS.items() if facet in counts}
+        words = self.facets.match_words(facet_selections, self._base_words(None, networks))
+        result["groupings"] = {grouping: int(popcount(self.facets.selection_words("pri_spec_code", codes) & words))
+                               for grouping, codes in self.meta.get("groupings", {}).items()}
+        return result
+
+    def groupings(self):
+        """Sorted taxonomy groupings of the primary specialties present in the snapshot."""
+        present = set(self.categories("pri_spec_code")) if self.has_column("pri_spec_code") else set()
+        return sorted(g for g, codes in self.meta.get("groupings", {}).items() if present.intersection(codes))
+
+    def floats(self, col):
+        return self._load(f"{col}.npy")
+
+    def letter_rank(self, letter):
+        """Rank in name_order of the first row whose last name sorts at or after `letter`."""
+        return self.meta["letter_ranks"].get(letter, self.rows)
+
+    def provider_names(self, rowids):
+        """
+        Precomputed provider_name of each of the given providers.rowids (None where a name part is missing), or
+        None when the snapshot has no names or lacks one of the rowids (the caller then builds the names itself).
+        """
+        if self._name_offsets is None:
+            return None
+        rowids = np.asarray(rowids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.rowid, rowids), max(self.rows - 1, 0))
+        if len(rowids) and (self.rows == 0 or not np.array_equal(self.rowid[rows], rowids)):
+            return None
+        starts, ends = self._name_offsets[rows], self._name_offsets[rows + 1]
+        return [bytes(self._name_data[start:end]).decode("utf-8") or None for start, end in zip(starts, ends)]
+
+def load_snapshot(path=SNAPSHOT_DIR):
+    """
+    Memory-map a snapshot directory; returns None if no snapshot has been written. The path is resolved first, so
+    the snapshot keeps reading the version it was loaded from after write_snapshot publishes a new one.
+    """
+    path = os.path.realpath(path)
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return ProviderSnapshot(path, meta)
+
+# -------------------- Snapshot Writer --------------------
+
+def _provider_name(first, last):
+    """Same full-name rule as provider_query.prepare_provider_frame, with missing names as ''."""
+    name = first.str.strip() + " " + last.str.strip()
+    return name.str.replace(r"\s+", " ", regex=True).fillna("")
+
+def write_snapshot(db_path, out_dir=SNAPSHOT_DIR, chunk_size=200_000):
+    """
+    Write a columnar snapshot of the providers table: dictionary-encoded categories, float coordinates,
+    the providers.rowid of each row, a precomputed provider_name (UTF-8 bytes + offsets), per-value bitmaps of the
+    sidebar facets, a trigram index of the words in provider and organization names and, when the database has
+    Plan-Net networks, the row positions of each network's members.
+    Streams the table into a new version directory next to out_dir, then points the out_dir symlink at it with one
+    atomic rename, so readers always find a complete snapshot at out_dir.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1].lower(): row[1] for row in conn.execute("PRAGMA table_info(providers)")}
+        # Coordinates are per address: they live in the locations table and are joined in by adrs_id
+        loc_columns = {row[1].lower(): row[1] for row in conn.execute("PRAGMA table_info(locations)")}
+        cat_cols = [columns[col] for col in CATEGORY_COLUMNS if col in columns]
+        float_cols = [loc_columns[col] for col in FLOAT_COLUMNS if col in loc_columns]
+        org_cols = [columns[col] for col in ["org_nm"] if col in columns]
+        n = conn.execute("SELECT COUNT(*) FROM providers").fetchone()[0]
+        manifest_id = None
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'load_manifest'").fetchone():
+            manifest_id = conn.execute("SELECT MAX(id) FROM load_manifest").fetchone()[0]
+
+        parent = os.path.dirname(os.path.abspath(out_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + ".v", dir=parent)
+        os.chmod(tmp_dir, 0o755)
+        open_memmap = np.lib.format.open_memmap
+        rowid = open_memmap(os.path.join(tmp_dir, "rowid.npy"), mode="w+", dtype=np.int64, shape=(n,))
+        codes = {col: open_memmap(os.path.join(tmp_dir, f"{col}.codes.npy"), mode="w+", dtype=np.int16, shape=(n,))
+                 for col in cat_cols}
+        floats = {col: open_memmap(os.path.join(tmp_dir, f"{col}.npy"), mode="w+", dtype=np.float32, shape=(n,))
+                  for col in float_cols}
+        offsets = open_memmap(os.path.join(tmp_dir, "provider_name.offsets.npy"), mode="w+", dtype=np.int64, shape=(n + 1,))
+        offsets[0] = 0
+        dictionaries = {col: {} for col in cat_cols}
+
+        select_cols = ", ".join(["providers.rowid"] + [f'providers."{col}"' for col in cat_cols]
+                                + [f'locations."{col}"' for col in float_cols] + ["providers.frst_nm", "providers.lst_nm"]
+                                + [f'providers."{col}"' for col in org_cols])
+        join = " LEFT JOIN locations ON locations.adrs_id = providers.adrs_id" if float_cols else ""
+        cursor = conn.execute(f"SELECT {select_cols} FROM providers{join} ORDER BY providers.rowid")
+        names = ["rowid"] + cat_cols + float_cols + ["frst_nm", "lst_nm"] + org_cols
+        term_counts = []
+        pos = 0
+        with open(os.path.join(tmp_dir, "provider_name.bin"), "wb") as name_file:
+            while True:
+                batch = cursor.fetchmany(chunk_size)
+                if not batch:
+                    break
+                chunk = pd.DataFrame.from_records(batch, columns=names)
+                end = pos + len(chunk)
+                rowid[pos:end] = chunk["rowid"].to_numpy()
+                for col in cat_cols:
+                    # Encode the chunk locally, then translate its few local codes to global dictionary codes
+                    local = pd.Categorical(chunk[col])
+                    dictionary = dictionaries[col]
+                    lookup = np.array([dictionary.setdefault(value, len(dictionary)) for value in local.categories] + [-1])
+                    codes[col][pos:end] = lookup[local.codes]
+                for col in float_cols:
+                    floats[col][pos:end] = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=np.float32)
+                encoded = [name.encode("utf-8") for name in _provider_name(chunk["frst_nm"], chunk["lst_nm"])]
+                offsets[pos + 1:end + 1] = offsets[pos] + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+                name_file.write(b"".join(encoded))
+                term_counts.append(chunk_term_counts(chunk[["frst_nm", "lst_nm"] + org_cols]))
+                pos = end
+
+        # Re-number codes so each dictionary is sorted (the sidebar lists values in order)
+        categories = {}
+        for col in cat_cols:
+            values = sorted(dictionaries[col], key=str)
+            if len(values) > np.iinfo(np.int16).max:
+                raise ValueError(f"Too many distinct values in {col} for a category column")
+            remap = np.empty(len(values) + 1, dtype=np.int16)
+            remap[[dictionaries[col][v] for v in values]] = np.arange(len(values), dtype=np.int16)
+            remap[-1] = -1
+            codes[col][:] = remap[codes[col]]
+            categories[col] = values
+        # Facet bitmaps (one per value of each sidebar facet) from the finished codes
+        facet_values = write_facets(tmp_dir, n, codes, categories)
+        # Name word trigram index, from the providers per word summed over the chunks
+        term_counts = pd.concat(term_counts).groupby(level=0).sum() if term_counts else pd.Series(dtype=np.int64)
+        name_terms = write_name_index(tmp_dir, term_counts)
+        # Name order for keyset pagination: read from idx_prov_name_key and mapped from rowids to row positions
+        order = np.fromiter((row[0] for row in conn.execute(
+            f"SELECT rowid FROM providers ORDER BY {NAME_KEY}, {NPI_KEY}, rowid")), dtype=np.int64, count=n)
+        name_order = open_memmap(os.path.join(tmp_dir, "name_order.npy"), mode="w+", dtype=np.int32, shape=(n,))
+        name_order[:] = np.searchsorted(rowid, order)
+        # Rank of the first last name at or after each letter = number of names starting with an earlier character
+        first_chars = conn.execute(f"SELECT SUBSTR({NAME_KEY}, 1, 1) AS c, COUNT(*) FROM providers GROUP BY c ORDER BY c").fetchall()
+        letter_ranks = {letter: sum(count for char, count in first_chars if char < letter) for letter in LETTERS}
+
+        with_networks = has_networks(conn)
+        if with_networks:
+            network_offsets, network_rows = network_postings(conn, rowid)
+            np.save(os.path.join(tmp_dir, "network_offsets.npy"), network_offsets)
+            np.save(os.path.join(tmp_dir, "network_rows.npy"), network_rows)
+
+        for array in [rowid, offsets, name_order, *codes.values(), *floats.values()]:
+            array.flush()
+        del rowid, offsets, name_order, codes, floats
+
+        # NUCC codes per taxonomy grouping, so grouping filters become pri_spec_code comparisons
+        has_taxonomy = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'taxonomy'").fetchone()
+        groupings = grouping_codes(conn) if has_taxonomy else {}
+
+        meta = {"rows": n, "manifest_id": manifest_id, "categories": categories, "floats": float_cols,
+                "letter_ranks": letter_ranks, "groupings": groupings, "networks": with_networks,
+                "facets": facet_values, "name_terms": name_terms}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    finally:
+        conn.close()
+
+    # Publish: a symlink to the new version is renamed over out_dir, which replaces the old link atomically
+    previous = os.path.realpath(out_dir) if os.path.islink(out_dir) else None
+    link = tmp_dir + ".link"
+    os.symlink(os.path.basename(tmp_dir), link)
+    if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+        # A plain snapshot directory from an older build, moved aside once (missing only between the two renames)
+        shutil.rmtree(out_dir + ".old", ignore_errors=True)
+        os.replace(out_dir, out_dir + ".old")
+    os.replace(link, out_dir)
+    shutil.rmtree(out_dir + ".old", ignore_errors=True)
+    # The previous version stays for readers still loading it; older ones (and failed builds) are removed.
+    # Processes still mapping removed files keep their (unlinked) pages.
+    for version in glob.glob(glob.escape(os.path.join(parent, os.path.basename(out_dir))) + ".v*"):
+        if os.path.islink(version):
+            os.remove(version)
+        elif os.path.realpath(version) not in (os.path.realpath(tmp_dir), previous):
+            shutil.rmtree(version, ignore_errors=True)
+    return out_dir
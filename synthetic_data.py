@@ -0,0 +1,156 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+LOCAL_TAXONOMY_PATH = os.path.join(os.getcwd(), "nucc_taxonomy_250.csv")
+ZIP_CENTROIDS_PATH = os.path.join(os.getcwd(), "zip_centroids.csv")
+
+# Column headers of the CMS "Doctors and Clinicians" National Downloadable File
+CMS_COLUMNS = [
+    "NPI", "Ind_PAC_ID", "Ind_enrl_ID", "Provider Last Name", "Provider First Name", "Provider Middle Name",
+    "suff", "gndr", "Cred", "Med_sch", "Grd_yr", "pri_spec", "sec_spec_1", "sec_spec_2", "sec_spec_3",
+    "sec_spec_4", "sec_spec_all", "Telehlth", "Facility Name", "org_pac_id", "num_org_mem", "adr_ln_1",
+    "adr_ln_2", "ln_2_sprs", "City/Town", "State", "ZIP Code", "Telephone Number", "ind_assgn", "grp_assgn",
+    "adrs_id",
+]
+
+# The most common primary specialties in the CMS file, roughly in proportion; the long tail comes from NUCC
+COMMON_SPECIALTIES = {
+    "NURSE PRACTITIONER": 18.0, "INTERNAL MEDICINE": 9.0, "FAMILY PRACTICE": 8.5, "PHYSICIAN ASSISTANT": 8.0,
+    "PHYSICAL THERAPY": 5.0, "EMERGENCY MEDICINE": 4.0, "DIAGNOSTIC RADIOLOGY": 3.0, "ANESTHESIOLOGY": 3.0,
+    "CERTIFIED REGISTERED NURSE ANESTHETIST (CRNA)": 3.0, "OBSTETRICS/GYNECOLOGY": 2.5, "CARDIOLOGY": 2.5,
+    "CLINICAL SOCIAL WORKER": 2.5, "PSYCHIATRY": 2.0, "ORTHOPEDIC SURGERY": 2.0, "GENERAL SURGERY": 1.8,
+    "OPTOMETRY": 1.8, "CHIROPRACTIC": 1.6, "CLINICAL PSYCHOLOGIST": 1.5, "PEDIATRIC MEDICINE": 1.2,
+    "OPHTHALMOLOGY": 1.2, "GASTROENTEROLOGY": 1.0, "NEUROLOGY": 1.0, "DERMATOLOGY": 0.9, "UROLOGY": 0.8,
+}
+
+FIRST_NAMES = ["JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH",
+               "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CHRISTOPHER",
+               "KAREN", "DANIEL", "LISA", "MATTHEW", "NANCY", "ANTHONY", "SANDRA", "MARK", "ASHLEY", "PRIYA", "WEI",
+               "MARIA", "JOSE", "AHMED", "FATIMA", "HIROSHI", "MEI", "RAJESH", "ANA", "OLUWASEUN", "DMITRI"]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ",
+              "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR", "MOORE", "JACKSON", "MARTIN",
+              "LEE", "PEREZ", "THOMPSON", "WHITE", "HARRIS", "SANCHEZ", "CLARK", "RAMIREZ", "LEWIS", "ROBINSON",
+              "PATEL", "NGUYEN", "KIM", "CHEN", "SHAH", "WANG", "SINGH", "COHEN", "OKAFOR", "IVANOV"]
+CREDENTIALS = {"": 40.0, "MD": 30.0, "NP": 10.0, "PA": 7.0, "DO": 5.0, "PT": 3.0, "DPM": 1.0, "OD": 1.0, "DC": 1.0,
+               "CNA": 1.0, "PHD": 1.0}
+MED_SCHOOLS = ["OTHER", "UNIVERSITY OF MICHIGAN MEDICAL SCHOOL", "HARVARD MEDICAL SCHOOL",
+               "NEW YORK UNIVERSITY SCHOOL OF MEDICINE", "UNIVERSITY OF TEXAS MEDICAL BRANCH AT GALVESTON",
+               "OHIO STATE UNIVERSITY COLLEGE OF MEDICINE", "INDIANA UNIVERSITY SCHOOL OF MEDICINE",
+               "UNIVERSITY OF ILLINOIS COLLEGE OF MEDICINE", "TEMPLE UNIVERSITY SCHOOL OF MEDICINE"]
+STREET_NAMES = ["MAIN ST", "OAK AVE", "MEDICAL CENTER DR", "PARK BLVD", "HOSPITAL RD", "WASHINGTON ST",
+                "HEALTH WAY", "ELM ST", "CENTRAL AVE", "UNIVERSITY DR"]
+
+# -------------------- Helpers --------------------
+
+def _weighted(rng, values, weights, size):
+    weights = np.asarray(weights, dtype=float)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+def npi_check_digit(base9):
+    """Luhn check digit for 9-digit NPI bases (with the 80840 card-issuer prefix), vectorized over an int array."""
+    digits = (base9[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+    doubled = digits[:, 0::2] * 2  # positions 1, 3, 5, 7, 9 (from the left) are doubled
+    total = 24 + (doubled // 10 + doubled % 10).sum(axis=1) + digits[:, 1::2].sum(axis=1)
+    return (10 - total % 10) % 10
+
+def specialty_pool(taxonomy_path=LOCAL_TAXONOMY_PATH):
+    """Specialty names and sampling weights: common CMS specialties plus a Zipf-weighted NUCC tail."""
+    taxonomy = pd.read_csv(taxonomy_path, dtype=str).fillna("")
+    physicians = taxonomy[taxonomy["Grouping"].str.contains("Physician|Behavioral|Chiropractic|Podiatric", regex=True)]
+    tail = sorted(set(physicians["Classification"].str.upper()) - set(COMMON_SPECIALTIES) - {""})
+    names = list(COMMON_SPECIALTIES) + tail
+    tail_weights = 0.5 / np.arange(1, len(tail) + 1) ** 1.1
+    return names, np.concatenate([list(COMMON_SPECIALTIES.values()), tail_weights * 3])
+
+def zip_pool(zip_path=ZIP_CENTROIDS_PATH, rng=None):
+    """ZIP rows (zip, city, state) with weights skewed toward large states and a few dense ZIPs per state."""
+    zips = pd.read_csv(zip_path, dtype=str)
+    zips = zips[zips["state"].str.len() == 2].reset_index(drop=True)
+    state_weight = zips["state"].map(zips["state"].value_counts() ** 1.5)
+    # Zipf rank within each state (random order) so that metro ZIPs carry most of a state's clinicians
+    rank = zips.sample(frac=1.0, random_state=rng.integers(1 << 31)).groupby("state").cumcount() + 1
+    weights = state_weight / zips["state"].map(zips["state"].value_counts()) / rank.reindex(zips.index) ** 0.9
+    return zips, weights.to_numpy()
+
+# -------------------- Generator --------------------
+
+def generate_chunk(rng, n, start, specialties, zips):
+    """Generate n Physician Compare-shaped rows; row ids continue from start."""
+    spec_names, spec_weights = specialties
+    zip_rows, zip_weights = zips
+    ids = np.arange(start, start + n)
+
+    # Clinicians work at shared practice addresses (about four rows per address)
+    address_ids = rng.integers(0, max(n // 4, 1), size=n) + start
+    zip_idx = np.random.default_rng(start).choice(len(zip_rows), size=max(n // 4, 1), p=zip_weights / zip_weights.sum())
+    place = zip_rows.iloc[zip_idx[address_ids - start]].reset_index(drop=True)
+    plus4 = pd.Series(address_ids % 10000).astype(str).str.zfill(4).to_numpy(dtype=object)
+
+    base9 = 100000000 + (ids * 7919) % 900000000
+    npi = base9 * 10 + npi_check_digit(base9)
+    pri = _weighted(rng, spec_names, spec_weights, n)
+    secondary = [np.where(rng.random(n) < p, _weighted(rng, spec_names, spec_weights, n), "")
+                 for p in (0.25, 0.08, 0.03, 0.01)]
+    sec_all = pd.Series(secondary[0], dtype=object)
+    for sec in secondary[1:]:
+        sec_all = sec_all.where(sec == "", sec_all + "," + sec).str.strip(",")
+
+    df = pd.DataFrame({
+        "NPI": npi.astype(str),
+        "Ind_PAC_ID": (1000000000 + ids).astype(str),
+        "Ind_enrl_ID": ["I2" + str(10 ** 12 + i) for i in ids],
+        "Provider Last Name": _weighted(rng, LAST_NAMES, np.ones(len(LAST_NAMES)), n),
+        "Provider First Name": _weighted(rng, FIRST_NAMES, np.ones(len(FIRST_NAMES)), n),
+        "Provider Middle Name": np.where(rng.random(n) < 0.5, _weighted(rng, list("ABCDEJKLMRS"), np.ones(11), n), ""),
+        "suff": np.where(rng.random(n) < 0.02, "JR", ""),
+        "gndr": _weighted(rng, ["F", "M"], [0.55, 0.45], n),
+        "Cred": _weighted(rng, list(CREDENTIALS), list(CREDENTIALS.values()), n),
+        "Med_sch": _weighted(rng, MED_SCHOOLS, [20] + [1] * (len(MED_SCHOOLS) - 1), n),
+        "Grd_yr": rng.integers(1965, 2023, size=n).astype(str),
+        "pri_spec": pri,
+        "sec_spec_1": secondary[0], "sec_spec_2": secondary[1], "sec_spec_3": secondary[2], "sec_spec_4": secondary[3],
+        "sec_spec_all": sec_all.to_numpy(),
+        "Telehlth": np.where(rng.random(n) < 0.3, "Y", ""),
+        "Facility Name": ["PRACTICE GROUP " + str(a % 50000) for a in address_ids],
+        "org_pac_id": (2000000000 + address_ids % 50000).astype(str),
+        "num_org_mem": (1 + address_ids % 200).astype(str),
+        "adr_ln_1": [f"{100 + a % 9000} " + STREET_NAMES[a % len(STREET_NAMES)] for a in address_ids],
+        "adr_ln_2": np.where(address_ids % 10 < 3, "SUITE " + (address_ids % 500).astype(str), ""),
+        "ln_2_sprs": "",
+        "City/Town": place["city"].str.upper().to_numpy(),
+        "State": place["state"].to_numpy(),
+        "ZIP Code": np.where(address_ids % 5 < 3, place["zip"].to_numpy(dtype=object) + plus4, place["zip"].to_numpy(dtype=object)),
+        "Telephone Number": (2000000000 + (address_ids * 104729) % 7999999999).astype(str),
+        "ind_assgn": _weighted(rng, ["Y", "M"], [0.9, 0.1], n),
+        "grp_assgn": _weighted(rng, ["Y", "M"], [0.85, 0.15], n),
+        "adrs_id": ["AD" + str(a) for a in address_ids],
+    }, columns=CMS_COLUMNS)
+    return df
+
+def generate_csv(path, rows, seed=0, chunk_size=250_000):
+    """Write a synthetic Physician Compare CSV with `rows` rows to path in chunks; returns path."""
+    rng = np.random.default_rng(seed)
+    specialties = specialty_pool()
+    zips = zip_pool(rng=rng)
+    written = 0
+    with open(path, "w", newline="") as f:
+        while written < rows:
+            n = min(chunk_size, rows - written)
+            generate_chunk(rng, n, written, specialties, zips).to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic CMS Physician Compare CSV for benchmarking.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Number of rows (e.g. 10000, 100000, 1000000, 3000000)")
+    parser.add_argument("--output", default=None, help="Output CSV path (default: synthetic_<rows>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    output = args.output or f"synthetic_{args.rows}.csv"
+    generate_csv(output, args.rows, args.seed)
+    print(f"Wrote {args.rows:,} synthetic provider rows to {output}")
+
+if __name__ == "__main__":
+    main()
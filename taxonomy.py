@@ -0,0 +1,228 @@
+import os
+import re
+import difflib
+import numpy as np
+import pandas as pd
+import requests
+
+NUCC_TAXONOMY_CSV_URL = "https://www.nucc.org/images/stories/CSV/nucc_taxonomy_250.csv"
+LOCAL_TAXONOMY_PATH = os.path.join(os.getcwd(), "nucc_taxonomy_250.csv")
+
+# CMS specialty names that differ from every NUCC name, mapped to the NUCC code they correspond to
+ALIASES = {
+    "CARDIOLOGY": "207RC0000X",                     # Internal Medicine / Cardiovascular Disease
+    "CARDIAC ELECTROPHYSIOLOGY": "207RC0001X",
+    "INTERVENTIONAL CARDIOLOGY": "207RI0011X",
+    "FAMILY PRACTICE": "207Q00000X",                # Family Medicine
+    "GENERAL SURGERY": "208600000X",                # Surgery
+    "PEDIATRIC MEDICINE": "208000000X",             # Pediatrics
+    "CLINICAL SOCIAL WORKER": "1041C0700X",
+    "CLINICAL PSYCHOLOGIST": "103TC0700X",
+    "PSYCHOLOGIST, CLINICAL": "103TC0700X",
+    "PHYSICAL THERAPY": "225100000X",               # Physical Therapist
+    "PHYSICAL THERAPIST IN PRIVATE PRACTICE": "225100000X",
+    "OCCUPATIONAL THERAPY": "225X00000X",
+    "OCCUPATIONAL THERAPIST IN PRIVATE PRACTICE": "225X00000X",
+    "OPTOMETRY": "152W00000X",                      # Optometrist
+    "CHIROPRACTIC": "111N00000X",                   # Chiropractor
+    "PODIATRY": "213E00000X",                       # Podiatrist
+    "CERTIFIED NURSE MIDWIFE (CNM)": "367A00000X",
+    "CERTIFIED CLINICAL NURSE SPECIALIST (CNS)": "364S00000X",
+    "ANESTHESIOLOGY ASSISTANT": "367H00000X",
+    "REGISTERED DIETITIAN OR NUTRITION PROFESSIONAL": "133V00000X",
+    "AUDIOLOGIST (BILLING INDEPENDENTLY)": "231H00000X",
+    "SPEECH LANGUAGE PATHOLOGIST": "235Z00000X",
+    "ORAL SURGERY (DENTIST ONLY)": "1223S0112X",
+    "MAXILLOFACIAL SURGERY": "204E00000X",
+    "VASCULAR SURGERY": "2086S0129X",
+    "CARDIAC SURGERY": "208G00000X",                # Thoracic Surgery (Cardiothoracic Vascular Surgery)
+    "HEMATOLOGY/ONCOLOGY": "207RH0003X",
+    "HEMATOLOGY": "207RH0000X",
+    "MEDICAL ONCOLOGY": "207RX0202X",
+    "RADIATION ONCOLOGY": "2085R0001X",
+    "INFECTIOUS DISEASE": "207RI0200X",
+    "PULMONARY DISEASE": "207RP1001X",
+    "CRITICAL CARE (INTENSIVISTS)": "207RC0200X",
+    "GERIATRIC MEDICINE": "207RG0300X",
+    "GERIATRIC PSYCHIATRY": "2084P0805X",
+    "SLEEP MEDICINE": "207RS0012X",
+    "SPORTS MEDICINE": "207QS0010X",
+    "HOSPICE/PALLIATIVE CARE": "207RH0002X",
+    "INTERVENTIONAL PAIN MANAGEMENT": "208VP0014X",
+    "PAIN MANAGEMENT": "208VP0000X",
+    "INTERVENTIONAL RADIOLOGY": "2085R0204X",
+    "NEUROPSYCHIATRY": "2084B0040X",
+    "ADDICTION MEDICINE": "207RA0401X",
+    "OSTEOPATHIC MANIPULATIVE MEDICINE": "204D00000X",
+    "PHYSICAL MEDICINE AND REHABILITATION": "208100000X",
+}
+
+# Words ignored when comparing names token by token ("Obstetrics/Gynecology" ~ "Obstetrics & Gynecology")
+STOPWORDS = {"AND", "OF", "THE", "IN", "FOR", "OR"}
+
+# Minimum similarity (0-1) for a fuzzy match, and the word prefix length fuzzy candidates must share
+FUZZY_THRESHOLD = 0.9
+FUZZY_PREFIX = 4
+
+# -------------------- Download --------------------
+
+def download_taxonomy():
+    """Download the NUCC taxonomy CSV if not already present."""
+    if os.path.exists(LOCAL_TAXONOMY_PATH):
+        return
+    try:
+        print("Downloading NUCC taxonomy data...")
+        response = requests.get(NUCC_TAXONOMY_CSV_URL)
+        response.raise_for_status()
+        with open(LOCAL_TAXONOMY_PATH, "wb") as f:
+            f.write(response.content)
+        print("Downloaded NUCC taxonomy CSV to", LOCAL_TAXONOMY_PATH)
+    except Exception as e:
+        print("Failed to download NUCC taxonomy CSV. Please download it manually.", e)
+        raise
+
+# -------------------- Name Normalization --------------------
+
+def normalize_name(text):
+    """Uppercase, '&' spelled out, punctuation dropped and whitespace collapsed: 'Allergy & Immunology' -> 'ALLERGY AND IMMUNOLOGY'."""
+    text = str(text).upper().replace("&", " AND ")
+    return " ".join(re.findall(r"[A-Z0-9]+", text))
+
+def token_key(text):
+    """Order-insensitive key of the significant words of a name."""
+    return " ".join(sorted(set(normalize_name(text).split()) - STOPWORDS))
+
+def name_variants(raw):
+    """
+    Forms of a raw specialty worth looking up, most specific first: as given, without parenthetical notes,
+    the parenthetical alone, and with a 'Noun, Qualifier' inversion undone ('Nurse Anesthetist, Certified Registered').
+    """
+    variants = [raw]
+    without_notes = re.sub(r"\([^)]*\)", " ", raw).strip()
+    if without_notes and without_notes != raw:
+        variants.append(without_notes)
+    variants += re.findall(r"\(([^)]*)\)", raw)
+    for variant in list(variants):
+        if variant.count(",") == 1:
+            head, tail = variant.split(",")
+            variants.append(f"{tail.strip()} {head.strip()}")
+    return variants
+
+# -------------------- Taxonomy Lookup --------------------
+
+class Taxonomy:
+    """
+    The NUCC taxonomy as a compact lookup. `codes` is the code table (Code, Grouping, Classification,
+    Specialization, name) with one canonical display name per code. Raw specialty strings resolve to a
+    (code, name) pair through ALIASES, exact normalized names, order-insensitive token keys and finally a fuzzy
+    token match; each distinct raw string is resolved once per Taxonomy and remembered.
+    """
+
+    def __init__(self, taxonomy_df):
+        df = taxonomy_df.fillna("").apply(lambda col: col.str.strip())
+        spec, classification = df["Specialization"], df["Classification"]
+        # Specialization names shared by several classifications ("Clinical", "Addiction Medicine") are shown
+        # with their display name, which says which one is meant
+        shared = spec.ne("") & spec.duplicated(keep=False)
+        display = df["Display Name"].str.replace(r" Physician$", "", regex=True)
+        name = classification.where(spec.eq(""), spec.where(~shared, display))
+        self.codes = pd.DataFrame({"Code": df["Code"], "Grouping": df["Grouping"], "Classification": classification,
+                                   "Specialization": spec, "name": name}).set_index("Code")
+
+        # Names to (code, canonical name), first entry wins: classifications with a code of their own, then
+        # classifications known only through their specializations (which share Grouping and Classification,
+        # so the first specialization's code stands in), then specialization and display names.
+        # Deactivated codes stay in the code table but are never matched.
+        active = ~df["Display Name"].str.startswith("Deactivated")
+        bare = active & spec.eq("")
+        entries = [(c, n, (n,)) for c, n in zip(df["Code"][bare], classification[bare])]
+        entries += [(c, n, (n,)) for c, n in zip(df["Code"][active], classification[active])]
+        entries += [(c, n, (s, d)) for c, n, s, d in zip(df["Code"][active], name[active], spec[active], df["Display Name"][active])]
+        self._exact, self._tokens = {}, {}
+        for code, canonical, texts in entries:
+            for text in texts:
+                if text:
+                    self._exact.setdefault(normalize_name(text), (code, canonical))
+                    self._tokens.setdefault(token_key(text), (code, canonical))
+        # Aliases override whatever an alias spelling would otherwise have matched
+        for alias, code in ALIASES.items():
+            if code in self.codes.index:
+                self._exact[normalize_name(alias)] = (code, self.codes.at[code, "name"])
+        # Inverted index from word prefix to token keys, so fuzzy matching only scores names sharing one
+        self._by_prefix = {}
+        for key in self._tokens:
+            for word in key.split():
+                self._by_prefix.setdefault(word[:FUZZY_PREFIX], []).append(key)
+        self._resolved = {}
+
+    def _fuzzy(self, text):
+        key = token_key(text)
+        candidates = {candidate for word in key.split() for candidate in self._by_prefix.get(word[:FUZZY_PREFIX], [])}
+        best, best_score = None, FUZZY_THRESHOLD
+        for candidate in sorted(candidates):
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score > best_score or (best is None and score >= best_score):
+                best, best_score = candidate, score
+        return self._tokens[best] if best is not None else None
+
+    def match(self, raw):
+        """(NUCC code, canonical name) for a raw specialty string, or None when nothing matches closely enough."""
+        if raw is None or (isinstance(raw, float) and np.isnan(raw)) or not str(raw).strip():
+            return None
+        raw = str(raw).strip()
+        if raw in self._resolved:
+            return self._resolved[raw]
+        variants = name_variants(raw)
+        found = next((self._exact[normalize_name(v)] for v in variants if normalize_name(v) in self._exact), None)
+        if found is None:
+            found = next((self._tokens[token_key(v)] for v in variants if token_key(v) in self._tokens), None)
+        if found is None:
+            found = next((f for f in map(self._fuzzy, variants) if f is not None), None)
+        self._resolved[raw] = found
+        return found
+
+    def normalize_column(self, values):
+        """
+        Normalize a column of raw specialty strings. Returns (names, codes) Series: the canonical NUCC name
+        (the raw value when unmatched) and the NUCC code (missing when unmatched). Only the distinct values
+        are matched; the results are broadcast back through the categorical codes.
+        """
+        categorical = pd.Categorical(values)
+        matches = [self.match(value) for value in categorical.categories]
+        names = [found[1] if found else value for found, value in zip(matches, categorical.categories)]
+        codes = [found[0] if found else None for found in matches]
+        lookup_names = np.array(names + [None], dtype=object)  # code -1 (missing) picks the trailing None
+        lookup_codes = np.array(codes + [None], dtype=object)
+        return (pd.Series(lookup_names[categorical.codes], index=values.index, dtype=object),
+                pd.Series(lookup_codes[categorical.codes], index=values.index, dtype=object))
+
+def load_taxonomy(path=LOCAL_TAXONOMY_PATH):
+    """Read the NUCC taxonomy CSV into a Taxonomy lookup."""
+    return Taxonomy(pd.read_csv(path, dtype=str))
+
+# -------------------- Database --------------------
+
+def create_taxonomy_table(conn, taxonomy):
+    """(Re)create the taxonomy table: one row per NUCC code with its Grouping / Classification / Specialization."""
+    conn.execute("DROP TABLE IF EXISTS taxonomy")
+    conn.execute("CREATE TABLE taxonomy (code TEXT PRIMARY KEY, grouping TEXT, classification TEXT, "
+                 "specialization TEXT, name TEXT)")
+    rows = taxonomy.codes.reset_index()[["Code", "Grouping", "Classification", "Specialization", "name"]]
+    conn.executemany("INSERT OR IGNORE INTO taxonomy VALUES (?, ?, ?, ?, ?)", rows.itertuples(index=False, name=None))
+    conn.execute("CREATE INDEX idx_taxonomy_grouping ON taxonomy(grouping)")
+
+def has_taxonomy(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'taxonomy'").fetchone() is not None
+
+def provider_groupings(conn):
+    """Sorted taxonomy groupings that at least one provider's primary specialty belongs to."""
+    rows = conn.execute("SELECT DISTINCT grouping FROM taxonomy "
+                        "WHERE EXISTS (SELECT 1 FROM providers WHERE providers.pri_spec_code = taxonomy.code) ORDER BY 1")
+    return [row[0] for row in rows]
+
+def grouping_codes(conn):
+    """{grouping: [NUCC codes]} for every grouping in the taxonomy table."""
+    codes = {}
+    for grouping, code in conn.execute("SELECT grouping, code FROM taxonomy ORDER BY grouping, code"):
+        codes.setdefault(grouping, []).append(code)
+    return codes
@@ -0,0 +1,51 @@
+import sqlite3
+import itertools
+import adequacy
+
+# total_providers reads only the rollups; it must still count a clinician once across states and specialties
+
+PROVIDERS = [
+    # NPI, state, specialty
+    ("1", "RI", "CARDIOLOGY"), ("1", "MA", "CARDIOLOGY"), ("1", "CT", "CARDIOLOGY"),
+    ("2", "RI", "CARDIOLOGY"), ("2", "MA", "FAMILY PRACTICE"),
+    ("3", "MA", "FAMILY PRACTICE"), ("3", "MA", "FAMILY PRACTICE"),
+    ("4", "CT", "NEPHROLOGY"), ("4", "XX", "NEPHROLOGY"),
+    ("5", "XX", "CARDIOLOGY"),
+]
+POPULATION = [("02903", "RI", "PROVIDENCE", 41.82, -71.41, 1000.0), ("02118", "MA", "SUFFOLK", 42.34, -71.07, 2000.0),
+              ("06103", "CT", "HARTFORD", 41.77, -72.67, 1500.0), ("99999", "XX", None, 0.0, 0.0, 0.0)]
+
+def adequacy_db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE providers (NPI TEXT, st TEXT, pri_spec TEXT, zip TEXT, adrs_id TEXT)")
+    conn.execute("CREATE TABLE locations (adrs_id TEXT PRIMARY KEY, lat REAL, lon REAL)")
+    conn.execute("CREATE TABLE population_zip (zip5 TEXT PRIMARY KEY, st TEXT, county TEXT, lat REAL, lon REAL, "
+                 "population REAL)")
+    zips = {st: zip5 for zip5, st, *_ in POPULATION}
+    conn.executemany("INSERT INTO providers VALUES (?, ?, ?, ?, ?)",
+                     [(npi, st, spec, zips[st], f"A{i}") for i, (npi, st, spec) in enumerate(PROVIDERS)])
+    conn.executemany("INSERT INTO locations VALUES (?, ?, ?)",
+                     [(f"A{i}", 41.8, -71.4) for i in range(len(PROVIDERS))])
+    conn.executemany("INSERT INTO population_zip VALUES (?, ?, ?, ?, ?, ?)", POPULATION)
+    adequacy.write_adequacy_rollups(conn, adequacy.compute_adequacy_rollups(conn))
+    return conn
+
+def distinct_npis(specialties, states):
+    # Only states with population count, as in state_adequacy
+    return len({npi for npi, st, spec in PROVIDERS if st != "XX"
+                and (not specialties or spec in specialties) and (not states or st in states)})
+
+def test_total_providers_counts_distinct_npis():
+    conn = adequacy_db()
+    specialties = ["CARDIOLOGY", "FAMILY PRACTICE", "NEPHROLOGY"]
+    states = ["RI", "MA", "CT", "XX"]
+    for spec_count, state_count in itertools.product(range(4), range(5)):
+        for specs in itertools.combinations(specialties, spec_count):
+            for sts in itertools.combinations(states, state_count):
+                assert adequacy.total_providers(conn, list(specs), list(sts)) == distinct_npis(specs, sts), (specs, sts)
+
+def test_state_rows_exceed_the_distinct_total():
+    conn = adequacy_db()
+    by_state = adequacy.state_adequacy(conn)
+    assert by_state["state"].tolist() == ["CT", "MA", "RI"]
+    assert by_state["providers"].sum() == 7 and adequacy.total_providers(conn) == 4
@@ -0,0 +1,22 @@
+import pytest
+from starlette.datastructures import QueryParams
+from starlette.exceptions import HTTPException
+import api
+
+# Invalid query parameters are rejected with a 400 instead of being ignored
+
+@pytest.mark.parametrize("query", ["zip=abc", "zip=1234567", "zip=02118-12", "phone=abc", "network=x", "radius=far"])
+def test_invalid_filters_are_rejected(query):
+    with pytest.raises(HTTPException) as error:
+        api.parse_filters(QueryParams(query))
+    assert error.value.status_code == 400
+
+@pytest.mark.parametrize("query, zip_code", [("zip=021", "021"), ("zip=02118", "02118"), ("zip=02118-1234", "02118-1234")])
+def test_zip_prefixes_are_accepted(query, zip_code):
+    assert api.parse_filters(QueryParams(query))["zip_code"] == zip_code
+
+@pytest.mark.parametrize("token", [api.encode_cursor("after", []), "not-a-cursor", api.encode_cursor("sideways", ["A"])])
+def test_invalid_cursors_are_rejected(token):
+    with pytest.raises(HTTPException) as error:
+        api.decode_cursor(token)
+    assert error.value.status_code == 400
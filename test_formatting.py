@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as tm
+import provider_query as pq
+from data_loader import format_address_column
+
+# The column-wise formatters must reproduce the per-row loops they replaced. The loops are kept here as they were
+# in main.py and data_loader.py, as the reference.
+
+# -------------------- Reference Loops --------------------
+
+def loop_provider_table(df_page):
+    """
+    The iterrows table build formerly in main.py. Rows are walked as records so missing values stay None, as
+    they arrive from SQLite (iterrows turns them into NaN on pandas 3).
+    """
+    table_records = []
+    for row in df_page.to_dict("records"):
+        name_line = row.get('provider_name', '')
+        if row.get('Cred') and pd.notna(row.get('Cred')):
+            name_line += ", " + str(row['Cred'])
+
+        specialties = ""
+        if row.get('pri_spec'):
+            specialties = str(row['pri_spec'])
+        sec_list = []
+        for col in ['sec_spec_1', 'sec_spec_2', 'sec_spec_3', 'sec_spec_4']:
+            val = row.get(col)
+            if val and pd.notna(val) and str(val).strip():
+                sec_list.append(str(val))
+        if sec_list:
+            specialties += "; " + "; ".join(sec_list)
+
+        address_parts = []
+        if row.get('adr_ln_1'):
+            address_parts.append(str(row['adr_ln_1']).strip())
+        if row.get('adr_ln_2') and str(row['adr_ln_2']).strip():
+            address_parts.append(str(row['adr_ln_2']).strip())
+        city_state_zip = []
+        if row.get('city'):
+            city_state_zip.append(str(row['city']).strip())
+        if row.get('state'):
+            city_state_zip.append(str(row['state']).strip())
+        if row.get('zip_code'):
+            city_state_zip.append(str(row['zip_code']).strip())
+        if city_state_zip:
+            address_parts.append(", ".join(city_state_zip))
+        address = "; ".join(address_parts)
+
+        phone = str(row.get('phone')).strip() if row.get('phone') else ""
+
+        tele = row.get('telehealth')
+        if tele and pd.notna(tele):
+            tele = str(tele).strip().upper()
+            tele_text = "Yes" if tele in ["Y", "TRUE", "1"] else "No"
+        else:
+            tele_text = "No"
+
+        assign_val = row.get('medicare_assignment')
+        if assign_val and pd.notna(assign_val):
+            assign_val = str(assign_val).strip().upper()
+            if assign_val == 'Y':
+                assign_text = "Yes"
+            elif assign_val == 'M':
+                assign_text = "Partial (May Accept)"
+            else:
+                assign_text = assign_val
+        else:
+            assign_text = ""
+
+        distance = row.get('distance_miles', "")
+
+        table_records.append({
+            "Provider Name": name_line,
+            "Specialty": specialties,
+            "Address": address,
+            "Phone": phone,
+            "Telehealth": tele_text,
+            "Accepts Medicare": assign_text,
+            "Distance (miles)": distance
+        })
+    return pd.DataFrame(table_records)
+
+def format_address(line1, line2, city, state, zip_code, line2_suppression=None):
+    """The scalar address formatter formerly in data_loader.py."""
+    parts = []
+    if line1 and not pd.isna(line1):
+        parts.append(str(line1).strip())
+    if line2 and not pd.isna(line2):
+        if line2_suppression and str(line2_suppression).strip().upper() == 'Y':
+            pass
+        else:
+            parts.append(str(line2).strip())
+    if city and not pd.isna(city):
+        parts.append(str(city).strip())
+    if state and not pd.isna(state):
+        parts.append(str(state).strip())
+    if zip_code and not pd.isna(zip_code):
+        parts.append(str(zip_code).strip())
+    return ", ".join(parts)
+
+# -------------------- Fixtures --------------------
+
+def provider_page():
+    """A page of providers with missing, blank and padded parts (missing values arrive from SQLite as None)."""
+    return pd.DataFrame({
+        'provider_name': ["JOHN SMITH", "MARY JONES", "ANA LOPEZ", "LEE KIM", "SAM ROE"],
+        'Cred': ["MD", None, "NP", "", "DO"],
+        'pri_spec': ["CARDIOLOGY", "FAMILY PRACTICE", None, "INTERNAL MEDICINE", ""],
+        'sec_spec_1': ["INTERNAL MEDICINE", None, "GERIATRIC MEDICINE", "  ", None],
+        'sec_spec_2': [None, "SPORTS MEDICINE", None, "NEPHROLOGY", None],
+        'sec_spec_3': [None, None, "PALLIATIVE CARE", None, None],
+        'sec_spec_4': [None, None, None, None, "HOSPITALIST"],
+        'adr_ln_1': ["1 MAIN ST ", None, "5 ELM AVE", "", "9 OAK RD"],
+        'adr_ln_2': ["SUITE 200", "  ", None, "FLOOR 3", None],
+        'city': ["BOSTON", "AUSTIN", None, "DENVER", ""],
+        'state': ["MA", "TX", "CA", None, "NY"],
+        'zip_code': ["02118", None, "94110", "80202", "10001"],
+        'phone': ["(617) 555-0100", None, " 555-0199 ", "", "(212) 555-0123"],
+        'telehealth': ["Y", "N", None, "true", " 1"],
+        'medicare_assignment': ["Y", "M", None, "n", ""],
+    }, dtype=object)
+
+def address_rows():
+    """Raw address columns with None, NaN, blank and suppressed second lines."""
+    return pd.DataFrame({
+        "address_line_1": ["1 MAIN ST", None, " 5 ELM AVE ", np.nan, "9 OAK RD"],
+        "address_line_2": ["SUITE 200", "UNIT 4", None, "FLOOR 3", "APT 1"],
+        "address_line_2_suppression": [None, "Y", None, "N", " y"],
+        "city": ["BOSTON", "AUSTIN", np.nan, "DENVER", None],
+        "state": ["MA", "TX", "CA", None, "NY"],
+        "zip_code": ["02118", None, "94110", "80202", np.nan],
+    }, dtype=object)
+
+# -------------------- Tests --------------------
+
+def test_provider_table_matches_loop():
+    page = provider_page()
+    tm.assert_frame_equal(pq.format_provider_table(page), loop_provider_table(page), check_dtype=False)
+
+def test_provider_table_matches_loop_with_distance():
+    page = provider_page().assign(distance_miles=[0.4, 12.0, 3.3, 7.5, 99.9])
+    tm.assert_frame_equal(pq.format_provider_table(page), loop_provider_table(page), check_dtype=False)
+
+def test_address_column_matches_scalar_formatter():
+    df = address_rows()
+    expected = [format_address(row.address_line_1, row.address_line_2, row.city, row.state, row.zip_code,
+                               row.address_line_2_suppression) for row in df.itertuples()]
+    assert format_address_column(df).tolist() == expected
+
+def test_address_column_without_optional_columns():
+    df = address_rows().drop(columns=["address_line_2", "address_line_2_suppression"])
+    expected = [format_address(row.address_line_1, None, row.city, row.state, row.zip_code) for row in df.itertuples()]
+    assert format_address_column(df).tolist() == expected
+
+def test_provider_name_column_matches_scalar_rule():
+    rows = [("JOHN", "SMITH"), (" MARY ", "ANN  JONES"), ("ANA", None), (None, "LOPEZ"), ("LEE", " KIM ")]
+    df = pq.prepare_provider_frame(pd.DataFrame(rows, columns=["frst_nm", "lst_nm"], dtype=object))
+    names = df["provider_name"].astype(object).where(df["provider_name"].notna(), None).tolist()
+    assert names == [pq._full_name(first, last) for first, last in rows]
+
+def test_database_columns_renamed_in_any_case():
+    for tele, cred in [("Telehlth", "Cred"), ("telehlth", "cred")]:
+        raw = pd.DataFrame({"frst_nm": ["ANA"], "lst_nm": ["LOPEZ"], cred: ["NP"], tele: ["Y"]}, dtype=object)
+        table = pq.format_provider_table(pq.prepare_provider_frame(raw))
+        assert table.loc[0, "Telehealth"] == "Yes"
+        assert table.loc[0, "Provider Name"] == "ANA LOPEZ, NP"
+        records = pq.provider_records(list(raw.columns), raw.itertuples(index=False, name=None))
+        assert records[0]["telehealth"] == "Y" and records[0]["Cred"] == "NP"
@@ -0,0 +1,42 @@
+import sqlite3
+import pytest
+import pandas as pd
+from starlette.exceptions import HTTPException
+import api
+import networks
+import pagination
+
+# Network filters against a database built without Plan-Net memberships (no networks / provider_networks tables)
+
+def provider_db(with_networks=False):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE providers (NPI TEXT, lst_nm TEXT, frst_nm TEXT, st TEXT, adrs_id TEXT)")
+    conn.execute("CREATE TABLE locations (adrs_id TEXT PRIMARY KEY, adr_ln_1 TEXT, lat REAL, lon REAL)")
+    conn.executemany("INSERT INTO providers VALUES (?, ?, ?, ?, ?)",
+                     [("1000000001", "SMITH", "JOHN", "RI", "A1"), ("1000000002", "JONES", "MARY", "RI", "A2")])
+    conn.executemany("INSERT INTO locations VALUES (?, ?, ?, ?)", [("A1", "1 MAIN ST", 41.8, -71.4),
+                                                                  ("A2", "2 ELM ST", 41.7, -71.5)])
+    if with_networks:
+        networks.create_network_tables(conn, pd.DataFrame({
+            "npi": ["1000000001"], "payer": ["ACME"], "network_id": ["N1"], "network_name": ["Acme Gold"]}))
+    return conn
+
+def test_network_filter_without_memberships_matches_nothing():
+    page = pagination.fetch_keyset_records(provider_db(), networks=[5], states=["RI"])
+    assert page.rows == [] and not page.has_next
+
+def test_network_filter_with_memberships():
+    page = pagination.fetch_keyset_records(provider_db(with_networks=True), networks=[1])
+    assert [row["NPI"] for row in page.rows] == ["1000000001"]
+
+def test_api_rejects_network_without_memberships():
+    with pytest.raises(HTTPException) as error:
+        api.check_networks(provider_db(), {"networks": [5]})
+    assert error.value.status_code == 400
+
+def test_api_rejects_unknown_network():
+    conn = provider_db(with_networks=True)
+    api.check_networks(conn, {"networks": [1]})
+    with pytest.raises(HTTPException) as error:
+        api.check_networks(conn, {"networks": [1, 7]})
+    assert error.value.status_code == 400
@@ -0,0 +1,33 @@
+import sqlite3
+import pandas as pd
+import provider_query as pq
+import pagination
+
+# Pages of a cached radius result after a refresh has changed the rows it points at
+
+def provider_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE providers (NPI TEXT, lst_nm TEXT, frst_nm TEXT, st TEXT, adrs_id TEXT)")
+    conn.execute("CREATE TABLE locations (adrs_id TEXT PRIMARY KEY, adr_ln_1 TEXT, lat REAL, lon REAL)")
+    conn.executemany("INSERT INTO providers VALUES (?, ?, ?, ?, ?)",
+                     [("1000000001", "SMITH", "JOHN", "RI", "A1"), ("1000000002", "JONES", "MARY", "RI", "A2")])
+    conn.executemany("INSERT INTO locations VALUES (?, ?, ?, ?)", [("A1", "1 MAIN ST", 41.8, -71.4),
+                                                                  ("A2", "2 ELM ST", 41.7, -71.5)])
+    conn.commit()
+    return conn
+
+def test_radius_page_after_coordinates_are_dropped(tmp_path):
+    db_path = str(tmp_path / "providers.db")
+    writer = provider_db(db_path)
+    conn = pq.connect(db_path)
+    filters = {"center": (41.8, -71.4), "radius": 25}
+    result = pagination.sql_result(conn, **filters)
+    assert result.count == 2
+    writer.execute("UPDATE locations SET lat = NULL, lon = NULL WHERE adrs_id = 'A2'")
+    writer.commit()
+    rows = pagination.result_page(conn, result, **filters).rows
+    assert rows["distance_miles"].iloc[0] == 0.0 and pd.isna(rows["distance_miles"].iloc[1])
+    assert pq.format_provider_table(rows)["Distance (miles)"].tolist()[1] == ""
+    # A page whose only row lost its coordinates (lat/lon read back as None rather than NaN)
+    rows = pagination.result_page(conn, result, ("after", 0), page_size=1, **filters).rows
+    assert rows["NPI"].tolist() == ["1000000002"] and pd.isna(rows["distance_miles"].iloc[0])
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import pandas as pd
+import provider_query as pq
+import snapshot
+
+# write_snapshot publishes by repointing a symlink, and keeps provider_name precomputed for the page rows
+
+def provider_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE providers (NPI TEXT, lst_nm TEXT, frst_nm TEXT, pri_spec TEXT, st TEXT, adrs_id TEXT)")
+    conn.execute("CREATE TABLE locations (adrs_id TEXT PRIMARY KEY, lat REAL, lon REAL)")
+    conn.executemany("INSERT INTO providers VALUES (?, ?, ?, ?, ?, ?)", [
+        ("1000000001", "SMITH ", " JOHN", "CARDIOLOGY", "RI", "A1"),
+        ("1000000002", "VAN  DYKE", "MARY", "FAMILY PRACTICE", "MA", "A2"),
+        ("1000000003", None, "ANA", "CARDIOLOGY", "RI", "A1"),
+        ("1000000004", "LÓPEZ", "JOSÉ", None, "CT", None),
+    ])
+    conn.execute("INSERT INTO locations VALUES ('A1', 41.8, -71.4), ('A2', 42.3, -71.1)")
+    conn.commit()
+    return conn
+
+def test_snapshot_names_match_the_frame_rule(tmp_path):
+    conn = provider_db(str(tmp_path / "providers.db"))
+    snap = snapshot.load_snapshot(snapshot.write_snapshot(str(tmp_path / "providers.db"), str(tmp_path / "snap")))
+    rowids = [4, 2, 1, 3]
+    built = pq.fetch_providers_by_rowid(conn, rowids)["provider_name"]
+    expected = [None if pd.isna(name) else name for name in built]
+    assert snap.provider_names(rowids) == expected
+    assert snap.provider_names([1, 99]) is None
+    # Names given for a page stay aligned with its rows when a rowid has been deleted since
+    named = pq.fetch_providers_by_rowid(conn, [1, 99, 2], ["A", "B", "C"])
+    assert named["provider_name"].tolist() == ["A", "C"]
+
+def test_republish_swaps_the_symlink(tmp_path):
+    db_path, out_dir = str(tmp_path / "providers.db"), str(tmp_path / "snap")
+    provider_db(db_path).close()
+    os.makedirs(out_dir)   # a plain directory left by an older build
+    first = snapshot.load_snapshot(snapshot.write_snapshot(db_path, out_dir))
+    assert os.path.islink(out_dir) and first.path == os.path.realpath(out_dir)
+    second = snapshot.load_snapshot(snapshot.write_snapshot(db_path, out_dir))
+    assert second.path != first.path and os.path.isdir(first.path)
+    snapshot.write_snapshot(db_path, out_dir)
+    versions = sorted(name for name in os.listdir(tmp_path) if name.startswith("snap."))
+    # The live version and the one before it
+    assert len(versions) == 2 and not os.path.exists(first.path)
+    assert first.rows == second.rows == 4